@@ -0,0 +1,91 @@
+"""
+Measures requests per second against one url with a default httpx client and
+with the bundle's tuned client (HTTP/1.1, HTTP/2 when h2 is installed, and
+with its connections opened up front), e.g.
+
+    uv run python -m benchmarks.http_client https://i.redd.it/<id>.jpg -n 500
+
+Point it at a host you're allowed to hammer; the per-host limiter is opened up
+so it doesn't cap the numbers.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from src.core import AsyncClientBundle, ClientConfig, HostLimiter, http2_available
+
+
+async def _fire(client: httpx.AsyncClient, url: str, requests: int, concurrency: int):
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            response = await client.get(url)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def _default(url: str, requests: int, concurrency: int) -> float:
+    async with httpx.AsyncClient() as client:
+        start = time.perf_counter()
+        await _fire(client, url, requests, concurrency)
+        return time.perf_counter() - start
+
+
+async def _tuned(
+    url: str, requests: int, concurrency: int, *, http2: bool, warm: bool
+) -> float:
+    config = ClientConfig(
+        http2=http2,
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+    )
+    limiter = HostLimiter(connections=concurrency, rate=1e9, burst=concurrency)
+    async with AsyncClientBundle(limiter=limiter, config=config) as clients:
+        assert clients.http is not None
+        if warm:
+            # what preconnect does, untimed -- in a real run it overlaps listing
+            await asyncio.gather(*(clients.http.head(url) for _ in range(concurrency)))
+        start = time.perf_counter()
+        await _fire(clients.http, url, requests, concurrency)
+        return time.perf_counter() - start
+
+
+async def run(url: str, requests: int, concurrency: int) -> None:
+    cases = {
+        "default client": _default(url, requests, concurrency),
+        "tuned, HTTP/1.1": _tuned(url, requests, concurrency, http2=False, warm=False),
+        "tuned, HTTP/1.1, preconnected": _tuned(
+            url, requests, concurrency, http2=False, warm=True
+        ),
+    }
+    if http2_available():
+        cases["tuned, HTTP/2"] = _tuned(
+            url, requests, concurrency, http2=True, warm=False
+        )
+        cases["tuned, HTTP/2, preconnected"] = _tuned(
+            url, requests, concurrency, http2=True, warm=True
+        )
+    else:
+        print("(h2 isn't installed; skipping HTTP/2 -- uv add 'httpx[http2]')")
+
+    for name, case in cases.items():
+        elapsed = await case
+        print(f"{name:32} {requests / elapsed:8.1f} req/s  ({elapsed:.2f}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("url")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
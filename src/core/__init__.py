@@ -1,8 +1,33 @@
 import httpx
 
-from .client_bundle import AsyncClientBundle
+from .catalog import Catalog
+from .checkpoint import Checkpoint
+from .client_bundle import (
+    AsyncClientBundle,
+    ClientConfig,
+    Prefetched,
+    RateLimitedTransport,
+    http2_available,
+)
 from .file_manager import DownloadsExtensions, UniqueDirectoryFileManager
 from .functional import Predicate, afilter, amap, merge
+from .health import CircuitBreaker, CircuitOpenError, HostHealth
+from .hedging import Hedger
+from .limits import (
+    CDN_LIMITS,
+    AdaptiveLimit,
+    ByteBudget,
+    HostLimiter,
+    HostLimits,
+    RetryBudget,
+    TokenBucket,
+)
+from .log_writer import JsonLogWriter
+from .pipeline import Retry, Stage, run_stages
+from .seen import SeenSet
+from .singleflight import SingleFlight
+from .sniff import media_extension, sniff_extension
+from .throughput import StallError, watch_throughput
 
 
 def get_response_file_extension(response: httpx.Response) -> str:
@@ -15,12 +40,39 @@ def get_response_file_extension(response: httpx.Response) -> str:
 
 
 __all__ = [
+    "CDN_LIMITS",
+    "AdaptiveLimit",
     "AsyncClientBundle",
+    "ByteBudget",
+    "Catalog",
+    "Checkpoint",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "ClientConfig",
     "DownloadsExtensions",
+    "Hedger",
+    "HostHealth",
+    "HostLimiter",
+    "HostLimits",
+    "JsonLogWriter",
     "Predicate",
+    "Prefetched",
+    "RateLimitedTransport",
+    "Retry",
+    "RetryBudget",
+    "SeenSet",
+    "SingleFlight",
+    "Stage",
+    "StallError",
+    "TokenBucket",
     "UniqueDirectoryFileManager",
     "afilter",
     "amap",
     "get_response_file_extension",
+    "http2_available",
+    "media_extension",
     "merge",
+    "run_stages",
+    "sniff_extension",
+    "watch_throughput",
 ]
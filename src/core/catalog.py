@@ -0,0 +1,236 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections.abc import Callable, Iterable, Mapping
+from typing import Self
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id TEXT PRIMARY KEY,
+    outcome TEXT NOT NULL,
+    paths TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    url TEXT PRIMARY KEY,
+    submission_id TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dead (
+    url TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resolved (
+    url TEXT PRIMARY KEY,
+    urls TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    source TEXT PRIMARY KEY,
+    fullname TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+class Catalog:
+    """
+    An on-disk record (SQLite) of every submission processed and every media
+    url saved, kept across runs so a re-run can skip work that's already done.
+    It also keeps urls found dead (see ``HostHealth``), and what submission urls
+    resolved to (see ``ResolutionCache``), until they expire, and how far each
+    listing got (see ``StreamBuilder``).
+    Queries run in a worker thread, so the event loop never waits on the disk.
+
+    Use as an async context manager:
+        async with Catalog(path) as catalog:
+            ...
+    """
+
+    # what became of a submission the last time it was processed
+    SAVED = "saved"  # at least one file was saved
+    EMPTY = "empty"  # nothing downloadable was found
+    FAILED = "failed"  # an error stopped it; retried on the next run
+    # some files were saved but some urls kept failing; the next run retries
+    #  the submission, and fetches just those (the rest are known urls)
+    PARTIAL = "partial"
+    # outcomes that mean there's nothing left to do for a submission
+    DONE = (SAVED, EMPTY)
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        # one connection, so calls from different worker threads take turns
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> Self:
+        self._db = await asyncio.to_thread(self._connect)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._db is not None:
+            await self._call(self._db.close)
+            self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        # a crash loses at most the last few records, never corrupts the file
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(_SCHEMA)
+        with db:
+            # expired resolutions are never read again
+            db.execute("DELETE FROM resolved WHERE expires < ?", (time.time(),))
+        return db
+
+    async def _call[T](self, func: Callable[..., T], *args) -> T:
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        assert self._db is not None, "catalog must be entered (async with) first"
+        return self._db
+
+    async def is_done(self, submission_id: str) -> bool:
+        """
+        True if the submission was already processed with nothing left to do
+        (a past failure doesn't count, so it's retried)
+        """
+        row = await self._call(
+            lambda: self._connection()
+            .execute("SELECT outcome FROM submissions WHERE id = ?", (submission_id,))
+            .fetchone()
+        )
+        return row is not None and row[0] in self.DONE
+
+    async def known_urls(self, urls: Iterable[str]) -> set[str]:
+        """The subset of ``urls`` that some past submission already saved"""
+        urls = list(urls)
+        if not urls:
+            return set()
+        query = f"SELECT url FROM media WHERE url IN ({','.join('?' * len(urls))})"
+        rows = await self._call(
+            lambda: self._connection().execute(query, urls).fetchall()
+        )
+        return {url for (url,) in rows}
+
+    async def paths(self, submission_id: str) -> list[str]:
+        """The files a submission was saved to, if it was"""
+        row = await self._call(
+            lambda: self._connection()
+            .execute("SELECT paths FROM submissions WHERE id = ?", (submission_id,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row is not None else []
+
+    async def record(
+        self,
+        submission_id: str,
+        outcome: str,
+        urls: Iterable[str] = (),
+        paths: Iterable[str] = (),
+    ) -> None:
+        """
+        Records what became of a submission, replacing any earlier record
+        :param submission_id: the reddit id of the submission
+        :param outcome: one of SAVED, EMPTY, FAILED or PARTIAL
+        :param urls: media urls that were saved (only kept if outcome is SAVED
+        or PARTIAL)
+        :param paths: the files they were saved to
+        """
+        now = time.time()
+        media = (
+            [(url, submission_id, now) for url in urls]
+            if outcome in (self.SAVED, self.PARTIAL)
+            else []
+        )
+
+        def write() -> None:
+            with self._connection() as db:  # one transaction
+                db.execute(
+                    "INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?)",
+                    (submission_id, outcome, json.dumps(list(paths)), now),
+                )
+                db.executemany("INSERT OR REPLACE INTO media VALUES (?, ?, ?)", media)
+
+        await self._call(write)
+
+    async def dead_urls(self) -> dict[str, tuple[int, float]]:
+        """
+        Urls found dead that haven't expired yet, as url -> (status, expiry);
+        expired ones are dropped
+        """
+
+        def read() -> list[tuple[str, int, float]]:
+            with self._connection() as db:
+                db.execute("DELETE FROM dead WHERE expires < ?", (time.time(),))
+                return db.execute("SELECT url, status, expires FROM dead").fetchall()
+
+        rows = await self._call(read)
+        return {url: (status, expires) for url, status, expires in rows}
+
+    async def record_dead(self, entries: Iterable[tuple[str, int, float]]) -> None:
+        """Saves (url, status, expiry) entries, e.g. ``HostHealth.new_dead()``"""
+        entries = list(entries)
+        if not entries:
+            return
+
+        def write() -> None:
+            with self._connection() as db:
+                db.executemany("INSERT OR REPLACE INTO dead VALUES (?, ?, ?)", entries)
+
+        await self._call(write)
+
+    async def resolution(self, url: str) -> tuple[set[str], float] | None:
+        """What ``url`` resolved to and when that expires, unless it has"""
+        row = await self._call(
+            lambda: self._connection()
+            .execute(
+                "SELECT urls, expires FROM resolved WHERE url = ? AND expires >= ?",
+                (url, time.time()),
+            )
+            .fetchone()
+        )
+        return (set(json.loads(row[0])), row[1]) if row is not None else None
+
+    async def record_resolution(
+        self, url: str, urls: Iterable[str], expires: float
+    ) -> None:
+        """Saves what ``url`` resolved to, until ``expires`` (a unix time)"""
+
+        def write() -> None:
+            with self._connection() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO resolved VALUES (?, ?, ?)",
+                    (url, json.dumps(sorted(urls)), expires),
+                )
+
+        await self._call(write)
+
+    async def watermarks(self) -> dict[str, tuple[str, float]]:
+        """
+        The newest item each listing had when it was last recorded, as
+        source -> (fullname, created_utc)
+        """
+        rows = await self._call(
+            lambda: self._connection()
+            .execute("SELECT source, fullname, created FROM watermarks")
+            .fetchall()
+        )
+        return {source: (fullname, created) for source, fullname, created in rows}
+
+    async def record_watermarks(self, marks: Mapping[str, tuple[str, float]]) -> None:
+        """Saves source -> (fullname, created_utc) entries, replacing earlier ones"""
+        entries = [(source, *mark) for source, mark in marks.items()]
+        if not entries:
+            return
+
+        def write() -> None:
+            with self._connection() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)", entries
+                )
+
+        await self._call(write)
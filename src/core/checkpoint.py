@@ -0,0 +1,108 @@
+import asyncio
+import contextlib
+import json
+import os
+from collections.abc import Iterable
+from typing import Self
+
+
+class Checkpoint:
+    """
+    A run's unfinished business, kept in a JSON file so an interrupted run can
+    be finished later: the options it was started with, and every submission
+    that entered the pipeline but hasn't left it, with its resolved urls once
+    it has them. Changes are written (atomically) at most every ``interval``
+    seconds by a background task, and once more on exit -- when the file is
+    removed instead if the run completed with nothing left pending.
+
+    Use as an async context manager:
+        async with Checkpoint(path, options) as checkpoint:
+            ...
+    """
+
+    def __init__(
+        self,
+        path: str,
+        options: dict | None = None,
+        pending: dict[str, list[str] | None] | None = None,
+        interval: float = 5.0,
+    ):
+        self.path = path
+        self.options = options or {}
+        # submission id -> its resolved urls (None until it's been resolved)
+        self.pending: dict[str, list[str] | None] = dict(pending or {})
+        self.interval = interval
+        self._changed = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        # the write in progress, if any (a thread can't be cancelled midway)
+        self._writing: asyncio.Future | None = None
+
+    @classmethod
+    def load(cls, path: str, interval: float = 5.0) -> Self:
+        """
+        Reads the checkpoint an earlier run left behind
+        :raises FileNotFoundError: if it finished (or never got going)
+        """
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        return cls(path, state["options"], state["pending"], interval)
+
+    async def __aenter__(self) -> Self:
+        self._writer = asyncio.create_task(self._run())
+        # written right away, so even an early interruption leaves one behind
+        self._changed.set()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._writer is not None:
+            self._writer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._writer
+            self._writer = None
+        if self._writing is not None:
+            # so it can't land after (and over) the last one
+            with contextlib.suppress(OSError):
+                await self._writing
+        if exc_type is None and not self.pending:
+            with contextlib.suppress(FileNotFoundError):
+                await asyncio.to_thread(os.remove, self.path)
+        else:
+            await asyncio.to_thread(self._write, self._state())
+
+    def start(self, submission_id: str) -> None:
+        """A submission entered the pipeline"""
+        self.pending.setdefault(submission_id, None)
+        self._changed.set()
+
+    def resolved(self, submission_id: str, urls: Iterable[str]) -> None:
+        """A submission's urls were found; they won't need resolving again"""
+        if submission_id in self.pending:
+            self.pending[submission_id] = sorted(urls)
+            self._changed.set()
+
+    def finish(self, submission_id: str) -> None:
+        """A submission left the pipeline, one way or another"""
+        if submission_id in self.pending:
+            del self.pending[submission_id]
+            self._changed.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            self._writing = asyncio.ensure_future(
+                asyncio.to_thread(self._write, self._state())
+            )
+            await asyncio.shield(self._writing)
+            await asyncio.sleep(self.interval)
+
+    def _state(self) -> dict:
+        # copied here, on the loop, so the write can't see it change midway
+        return {"options": self.options, "pending": dict(self.pending)}
+
+    def _write(self, state: dict) -> None:
+        # a crash mid-write leaves the previous checkpoint intact
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temporary, self.path)
@@ -1,10 +1,168 @@
+import asyncio
+import contextlib
+import importlib.util
 import os
+import time
+from collections.abc import AsyncIterator, Callable
 from dataclasses import dataclass
 
 import asyncpraw
 import httpx
 from dotenv import load_dotenv
 
+from .health import CircuitOpenError, HostHealth
+from .limits import ByteBudget, HostLimiter
+
+# responses that mean a host is overloaded, so its connection limit backs off
+OVERLOAD_STATUS = {429, 500, 502, 503, 504}
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """A response body that calls ``release`` (once) when it's closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Callable[[], None] | None = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Sends every request through a ``HostLimiter``: a request waits for a slot
+    for its host, which it holds until its body is closed (so streamed
+    downloads count for as long as they're open), and how each went (status,
+    time to headers, rate-limit headers) is fed back into the limiter.
+
+    With a ``HostHealth``, urls known to be dead are answered from its cache
+    without touching the network, and requests to a host whose circuit is
+    open fail fast with ``CircuitOpenError``.
+    """
+
+    def __init__(
+        self,
+        limiter: HostLimiter,
+        transport: httpx.AsyncBaseTransport | None = None,
+        health: HostHealth | None = None,
+    ):
+        self.limiter = limiter
+        self.health = health
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if self.health is not None:
+            if request.method == "GET" and (
+                status := self.health.dead_status(str(request.url))
+            ):
+                return httpx.Response(status, request=request)
+            if not self.health.breaker(host).allow():
+                raise CircuitOpenError(f"{host} is failing; not trying for now")
+
+        await self.limiter.acquire(host)
+        start = time.monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            self.limiter.release(host)
+            if isinstance(e, httpx.TransportError):
+                self.limiter.record(host, ok=False)
+            if self.health is not None:
+                if isinstance(e, httpx.TransportError):
+                    self.health.observe(request, None)
+                else:
+                    self.health.breaker(host).abandon()
+            raise
+        # time to the response headers: the body's size isn't the host's fault
+        self.limiter.record(
+            host,
+            ok=response.status_code not in OVERLOAD_STATUS,
+            latency=time.monotonic() - start,
+        )
+        self.limiter.observe(host, response.headers)
+        if self.health is not None:
+            self.health.observe(request, response.status_code)
+        assert isinstance(response.stream, httpx.AsyncByteStream)
+        response.stream = _ReleasingStream(
+            response.stream, lambda: self.limiter.release(host)
+        )
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def http2_available() -> bool:
+    """True if the optional h2 package (``httpx[http2]``) is installed"""
+    return importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class ClientConfig:
+    """How the bundle's http client is set up"""
+
+    # multiplex requests to a host over one connection; opt-in, since it needs
+    #  the optional h2 package (httpx[http2]) and falls back to HTTP/1.1 without
+    http2: bool = False
+    # connection pool size; match it to how many requests can be in flight
+    max_connections: int = 100
+    # idle connections kept open for reuse, and for how long (seconds)
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    timeout: float = 10.0
+    # hosts to connect to up front, so the first real requests to them don't
+    #  pay for the TCP/TLS handshake
+    preconnect: tuple[str, ...] = ()
+
+    def transport(self) -> httpx.AsyncHTTPTransport:
+        return httpx.AsyncHTTPTransport(
+            http2=self.http2 and http2_available(),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+
+
+@dataclass
+class Prefetched:
+    """
+    A response body received while resolving urls, waiting for its download,
+    and the bytes of ``budget`` held for it (parked, see ``ByteBudget``)
+    """
+
+    response: httpx.Response
+    budget: ByteBudget | None = None
+    reserved: int = 0
+
+    def take(self) -> int:
+        """
+        Hands the bytes held for the body over to whoever stages it, who then
+        releases them
+        :return: the bytes handed over
+        """
+        reserved, self.reserved = self.reserved, 0
+        if self.budget is not None:
+            self.budget.claim(reserved)
+        return reserved
+
+    def release(self) -> None:
+        """Lets go of the body without staging it, freeing its bytes"""
+        reserved = self.take()
+        if self.budget is not None:
+            self.budget.release(reserved)
+
 
 @dataclass
 class AsyncClientBundle:
@@ -13,6 +171,16 @@ class AsyncClientBundle:
     - http client (httpx.AsyncClient)
     - reddit client (praw)
     - imgur client (client id and secret)
+
+    Every request on ``http`` goes through ``limiter``, which caps connections
+    and request rate per host (see ``HostLimiter``), and ``health``, which
+    fails fast for failing hosts and dead urls (see ``HostHealth``). The client
+    itself is set up from ``config`` (see ``ClientConfig``).
+
+    It also carries ``prefetched``: response bodies that were already received
+    while resolving urls (keyed by final url), so the download stage can use
+    them instead of fetching the same url again. With a ``budget``, those bodies
+    count against it (see ``Prefetched``) until they're staged or let go of.
     """
 
     reddit: asyncpraw.Reddit | None = None
@@ -25,27 +193,69 @@ class AsyncClientBundle:
             self.client_id = os.environ.get(f"{client_name}_CLIENT_ID")
             self.client_secret = os.environ.get(f"{client_name}_CLIENT_SECRET")
 
-    def __init__(self):
+    def __init__(
+        self,
+        limiter: HostLimiter | None = None,
+        health: HostHealth | None = None,
+        config: ClientConfig | None = None,
+        budget: ByteBudget | None = None,
+    ):
 
         load_dotenv()
 
+        self.config = config if config is not None else ClientConfig()
+        self.limiter = limiter if limiter is not None else HostLimiter()
+        self.health = health if health is not None else HostHealth()
+        self.budget = budget
         self.imgur = self.APIClient("IMGUR")
+        self.prefetched: dict[str, Prefetched] = {}
+        self._preconnecting: asyncio.Task | None = None
 
     async def __aenter__(self):
 
-        self.http = httpx.AsyncClient()
+        self.http = httpx.AsyncClient(
+            transport=RateLimitedTransport(
+                self.limiter, self.config.transport(), health=self.health
+            ),
+            timeout=self.config.timeout,
+        )
+        if self.config.preconnect:
+            # in the background: listing submissions takes a while anyway
+            self._preconnecting = asyncio.create_task(self.preconnect())
 
         return self
 
+    async def preconnect(self) -> None:
+        """
+        Opens a pooled connection to each of ``config.preconnect`` with a HEAD
+        request, so later requests can reuse it. Failures are ignored -- this is
+        only a head start.
+        """
+        assert self.http is not None, "bundle must be entered (async with) first"
+        await asyncio.gather(
+            *(self.http.head(f"https://{host}/") for host in self.config.preconnect),
+            return_exceptions=True,
+        )
+
     async def __aexit__(self, exc_type, exc, tb):
         # consider contextlib.AsyncExitStack
 
+        if self._preconnecting is not None:
+            self._preconnecting.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._preconnecting
+
         if self.reddit is not None:
             await self.reddit.close()
 
         if self.http is not None:
             await self.http.aclose()
 
+    def drop_prefetched(self, url: str) -> None:
+        """Lets go of the body prefetched from ``url``, if there is one"""
+        if (prefetched := self.prefetched.pop(url, None)) is not None:
+            prefetched.release()
+
     def set_reddit(
         self, username: str | None = None, password: str | None = None
     ) -> asyncpraw.Reddit:
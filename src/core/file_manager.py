@@ -1,51 +1,393 @@
 import asyncio
+import contextlib
+import hashlib
 import json
 import os
+import shutil
+import uuid
+from collections.abc import AsyncIterable, Callable
+from dataclasses import dataclass
 from datetime import datetime
 
 import aiofiles
 import aiofiles.os
 
-type DownloadsExtensions = list[tuple[bytes, str]]
+from .limits import ByteBudget
+from .log_writer import JsonLogWriter
+
+# each download is a file already streamed into the staging directory, paired
+#  with its extension; save_files() moves it into place
+type DownloadsExtensions = list[tuple[str, str]]
+
+# downloads are written here first, then renamed into place (same filesystem,
+#  so the rename is atomic and a half-written file never has a real name)
+STAGING_DIRNAME = ".staging"
+
+# a download that may be resumed is staged under a name derived from its url,
+#  with a sidecar holding the validator (ETag/Last-Modified) it was sent with
+RESUME_SUFFIX = ".json"
+
+# with dedupe, every distinct file is stored once under here (in the top-level
+#  output directory, so it's shared by every run), sharded by content hash
+OBJECTS_DIRNAME = "objects"
 
 # leave headroom under the typical 255-char filename limit for the extension
 MAX_FILENAME_LENGTH = 250
 
 
+@dataclass(frozen=True)
+class Preallocated:
+    """What an interrupted ``preallocate``d body has staged (see ``preallocated``)"""
+
+    path: str
+    length: int
+    validator: str
+    extension: str
+    # (start, end) of each piece written in full so far
+    written: frozenset[tuple[int, int]]
+
+
 class UniqueDirectoryFileManager:
-    def __init__(self, directory, organize=False):
-        # this will essentially be the woking directory,
-        #  all files will be downloaded to this directory or its subdirectories
-        # local (naive) time is intentional: the folder name should match the
-        # user's clock
-        self.directory = os.path.join(
-            directory,
-            datetime.today().strftime("PaperScraper %Y-%m-%d %H:%M"),  # noqa: DTZ002
-        )
-        # we can assume that this directory does not already exist
-        #  if it does, that's basically intentional from the user
-        os.makedirs(self.directory, exist_ok=False)
+    def __init__(
+        self,
+        directory,
+        organize=False,
+        budget: ByteBudget | None = None,
+        dedupe: bool = False,
+        run_directory: str | None = None,
+    ):
+        if run_directory is not None:
+            # carrying on in an earlier run's folder (see --resume)
+            if not os.path.isdir(run_directory):
+                raise FileNotFoundError(f"no run directory at {run_directory}")
+            self.directory = run_directory
+        else:
+            # this will essentially be the woking directory,
+            #  all files will be downloaded to this directory or its subdirectories
+            # local (naive) time is intentional: the folder name should match the
+            # user's clock
+            self.directory = os.path.join(
+                directory,
+                datetime.today().strftime(  # noqa: DTZ002
+                    "PaperScraper %Y-%m-%d %H:%M"
+                ),
+            )
+            # we can assume that this directory does not already exist
+            #  if it does, that's basically intentional from the user
+            os.makedirs(self.directory, exist_ok=False)
         self.organize = organize
-        # serializes concurrent appends so log lines don't interleave
-        self._log_lock = asyncio.Lock()
+        self.staging = os.path.join(self.directory, STAGING_DIRNAME)
+        # bytes downloads may have in flight; each is freed once it's on disk
+        self.budget = budget
+        # content-addressed store that saved files are hardlinked from, if any
+        self.objects = os.path.join(directory, OBJECTS_DIRNAME) if dedupe else None
+        # staged path -> sha256 of its content, hashed while it was written
+        self._digests: dict[str, str] = {}
+        # names already taken in each directory we've saved into: seeded by one
+        #  listdir the first time a directory is used, then kept up to date here,
+        #  so allocating a unique name costs no syscalls after that
+        self._taken: dict[str, set[str]] = {}
+        # per (directory, name): the next "(n)" suffix to try, so a repeated
+        #  title resumes where it left off instead of rescanning from the start
+        self._offsets: dict[tuple[str, str], int] = {}
+        # makes each check-then-claim of a name atomic across concurrent saves
+        self._names_lock = asyncio.Lock()
+        # makes each update of a preallocated body's sidecar atomic
+        self._pieces_lock = asyncio.Lock()
+        # directories known to exist, so makedirs is called once per directory
+        self._made_dirs = {self.directory}
+        # one buffered writer per log file, started on first use
+        self._logs: dict[str, JsonLogWriter] = {}
 
     async def log(self, record: dict, filename: str = "log.txt") -> str:
         """
         Appends a JSON record (one object per line) to a log file in this
-        manager's directory.
+        manager's directory. Records are buffered and written in batches by a
+        background writer; ``flush()`` or ``aclose()`` makes sure they're on disk.
         :param record: a JSON-serializable mapping describing the event
         :param filename: name of the log file within the managed directory
-        :return: the path that was written to
+        :return: the path that will be written to
         """
         path = os.path.join(self.directory, filename)
-        line = json.dumps(record) + "\n"
-        async with (
-            self._log_lock,
-            aiofiles.open(path, "a", encoding="utf-8") as logfile,
-        ):
-            await logfile.write(line)
+        if (writer := self._logs.get(filename)) is None:
+            writer = self._logs[filename] = JsonLogWriter(path)
+        await writer.write(record)
+        return path
+
+    async def flush(self) -> None:
+        """Writes out every log record buffered so far"""
+        for writer in self._logs.values():
+            await writer.flush()
+
+    async def reserve(self, nbytes: int) -> int:
+        """
+        Reserves room in the in-flight budget for a body of known size (e.g.
+        from Content-Length) before it's read; hand the result to ``stage``
+        :return: the bytes reserved (0 if there's no budget)
+        """
+        return 0 if self.budget is None else await self.budget.acquire(nbytes)
+
+    def release(self, nbytes: int) -> None:
+        """Hands back bytes ``reserve`` took, for a body that won't be staged"""
+        if self.budget is not None:
+            self.budget.release(nbytes)
+
+    async def stage(
+        self,
+        chunks: AsyncIterable[bytes],
+        reserved: int = 0,
+        *,
+        url: str | None = None,
+        validator: str | None = None,
+        offset: int = 0,
+    ) -> str:
+        """
+        Streams chunks into a new file in the staging directory as they arrive,
+        so a download never has to be held in memory. If the stream fails the
+        partial file is removed -- unless it's resumable: given the ``url`` it
+        came from and a ``validator`` for it, it's kept (see ``partial``), and
+        the body can be continued later from ``offset`` bytes in.
+
+        With a budget, each chunk counts against it from when it arrives until
+        it's written: ``reserved`` bytes (see ``reserve``) are used first, and
+        anything beyond them is reserved chunk by chunk, which throttles the
+        read when too much is in flight. With dedupe, the content is hashed in
+        the same pass.
+        :param chunks: the body to write, e.g. ``response.aiter_bytes()``
+        :param reserved: bytes already reserved for this body
+        :param url: where the body comes from, to keep it resumable
+        :param validator: the ETag or Last-Modified it was sent with
+        :param offset: bytes of it already staged, that ``chunks`` continue
+        :return: the staged file's path, to be handed to ``save_files``
+        """
+        await self._makedirs(self.staging)
+        resumable = url is not None and validator is not None
+        if resumable:
+            path = self._resumable_path(url)
+            await asyncio.to_thread(self._start_resumable, path, url, validator, offset)
+        else:
+            path = os.path.join(self.staging, f"{uuid.uuid4().hex}.part")
+            offset = 0
+        digest = hashlib.sha256() if self.objects is not None else None
+        if digest is not None and offset:
+            await asyncio.to_thread(_hash_file, digest, path)
+        try:
+            async with aiofiles.open(path, "ab" if offset else "wb") as f:
+                await self._write(f, chunks, reserved, digest)
+        except BaseException:
+            if not resumable:
+                await self.discard([(path, "")])
+            raise
+        if resumable:
+            path = await self._finish_resumable(path)
+        if digest is not None:
+            self._digests[path] = digest.hexdigest()
         return path
 
+    async def preallocate(
+        self,
+        nbytes: int,
+        *,
+        url: str | None = None,
+        validator: str | None = None,
+        extension: str = "",
+    ) -> str:
+        """
+        Creates a staging file of ``nbytes``, for a body that arrives in pieces
+        (see ``write_at``); ``seal`` it once they're all in. Given the ``url``
+        it comes from and a ``validator`` for it, it's resumable: kept if the
+        body fails midway, with the pieces that are in (see ``written``), to be
+        found by ``preallocated``.
+        :param extension: the body's extension, kept for resuming it
+        :return: the staged file's path
+        """
+        await self._makedirs(self.staging)
+        if url is not None and validator is not None:
+            path = self._resumable_path(url)
+            meta = {
+                "url": url,
+                "validator": validator,
+                "length": nbytes,
+                "extension": extension,
+                "written": [],
+            }
+            await asyncio.to_thread(_allocate, path, nbytes)
+            await asyncio.to_thread(_write_meta, path, meta)
+        else:
+            path = os.path.join(self.staging, f"{uuid.uuid4().hex}.part")
+            await asyncio.to_thread(_allocate, path, nbytes)
+        return path
+
+    async def written(self, path: str, start: int, end: int) -> None:
+        """
+        Records that bytes ``start`` to ``end`` of a ``preallocate``d file are
+        in, if it's resumable
+        """
+        async with self._pieces_lock:
+            await asyncio.to_thread(_add_piece, path, start, end)
+
+    async def preallocated(self, url: str) -> Preallocated | None:
+        """
+        Finds a resumable ``preallocate``d body of ``url`` that an earlier
+        attempt (or run) didn't finish; None if there's none
+        """
+        path = self._resumable_path(url)
+        meta = await self._meta(path)
+        if meta is None or meta.get("url") != url or "length" not in meta:
+            return None
+        try:
+            if await aiofiles.os.path.getsize(path) != meta["length"]:
+                return None
+        except OSError:
+            return None
+        return Preallocated(
+            path,
+            meta["length"],
+            meta["validator"],
+            meta["extension"],
+            frozenset((start, end) for start, end in meta["written"]),
+        )
+
+    async def write_at(
+        self, path: str, offset: int, chunks: AsyncIterable[bytes]
+    ) -> None:
+        """
+        Streams chunks into a ``preallocate``d file from ``offset`` on, counting
+        them against the in-flight budget like ``stage`` does
+        """
+        async with aiofiles.open(path, "r+b") as f:
+            await f.seek(offset)
+            await self._write(f, chunks, 0, None)
+
+    async def seal(self, path: str) -> str:
+        """Marks a file assembled with ``write_at`` as a finished download"""
+        if await aiofiles.os.path.exists(path + RESUME_SUFFIX):
+            path = await self._finish_resumable(path)
+        if self.objects is not None:
+            digest = hashlib.sha256()
+            await asyncio.to_thread(_hash_file, digest, path)
+            self._digests[path] = digest.hexdigest()
+        return path
+
+    async def clone(self, path: str) -> str:
+        """
+        Stages a second copy of a staged file (a hardlink, where the filesystem
+        allows), for a download shared by several posts: each one moves its own
+        copy into place
+        :return: the copy's path
+        """
+        clone = os.path.join(self.staging, f"{uuid.uuid4().hex}.part")
+        await asyncio.to_thread(_link_or_copy, path, clone)
+        if (digest := self._digests.get(path)) is not None:
+            self._digests[clone] = digest
+        return clone
+
+    async def _write(self, f, chunks: AsyncIterable[bytes], reserved: int, digest):
+        """
+        Writes chunks to an open file, holding each against the budget until
+        it's written (``reserved`` bytes of them are already held)
+        """
+        try:
+            async for chunk in chunks:
+                if self.budget is not None and len(chunk) > reserved:
+                    reserved += await self.budget.acquire(len(chunk) - reserved)
+                await f.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                if self.budget is not None:
+                    # on disk now, so no longer in flight
+                    written = min(len(chunk), reserved)
+                    self.budget.release(written)
+                    reserved -= written
+        finally:
+            if self.budget is not None:
+                self.budget.release(reserved)
+
+    async def partial(self, url: str) -> tuple[int, str] | None:
+        """
+        Finds what an interrupted ``stage`` kept of ``url``'s body
+        :return: how many bytes of it are staged, and the validator it was sent
+        with (for ``If-Range``); None if there's nothing to resume
+        """
+        path = self._resumable_path(url)
+        meta = await self._meta(path)
+        # a preallocated body is staged in pieces, not from the start
+        if meta is None or meta.get("url") != url or "length" in meta:
+            return None
+        try:
+            size = await aiofiles.os.path.getsize(path)
+        except OSError:
+            return None
+        if not size:
+            return None
+        return size, meta["validator"]
+
+    async def partial_head(self, url: str, nbytes: int) -> bytes:
+        """The first ``nbytes`` of what's staged of ``url`` (see ``partial``)"""
+        try:
+            async with aiofiles.open(self._resumable_path(url), "rb") as f:
+                return await f.read(nbytes)
+        except OSError:
+            return b""
+
+    async def drop_partial(self, url: str) -> None:
+        """Removes whatever is staged of ``url``, e.g. once it can't be resumed"""
+        path = self._resumable_path(url)
+        for leftover in (path, path + RESUME_SUFFIX):
+            with contextlib.suppress(FileNotFoundError):
+                await aiofiles.os.remove(leftover)
+
+    def _resumable_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()[:32]
+        return os.path.join(self.staging, f"{key}.part")
+
+    @staticmethod
+    def _start_resumable(path: str, url: str, validator: str, offset: int) -> None:
+        """Records what a resumable body is, and cuts it back to ``offset``"""
+        _write_meta(path, {"url": url, "validator": validator})
+        if offset:
+            os.truncate(path, offset)
+
+    async def _finish_resumable(self, path: str) -> str:
+        """
+        Moves a complete resumable body to a name of its own, freeing the url's
+        for whoever fetches it next
+        :return: its new path
+        """
+        staged = os.path.join(self.staging, f"{uuid.uuid4().hex}.part")
+        await aiofiles.os.replace(path, staged)
+        with contextlib.suppress(FileNotFoundError):
+            await aiofiles.os.remove(path + RESUME_SUFFIX)
+        return staged
+
+    @staticmethod
+    async def _meta(path: str) -> dict | None:
+        """The sidecar of a resumable body, if it has a readable one"""
+        try:
+            async with aiofiles.open(path + RESUME_SUFFIX, encoding="utf-8") as f:
+                return json.loads(await f.read())
+        except (OSError, ValueError):
+            return None
+
+    async def discard(self, downloads: DownloadsExtensions) -> None:
+        """Removes staged files that won't be saved (e.g. their post failed)"""
+        for staged, _ in downloads:
+            self._digests.pop(staged, None)
+            with contextlib.suppress(FileNotFoundError):
+                await aiofiles.os.remove(staged)
+
+    async def aclose(self) -> None:
+        """
+        Tidies up at the end of a run: writes out and closes the logs, and
+        drops the staging directory if it's empty
+        """
+        for writer in self._logs.values():
+            await writer.aclose()
+        self._logs.clear()
+        # left in place if it still holds anything, so no data is lost
+        with contextlib.suppress(FileNotFoundError, OSError):
+            await aiofiles.os.rmdir(self.staging)
+
     async def save_files(
         self,
         title: str,
@@ -53,43 +395,46 @@ class UniqueDirectoryFileManager:
         subreddit: str | None = None,
     ) -> list[str]:
         """
-        Saves all files and bundles them with their results
-        :param directory: directory in which to save each file
+        Moves staged downloads into place under their final, unique names
         :param title: title that the final file should have
-        :param organize: whether or not to organize the save directory by subreddit
+        :param downloads: staged files (see ``stage``) and their extensions
+        :param subreddit: subfolder to save into when organizing by subreddit
         :return: a list of filepaths to which the files were saved
         """
 
         if not downloads:
             return []
 
-        directory = os.path.join(
-            self.directory, subreddit if self.organize and subreddit else ""
+        directory = (
+            os.path.join(self.directory, subreddit)
+            if self.organize and subreddit
+            else self.directory
         )
         # subreddit directory need not be unique
-        await aiofiles.os.makedirs(directory, exist_ok=True)
+        await self._makedirs(directory)
 
         if len(downloads) == 1:
             # just one file, no need for a directory
-            download, extension = downloads[0]
+            staged, extension = downloads[0]
             filepath = await self.get_unique_filepath(directory, title, extension)
-            await self._write(filepath, download)
+            await self._place(staged, filepath, extension)
             return [filepath]
 
         # album, need a directory to hold all the files
-        directory = os.path.join(directory, await self.get_unique_dirname(title))
+        directory = await self.get_unique_dirname(title, directory)
         # album directory should be unique
         await aiofiles.os.makedirs(directory, exist_ok=False)
+        self._made_dirs.add(directory)
 
         filepaths = [
             os.path.join(directory, f"{i}.{extension}")
             for i, (_, extension) in enumerate(downloads)
         ]
-        # write every file in the album concurrently
+        # move every file in the album into place concurrently
         await asyncio.gather(
             *(
-                self._write(destination, download)
-                for destination, (download, _) in zip(
+                self._place(staged, destination, extension)
+                for destination, (staged, extension) in zip(
                     filepaths, downloads, strict=False
                 )
             )
@@ -97,11 +442,63 @@ class UniqueDirectoryFileManager:
 
         return filepaths
 
-    @staticmethod
-    async def _write(destination: str, content: bytes) -> None:
-        """Writes bytes to a path without blocking the event loop"""
-        async with aiofiles.open(destination, "wb") as f:
-            await f.write(content)
+    async def _place(self, staged: str, destination: str, extension: str) -> None:
+        """
+        Moves a staged file to ``destination``. With dedupe, it's moved into the
+        object store instead (or dropped, if identical content is already there)
+        and ``destination`` becomes a hardlink to the stored copy.
+        """
+        if self.objects is None:
+            await aiofiles.os.replace(staged, destination)
+            return
+
+        digest = self._digests.pop(staged)
+        shard = os.path.join(self.objects, digest[:2], digest[2:4])
+        await self._makedirs(shard)
+        stored = os.path.join(shard, f"{digest}.{extension.lstrip('.')}")
+        if await aiofiles.os.path.exists(stored):
+            await aiofiles.os.remove(staged)
+        else:
+            await aiofiles.os.replace(staged, stored)
+
+        try:
+            await aiofiles.os.link(stored, destination)
+        except OSError:
+            # the filesystem doesn't do hardlinks; a copy at least keeps the name
+            await asyncio.to_thread(shutil.copyfile, stored, destination)
+
+    async def _makedirs(self, directory: str) -> None:
+        """Creates ``directory`` (and its parents) unless we already have"""
+        if directory not in self._made_dirs:
+            await aiofiles.os.makedirs(directory, exist_ok=True)
+            self._made_dirs.add(directory)
+
+    async def _claim(
+        self, parent: str, name: str, numbered: Callable[[int], str], start: int
+    ) -> str:
+        """
+        Claims the first name in ``parent`` that isn't taken, trying ``name``
+        and then ``numbered(start)``, ``numbered(start + 1)``, ...
+        :return: the claimed path
+        """
+        async with self._names_lock:
+            if (taken := self._taken.get(parent)) is None:
+                try:
+                    taken = set(await aiofiles.os.listdir(parent))
+                except FileNotFoundError:
+                    taken = set()
+                self._taken[parent] = taken
+
+            offset = self._offsets.get((parent, name))
+            while True:
+                candidate = name if offset is None else numbered(offset)
+                offset = start if offset is None else offset + 1
+                if candidate not in taken:
+                    break
+
+            taken.add(candidate)
+            self._offsets[(parent, name)] = offset
+            return os.path.join(parent, candidate)
 
     async def get_unique_filepath(
         self, directory: str, title: str, file_extension: str
@@ -113,19 +510,15 @@ class UniqueDirectoryFileManager:
         :param file_extension: the file extension for the filename
         :return: a unique filename in the specified directory with the specified title as a prefix
         """
-        # this naive implementation may have bad big O runtime if there are a lot of duplicate
-        #  filenames, and could be optimized by keeping a persistent counter for each title,
-        #  but this should almost never happen in practice so this is good enough
         # ensure validity
         title = self.ensure_valid_filename(title)
-        filename = f"{title}.{file_extension}"
         # ensure uniqueness
-        offset = 0
-        existing = await aiofiles.os.listdir(directory)
-        while filename in existing:
-            offset += 1
-            filename = f"{title} ({offset}).{file_extension}"
-        return os.path.join(directory, filename)
+        return await self._claim(
+            directory,
+            f"{title}.{file_extension}",
+            lambda offset: f"{title} ({offset}).{file_extension}",
+            start=1,
+        )
 
     def ensure_valid_filename(self, filename: str) -> str:
         """
@@ -137,21 +530,22 @@ class UniqueDirectoryFileManager:
         cleaned = "".join(c if c not in r'\/:*?"<>|' else "_" for c in filename)
         return cleaned[:MAX_FILENAME_LENGTH]
 
-    async def get_unique_dirname(self, dirname):
+    async def get_unique_dirname(self, dirname: str, parent: str | None = None) -> str:
         """
         Gets a unique directory name in the current directory with the specified name as a prefix
         :param dirname: the prefix for the directory name
+        :param parent: the directory to make it unique in (default: the current one)
         :return: a unique directory name in the current directory with the specified name as a prefix
         """
         # ensure validity
         dirname = self.ensure_valid_dirname(dirname)
         # ensure uniqueness
-        directory = os.path.join(self.directory, dirname)
-        offset = 0
-        while await aiofiles.os.path.exists(directory):
-            directory = os.path.join(self.directory, f"{dirname} ({offset})")
-            offset += 1
-        return directory
+        return await self._claim(
+            self.directory if parent is None else parent,
+            dirname,
+            lambda offset: f"{dirname} ({offset})",
+            start=0,
+        )
 
     def ensure_valid_dirname(self, dirname: str) -> str:
         """
@@ -160,3 +554,44 @@ class UniqueDirectoryFileManager:
         :return: a valid directory name with the same content as the input
         """
         return "".join(c if c not in r'\/:*?"<>|' else "_" for c in dirname)
+
+
+def _allocate(path: str, nbytes: int) -> None:
+    """Creates a file of ``nbytes``, reserving the disk space if possible"""
+    with open(path, "wb") as f:
+        try:
+            os.posix_fallocate(f.fileno(), 0, nbytes)
+        except (AttributeError, OSError):
+            # not supported here (e.g. macOS, some filesystems): a sparse file
+            f.truncate(nbytes)
+
+
+def _write_meta(path: str, meta: dict) -> None:
+    """Writes the sidecar recording what a resumable body at ``path`` is"""
+    with open(path + RESUME_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _add_piece(path: str, start: int, end: int) -> None:
+    """Adds a piece to a resumable preallocated body's sidecar, if it has one"""
+    try:
+        with open(path + RESUME_SUFFIX, encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return
+    meta["written"].append([start, end])
+    _write_meta(path, meta)
+
+
+def _link_or_copy(source: str, destination: str) -> None:
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _hash_file(digest, path: str) -> None:
+    """Feeds a file's contents into ``digest``"""
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
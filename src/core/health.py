@@ -0,0 +1,127 @@
+import time
+from collections.abc import Iterable, Mapping
+
+import httpx
+
+# statuses that mean a url is gone, not that its host is struggling
+DEAD_STATUS = {404, 410}
+# statuses that count against a host's health (429 is the rate limiter's job)
+FAILURE_STATUS = {500, 502, 503, 504}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Tracks one host's health: after ``threshold`` failures in a row the circuit
+    opens and requests fail fast for ``cooldown`` seconds. After that a single
+    probe is let through; if it succeeds the circuit closes, otherwise it opens
+    for another cooldown.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """True if a request may be sent now"""
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+            return False
+        # half-open: this request is the probe
+        self._probing = True
+        return True
+
+    def success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def abandon(self) -> None:
+        """A request ended without an answer either way (e.g. cancelled)"""
+        self._probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class HostHealth:
+    """
+    Per-host circuit breakers, plus a negative cache of urls known to be dead
+    (404/410), each remembered for ``dead_ttl`` seconds. The cache can be
+    seeded from and saved to a ``Catalog``, so it carries across runs.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        cooldown: float = 30.0,
+        dead_ttl: float = 7 * 86400,
+    ):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.dead_ttl = dead_ttl
+        self._breakers: dict[str, CircuitBreaker] = {}
+        # url -> (status, expiry as a unix timestamp)
+        self._dead: dict[str, tuple[int, float]] = {}
+        # urls found dead this run, not yet saved
+        self._new_dead: set[str] = set()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if (breaker := self._breakers.get(host)) is None:
+            breaker = self._breakers[host] = CircuitBreaker(
+                self.threshold, self.cooldown
+            )
+        return breaker
+
+    def dead_status(self, url: str) -> int | None:
+        """The status a url was found dead with, if it's in the cache"""
+        if (entry := self._dead.get(url)) is None:
+            return None
+        status, expires = entry
+        if expires < time.time():
+            del self._dead[url]
+            return None
+        return status
+
+    def mark_dead(self, url: str, status: int) -> None:
+        self._dead[url] = (status, time.time() + self.dead_ttl)
+        self._new_dead.add(url)
+
+    def load(self, dead: Mapping[str, tuple[int, float]]) -> None:
+        """Seeds the negative cache, e.g. from ``Catalog.dead_urls()``"""
+        self._dead.update(dead)
+
+    def new_dead(self) -> Iterable[tuple[str, int, float]]:
+        """Takes the (url, status, expiry) entries added since the last call"""
+        entries = [
+            (url, *self._dead[url]) for url in self._new_dead if url in self._dead
+        ]
+        self._new_dead.clear()
+        return entries
+
+    def observe(self, request: httpx.Request, status: int | None) -> None:
+        """
+        Records how a request went: ``status`` is the response's, or ``None``
+        if it failed at the transport level
+        """
+        breaker = self.breaker(request.url.host)
+        if status is None or status in FAILURE_STATUS:
+            breaker.failure()
+            return
+        breaker.success()
+        if status in DEAD_STATUS and request.method == "GET":
+            self.mark_dead(str(request.url), status)
@@ -0,0 +1,122 @@
+import asyncio
+import contextlib
+import math
+import time
+from collections import deque
+from collections.abc import AsyncGenerator
+
+import httpx
+
+from .limits import RetryBudget
+
+
+class Hedger:
+    """
+    Sends GETs as hedged requests: if a response hasn't started (its headers
+    haven't arrived) by the time most of that host's responses have --
+    its ``percentile`` time to headers, over the last ``window`` responses --
+    a second, identical request is sent, and whichever answers first is used.
+    The other is cancelled (or closed, if it answered too).
+
+    Hedges are capped at ``ratio`` of the requests made (see ``RetryBudget``),
+    so a host that's slow across the board gets at most that much extra load.
+    A host isn't hedged until ``min_samples`` of its responses have been seen,
+    nor sooner than ``min_delay`` seconds into a request.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        ratio: float = 0.05,
+        window: int = 100,
+        min_samples: int = 20,
+        min_delay: float = 0.05,
+    ):
+        if not 0 < percentile < 1:
+            raise ValueError("percentile must be between 0 and 1")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = RetryBudget(ratio=ratio, initial=1, cap=max(1, ratio * window))
+        self.hedged = 0
+        self._window = window
+        # recent times to headers (seconds), per host
+        self._latencies: dict[str, deque[float]] = {}
+
+    def delay(self, host: str) -> float | None:
+        """How long to wait for ``host`` before hedging (None: don't hedge)"""
+        latencies = self._latencies.get(host)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def record(self, host: str, latency: float) -> None:
+        if (latencies := self._latencies.get(host)) is None:
+            latencies = self._latencies[host] = deque(maxlen=self._window)
+        latencies.append(latency)
+
+    @contextlib.asynccontextmanager
+    async def stream(
+        self, client: httpx.AsyncClient, url: str, **kwargs
+    ) -> AsyncGenerator[httpx.Response]:
+        """
+        Like ``client.stream("GET", url, **kwargs)``, but hedged: the response
+        yielded is the first to arrive, with its body still unread
+        """
+        response = await self.send(client, url, **kwargs)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def send(
+        self, client: httpx.AsyncClient, url: str, **kwargs
+    ) -> httpx.Response:
+        """
+        GETs ``url`` (hedged), returning the first response to arrive as a
+        stream; the caller must ``aclose()`` it. Raises if every request failed.
+        """
+        host = httpx.URL(url).host
+        delay = self.delay(host)
+        self.budget.record()
+
+        async def attempt() -> tuple[httpx.Response, float]:
+            start = time.monotonic()
+            request = client.build_request("GET", url, **kwargs)
+            response = await client.send(request, stream=True)
+            return response, time.monotonic() - start
+
+        tasks = [asyncio.create_task(attempt())]
+        winner: asyncio.Task | None = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.budget.spend():
+                    self.hedged += 1
+                    tasks.append(asyncio.create_task(attempt()))
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # a failed request doesn't decide anything while another is out
+                winner = next((t for t in done if t.exception() is None), None)
+        finally:
+            losers = [task for task in tasks if task is not winner]
+            for task in losers:
+                task.cancel()
+            # close any loser that answered anyway, so its connection is freed
+            for result in await asyncio.gather(*losers, return_exceptions=True):
+                if isinstance(result, tuple):
+                    await result[0].aclose()
+
+        if winner is None:
+            # every request failed: report the first one's error
+            error = next(t.exception() for t in tasks if t.exception() is not None)
+            assert error is not None
+            raise error
+        response, latency = winner.result()
+        self.record(host, latency)
+        return response
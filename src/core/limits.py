@@ -0,0 +1,365 @@
+import asyncio
+import contextlib
+import math
+import time
+from collections import deque
+from collections.abc import Mapping
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+
+class ByteBudget:
+    """
+    A byte-weighted semaphore: bounds how many bytes may be in flight (received,
+    or promised by a Content-Length, but not yet on disk) across every download.
+
+    Waiters are served first come, first served, so a big reservation can't be
+    starved by a stream of small ones. A request bigger than the whole budget
+    is clamped to it, so an oversized file still goes through -- alone.
+
+    Bytes taken without waiting (see ``try_acquire``) are parked: held for a
+    body that waits in a queue, possibly behind whoever is waiting here. So
+    nobody waits on them -- requests are clamped to what isn't parked -- until
+    they're claimed by the download that gets to the body (see ``claim``).
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.available = capacity
+        self.parked = 0
+        self._waiters: deque[tuple[int, asyncio.Future[None]]] = deque()
+
+    async def acquire(self, nbytes: int) -> int:
+        """
+        Waits until ``nbytes`` are free and takes them
+        :return: the number of bytes actually reserved (after clamping), which
+            is what must eventually be released
+        """
+        nbytes = min(max(nbytes, 0), self.capacity - self.parked)
+        if not self._waiters and self.available >= nbytes:
+            self.available -= nbytes
+            return nbytes
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just as we were cancelled: hand the bytes back
+                self.release(nbytes)
+            else:
+                self._waiters.remove((nbytes, future))
+                self._wake()
+            raise
+        return nbytes
+
+    def try_acquire(self, nbytes: int) -> bool:
+        """
+        Takes ``nbytes`` if they're free right now (and nobody is waiting for
+        bytes), without waiting, and parks them; False if they aren't
+        """
+        nbytes = max(nbytes, 0)
+        if self._waiters or self.available < nbytes:
+            return False
+        self.available -= nbytes
+        self.parked += nbytes
+        return True
+
+    def claim(self, nbytes: int) -> None:
+        """
+        Takes over ``nbytes`` parked by ``try_acquire``: they're held like any
+        others from then on, until released
+        """
+        self.parked = max(self.parked - nbytes, 0)
+
+    def release(self, nbytes: int) -> None:
+        """Returns bytes taken by ``acquire`` or ``try_acquire``"""
+        self.available = min(self.available + nbytes, self.capacity)
+        self._wake()
+
+    def _wake(self) -> None:
+        # grant waiters strictly in order, stopping at the first that won't fit
+        while self._waiters and self._waiters[0][0] <= self.available:
+            nbytes, future = self._waiters.popleft()
+            self.available -= nbytes
+            future.set_result(None)
+
+
+class TokenBucket:
+    """
+    Paces events to ``rate`` per second on average, allowing bursts of up to
+    ``burst`` at once. It can also be paused outright, e.g. when a server says
+    to back off.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # waiters take turns (asyncio.Lock is fair), so none is starved
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits for a token (and for any pause to end) and takes it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0 and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(max(wait, (1 - self._tokens) / self.rate))
+
+    def pause(self, seconds: float) -> None:
+        """Hands out no tokens for the next ``seconds`` (extends, never shortens)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveLimit:
+    """
+    A concurrency limit that finds its own level by AIMD (as in TCP congestion
+    control): each healthy completion grows it by ``1 / limit`` (about one per
+    round of requests), and an overload signal -- a failure, or recent latency
+    climbing past ``tolerance`` times the long-run average -- cuts it by
+    ``backoff``, at most once per round trip so one burst of errors is one cut.
+
+    ``acquire``/``release`` bound how many run at once; ``record`` reports how
+    each went. Waiters are served first come, first served.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 100,
+        backoff: float = 0.5,
+        tolerance: float = 2.0,
+    ):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("need 1 <= minimum <= initial <= maximum")
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.in_flight = 0
+        # latency averaged over the last few completions, and over many
+        self._recent: float | None = None
+        self._baseline: float | None = None
+        self._last_cut = -math.inf
+        self._waiters: deque[asyncio.Future[None]] = deque()
+
+    @property
+    def current(self) -> int:
+        """How many may run at once right now"""
+        return max(self.minimum, int(self.limit))
+
+    async def acquire(self) -> None:
+        if not self._waiters and self.in_flight < self.current:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted just as we were cancelled: hand the slot back
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def record(self, ok: bool, latency: float | None = None) -> None:
+        """
+        Adjusts the limit after a completion
+        :param ok: False for an overload signal (429, 5xx, timeout, ...)
+        :param latency: how long it took, in seconds, if it's meaningful
+        """
+        if not ok or (latency is not None and self._slower(latency)):
+            now = time.monotonic()
+            if now - self._last_cut >= (self._recent or 0):
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_cut = now
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _slower(self, latency: float) -> bool:
+        """Folds in a latency sample; True if latency is rising"""
+        if self._recent is None or self._baseline is None:
+            self._recent = self._baseline = latency
+            return False
+        self._recent += 0.3 * (latency - self._recent)
+        self._baseline += 0.02 * (latency - self._baseline)
+        return self._recent > self.tolerance * self._baseline
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.current:
+            if not (waiter := self._waiters.popleft()).done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+@dataclass(frozen=True)
+class HostLimits:
+    """How hard one host may be pushed (see ``HostLimiter``)"""
+
+    connections: int = 6
+    rate: float = 8.0
+    burst: int = 8
+    max_connections: int = 32
+
+
+# media CDNs serve static files, not an API: they take far more than API hosts
+CDN_LIMITS = HostLimits(connections=16, rate=200.0, burst=100, max_connections=100)
+
+
+@dataclass
+class _Host:
+    connections: AdaptiveLimit
+    bucket: TokenBucket
+
+
+class HostLimiter:
+    """
+    Throttles requests per host: a limited number in flight to a host at
+    once, started at no more than ``rate`` per second (bursts of ``burst``).
+    Each host's limit adapts (see ``AdaptiveLimit``), starting at
+    ``connections`` and growing up to ``max_connections`` while the host keeps
+    up. Hosts that answer with ``Retry-After`` or an exhausted ``X-RateLimit-*``
+    quota are paused for as long as they ask (up to ``max_pause`` seconds).
+    Hosts listed in ``hosts`` get their own limits instead, e.g. ``CDN_LIMITS``.
+    """
+
+    def __init__(
+        self,
+        connections: int = 6,
+        rate: float = 8.0,
+        burst: int = 8,
+        max_pause: float = 60.0,
+        max_connections: int = 32,
+        hosts: Mapping[str, HostLimits] | None = None,
+    ):
+        self.connections = connections
+        self.max_connections = max(connections, max_connections)
+        self.rate = rate
+        self.burst = burst
+        self.max_pause = max_pause
+        self.hosts = dict(hosts or {})
+        self._hosts: dict[str, _Host] = {}
+
+    def _host(self, host: str) -> _Host:
+        if (state := self._hosts.get(host)) is None:
+            limits = self.hosts.get(host) or HostLimits(
+                self.connections, self.rate, self.burst, self.max_connections
+            )
+            state = self._hosts[host] = _Host(
+                AdaptiveLimit(
+                    limits.connections,
+                    maximum=max(limits.connections, limits.max_connections),
+                ),
+                TokenBucket(limits.rate, limits.burst),
+            )
+        return state
+
+    async def acquire(self, host: str) -> None:
+        """Waits for a free slot for ``host``; ``release`` it when done"""
+        state = self._host(host)
+        await state.connections.acquire()
+        try:
+            await state.bucket.acquire()
+        except BaseException:
+            state.connections.release()
+            raise
+
+    def release(self, host: str) -> None:
+        self._host(host).connections.release()
+
+    def record(self, host: str, ok: bool, latency: float | None = None) -> None:
+        """Feeds how a request to ``host`` went into its adaptive limit"""
+        self._host(host).connections.record(ok, latency)
+
+    def limits(self) -> dict[str, int]:
+        """Each host's current connection limit"""
+        return {host: state.connections.current for host, state in self._hosts.items()}
+
+    def observe(self, host: str, headers: Mapping[str, str]) -> None:
+        """Pauses ``host`` if a response's headers ask us to back off"""
+        # header names are case-insensitive
+        headers = {name.lower(): value for name, value in headers.items()}
+        delays = [_retry_after(headers.get("retry-after"))]
+        for name, value in headers.items():
+            # e.g. X-RateLimit-Remaining, X-RateLimit-UserRemaining (imgur)
+            if name.startswith("x-ratelimit-") and name.endswith("remaining"):
+                with contextlib.suppress(ValueError):
+                    if float(value) <= 0:
+                        reset = headers.get(name.removesuffix("remaining") + "reset")
+                        delays.append(_ratelimit_reset(reset))
+        if delay := max((d for d in delays if d is not None), default=0):
+            self._host(host).bucket.pause(min(delay, self.max_pause))
+
+
+def _retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return when.timestamp() - time.time()
+
+
+def _ratelimit_reset(value: str | None) -> float | None:
+    """Seconds to wait from an X-RateLimit-*Reset header"""
+    if value is None:
+        return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    # some hosts send an epoch timestamp, others the seconds remaining
+    return reset - time.time() if reset > 1e9 else reset
+
+
+class RetryBudget:
+    """
+    Caps retries across a whole run at a fraction of the requests made, so a
+    mass outage can't turn into a retry storm: every request earns ``ratio`` of
+    a retry (banked up to ``cap``) and every retry spends one. ``initial``
+    retries are available from the start.
+    """
+
+    def __init__(self, ratio: float = 0.2, initial: float = 10, cap: float = 100):
+        self.ratio = ratio
+        self.cap = cap
+        self._tokens = min(initial, cap)
+
+    def record(self, requests: int = 1) -> None:
+        """Counts requests made, earning retries"""
+        self._tokens = min(self.cap, self._tokens + requests * self.ratio)
+
+    def spend(self, retries: int = 1) -> bool:
+        """Takes ``retries`` from the budget if it has them; False if it doesn't"""
+        if self._tokens < retries:
+            return False
+        self._tokens -= retries
+        return True
@@ -0,0 +1,89 @@
+import asyncio
+import contextlib
+import json
+
+import aiofiles
+
+# queued by flush() to cut the current batch short; compared by identity
+_FLUSH = object()
+
+
+class JsonLogWriter:
+    """
+    Appends JSON records (one object per line) to a file from a background
+    task, so logging never waits on the disk: records are queued, and the task
+    keeps one handle open and writes them in batches -- once ``batch_size`` are
+    waiting or ``interval`` seconds after the first, whichever comes first.
+
+    ``flush()`` writes out everything queued so far; ``aclose()`` does the same
+    and then stops the task and closes the file, so call it at shutdown or
+    buffered records are lost.
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        # bounded, so a stalled disk backpressures loggers instead of eating RAM
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=10 * batch_size)
+        self._task: asyncio.Task | None = None
+        # the last write error, re-raised from flush() so it isn't silent
+        self._error: OSError | None = None
+
+    async def write(self, record: dict) -> None:
+        """Queues a JSON-serializable record to be appended"""
+        line = json.dumps(record) + "\n"
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await self._queue.put(line)
+
+    async def flush(self) -> None:
+        """Waits until every record queued so far is written to the file"""
+        if self._task is None:
+            return
+        await self._queue.put(_FLUSH)
+        await self._queue.join()
+        if (error := self._error) is not None:
+            self._error = None
+            raise error
+
+    async def aclose(self) -> None:
+        """Flushes, then stops the background task and closes the file"""
+        try:
+            await self.flush()
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await self._task
+                self._task = None
+
+    async def _run(self) -> None:
+        try:
+            f = await aiofiles.open(self.path, "a", encoding="utf-8")
+        except OSError as e:
+            # keep taking records (dropping them), or write() and flush() would
+            #  wait forever on a queue nothing drains; every flush() reports it
+            while True:
+                await self._queue.get()
+                self._error = e
+                self._queue.task_done()
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                # give the batch up to `interval` to fill, unless flush() asks
+                #  for it now
+                with contextlib.suppress(TimeoutError):
+                    async with asyncio.timeout(self.interval):
+                        while len(batch) < self.batch_size and batch[-1] is not _FLUSH:
+                            batch.append(await self._queue.get())
+                try:
+                    await f.write("".join(line for line in batch if line is not _FLUSH))
+                    await f.flush()
+                except OSError as e:
+                    self._error = e
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            await f.close()
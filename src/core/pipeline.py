@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections.abc import AsyncIterable, Awaitable, Callable, Sequence
+from dataclasses import dataclass
+
+from .limits import AdaptiveLimit
+
+
+class Retry(Exception):
+    """
+    Raised by a stage's ``func`` to have the same item run through that stage
+    again after ``delay`` seconds. The item waits off the queue, so it doesn't
+    hold one of the stage's workers in the meantime.
+    """
+
+    def __init__(self, delay: float = 0):
+        super().__init__(delay)
+        self.delay = delay
+
+
+@dataclass
+class Stage[T]:
+    """
+    One step of a pipeline: ``workers`` tasks, each taking items off this
+    stage's queue and applying ``func``. Whatever ``func`` returns is passed on
+    to the next stage (``None`` drops the item; raising ``Retry`` brings it back
+    later).
+
+    With a ``limit``, how many workers may be busy at once adapts (see
+    ``AdaptiveLimit``) up to ``workers``: it grows while items go through
+    quickly, and backs off when they slow down or ask to be retried.
+    """
+
+    name: str
+    func: Callable[[T], Awaitable[T | None]]
+    workers: int = 1
+    # capacity of the queue feeding this stage (defaults to ``workers``); a
+    #  producer blocks while it's full, which is what keeps memory bounded
+    queue_size: int | None = None
+    limit: AdaptiveLimit | None = None
+
+
+async def run_stages[T](source: AsyncIterable[T], stages: Sequence[Stage[T]]) -> None:
+    """
+    Streams ``source`` through ``stages`` with a fixed number of workers per
+    stage and a bounded queue in front of each, so a slow stage backpressures
+    everything upstream of it -- down to pulling from ``source`` -- instead of
+    letting work pile up. Returns once every item has left the last stage.
+    An exception raised by a stage's ``func`` (other than ``Retry``) cancels
+    the whole pipeline.
+    """
+    queues: list[asyncio.Queue] = [
+        asyncio.Queue(maxsize=stage.queue_size or stage.workers) for stage in stages
+    ]
+    # set once nothing more will arrive at a stage from upstream
+    fed = [asyncio.Event() for _ in stages]
+
+    async def feed() -> None:
+        async for item in source:
+            await queues[0].put(item)
+        fed[0].set()
+
+    async def requeue(index: int, item: T, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+            await queues[index].put(item)
+        finally:
+            # the retried item only counts as done once it's queued again, so
+            #  the stage can't finish while it's waiting
+            queues[index].task_done()
+
+    async def work(index: int, tg: asyncio.TaskGroup) -> None:
+        func, limit, inbox = stages[index].func, stages[index].limit, queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            if limit is not None:
+                await limit.acquire()
+            try:
+                item = await inbox.get()
+                start = time.monotonic()
+                try:
+                    result = await func(item)
+                except Retry as retry:
+                    tg.create_task(requeue(index, item, retry.delay))
+                    if limit is not None:
+                        limit.record(ok=False)
+                    continue
+                except BaseException:
+                    inbox.task_done()
+                    raise
+                if limit is not None:
+                    limit.record(ok=True, latency=time.monotonic() - start)
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+                inbox.task_done()
+            finally:
+                if limit is not None:
+                    limit.release()
+
+    async def run_stage(index: int) -> None:
+        async with asyncio.TaskGroup() as tg:
+            workers = [
+                tg.create_task(work(index, tg)) for _ in range(stages[index].workers)
+            ]
+            # done once upstream is, and everything it sent (including retries)
+            #  has been handled; the workers are then idle, waiting on the queue
+            await fed[index].wait()
+            await queues[index].join()
+            for worker in workers:
+                worker.cancel()
+        if index + 1 < len(stages):
+            fed[index + 1].set()
+
+    if not stages:
+        return
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(feed())
+        for index in range(len(stages)):
+            tg.create_task(run_stage(index))
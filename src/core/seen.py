@@ -0,0 +1,27 @@
+from collections.abc import Hashable
+
+
+class SeenSet[T: Hashable]:
+    """
+    The last ``capacity`` keys added, for dropping repeats from a stream that
+    may run indefinitely: past that, the key seen longest ago is forgotten, so
+    memory stays bounded (and only a repeat that far apart gets through).
+    """
+
+    def __init__(self, capacity: int = 100_000):
+        self.capacity = capacity
+        # insertion-ordered, so the first key is the one seen longest ago
+        self._keys: dict[T, None] = {}
+
+    def __contains__(self, key: T) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: T) -> None:
+        # seen again: it's recent now
+        self._keys.pop(key, None)
+        self._keys[key] = None
+        if len(self._keys) > self.capacity:
+            del self._keys[next(iter(self._keys))]
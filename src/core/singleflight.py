@@ -0,0 +1,76 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+
+class _Abandoned(Exception):
+    """The call being waited on was cancelled: a waiter makes it instead"""
+
+
+class SingleFlight[K: Hashable, T]:
+    """
+    Coalesces concurrent calls for the same key into one: while a call for a
+    key is in flight, later calls for it wait for its result (or exception)
+    instead of making their own. Once it's done the key is free again -- this
+    shares work, it doesn't cache it.
+
+    If the call is cancelled, one of its waiters makes it instead: the waiters
+    didn't ask to stop.
+    """
+
+    def __init__(self):
+        # calls that waited for another instead of being made
+        self.coalesced = 0
+        self._waiters: dict[K, list[asyncio.Future[T]]] = {}
+
+    async def do(
+        self,
+        key: K,
+        func: Callable[[], Awaitable[T]],
+        share: Callable[[T], Awaitable[T]] | None = None,
+    ) -> T:
+        """
+        Returns ``await func()``, made once for however many callers ask for
+        ``key`` while it's in flight
+        :param share: what each waiter gets instead of the result itself, e.g.
+            its own copy of something only one owner may consume
+        """
+        while (waiters := self._waiters.get(key)) is not None:
+            future = asyncio.get_running_loop().create_future()
+            waiters.append(future)
+            self.coalesced += 1
+            try:
+                return await future
+            except _Abandoned:
+                continue
+
+        waiters = self._waiters[key] = []
+        try:
+            result = await func()
+        except BaseException as e:
+            del self._waiters[key]
+            error = _Abandoned() if isinstance(e, asyncio.CancelledError) else e
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(error)
+            raise
+        # whoever asks from here on makes a call of their own
+        del self._waiters[key]
+        try:
+            for future in waiters:
+                if future.done():
+                    continue
+                try:
+                    shared = result if share is None else await share(result)
+                # not the call's failure, so it's only that waiter's
+                except Exception as e:  # noqa: BLE001
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                if not future.done():
+                    future.set_result(shared)
+        finally:
+            # cancelled while sharing: anyone not served yet fends for themselves
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(_Abandoned())
+        return result
@@ -0,0 +1,63 @@
+import httpx
+
+# bytes of a body needed to recognize any format below
+SNIFF_BYTES = 16
+
+# leading bytes of the media formats worth saving, and their extensions
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"II*\x00", ".tiff"),
+    (b"MM\x00*", ".tiff"),
+    # Matroska; reddit and most hosts only serve the WebM flavour of it
+    (b"\x1aE\xdf\xa3", ".webm"),
+)
+
+# ISO base media (MP4 and relatives) brands that aren't saved as .mp4
+_BRANDS = {
+    b"avif": ".avif",
+    b"avis": ".avif",
+    b"heic": ".heic",
+    b"heix": ".heic",
+    b"mif1": ".heic",
+    b"qt  ": ".mov",
+}
+
+
+def sniff_extension(head: bytes) -> str | None:
+    """
+    Recognizes a media body by its first bytes (its "magic number")
+    :param head: the body's first ``SNIFF_BYTES`` bytes (or all of it, if shorter)
+    :return: the extension to save it with, e.g. ".png", or None if it isn't
+    a format this knows
+    """
+    for magic, extension in _SIGNATURES:
+        if head.startswith(magic):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp":
+        return _BRANDS.get(head[8:12], ".mp4")
+    return None
+
+
+def media_extension(head: bytes, response: httpx.Response) -> str | None:
+    """
+    The extension a body should be saved with, or None if it shouldn't be: the
+    one its first bytes identify, else -- for a format not sniffed here -- the
+    one its Content-Type names, provided that's an image or video and the body
+    doesn't open like markup (an HTML error page served as ``image/jpeg``)
+    :param head: the body's first ``SNIFF_BYTES`` bytes
+    :param response: the response the body came with
+    """
+    if (extension := sniff_extension(head)) is not None:
+        return extension
+    kind, _, subtype = response.headers.get("Content-Type", "").partition("/")
+    subtype = subtype.partition(";")[0].strip().lower()
+    if kind.strip().lower() not in ("image", "video") or not subtype:
+        return None
+    if head.lstrip(b"\xef\xbb\xbf \t\r\n")[:1] in (b"<", b"{", b"["):
+        return None
+    return "." + subtype
@@ -0,0 +1,38 @@
+import time
+from collections.abc import AsyncIterable, AsyncIterator
+
+import httpx
+
+
+class StallError(httpx.ReadTimeout):
+    """Raised when a body keeps arriving, but too slowly to be worth waiting on"""
+
+
+async def watch_throughput(
+    chunks: AsyncIterable[bytes], min_rate: float, window: float
+) -> AsyncIterator[bytes]:
+    """
+    Passes ``chunks`` through, raising ``StallError`` if fewer than
+    ``min_rate`` bytes per second arrive over any ``window`` seconds. Unlike a
+    fixed deadline this scales with the body's size: a large file may take as
+    long as it needs while it keeps moving, and a trickle is given up on after
+    about ``window`` seconds however small it is. (A body that stops outright
+    is the read timeout's job: this only checks as chunks arrive.) Only time
+    spent waiting on ``chunks`` counts, not time the consumer spends on a chunk
+    (writing it out, or waiting for room in a ``ByteBudget``).
+    :param chunks: the body, e.g. ``response.aiter_bytes()``
+    :param min_rate: slowest acceptable throughput, in bytes per second
+    :param window: seconds over which throughput is measured
+    """
+    since, received = time.monotonic(), 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if (elapsed := time.monotonic() - since) >= window:
+            if received / elapsed < min_rate:
+                raise StallError(
+                    f"{received} bytes in {elapsed:.1f}s, under {min_rate:.0f} B/s"
+                )
+            since, received = time.monotonic(), 0
+        paused = time.monotonic()
+        yield chunk
+        since += time.monotonic() - paused
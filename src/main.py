@@ -1,63 +1,520 @@
 import argparse
 import asyncio
+import contextlib
+import os
 import time
+from collections.abc import Awaitable, Callable, Iterable, Mapping
+from dataclasses import asdict, dataclass, field
+from functools import partial
 from getpass import getpass
 
 import httpx
 from dotenv import load_dotenv
 
-from .core import AsyncClientBundle, Predicate, UniqueDirectoryFileManager
-from .reddit import SortOption, StreamBuilder, SubmissionWrapper
-
+from .core import (
+    CDN_LIMITS,
+    AdaptiveLimit,
+    AsyncClientBundle,
+    ByteBudget,
+    Catalog,
+    Checkpoint,
+    ClientConfig,
+    DownloadsExtensions,
+    Hedger,
+    HostLimiter,
+    Predicate,
+    Retry,
+    RetryBudget,
+    SingleFlight,
+    Stage,
+    UniqueDirectoryFileManager,
+    amap,
+    http2_available,
+    run_stages,
+)
+from .parsing import ResolutionCache, default_router
+from .reddit import SortOption, StreamBuilder, SubmissionWrapper, Watermarks
+
+# kept in the top-level output directory, so it spans every run's folder
+CATALOG_FILENAME = "catalog.sqlite3"
+
+# kept in each run's folder until the run completes (see --resume)
+CHECKPOINT_FILENAME = "checkpoint.json"
+# what a resumed run takes from the checkpoint rather than its command line:
+#  everything that decides which submissions it covers and where they go
+RESUMED_OPTIONS = (
+    "saved",
+    "subreddit",
+    "sortby",
+    "limit",
+    "karma",
+    "hours",
+    "days",
+    "years",
+    "organize",
+    "dedupe",
+    "unsave",
+    "max_size_mb",
+)
+
+# worker counts for each pipeline stage; the network-bound stages adapt their
+#  concurrency between a start and these ceilings (see AdaptiveLimit)
+MAX_CHECKERS = 4
 MAX_FINDERS = 10
 MAX_DOWNLOADS = 100
+MAX_WRITERS = 10
+MAX_FINISHERS = 4
+INITIAL_FINDERS = 4
+INITIAL_DOWNLOADS = 16
+
+# hosts that only serve media files: throttled as CDNs (see CDN_LIMITS), not
+#  like the APIs every other host is assumed to be
+CDN_HOSTS = ("i.redd.it", "preview.redd.it", "v.redd.it", "i.imgur.com")
+
+
+@dataclass
+class Job:
+    """One submission's progress through the pipeline"""
+
+    wrapped: SubmissionWrapper
+    downloads: DownloadsExtensions = field(default_factory=list)
+    saved: list[str] = field(default_factory=list)
+    # set by the first stage that fails; later stages then skip this job
+    error: str = ""
+    # wrapped.urls came from a checkpoint, so there's nothing to resolve
+    resolved: bool = False
+
+
+@dataclass
+class RunStats:
+    """Counters the pipeline streams its results into"""
+
+    submissions: int = 0
+    files: int = 0
+    errors: int = 0
+    # submissions the catalog says an earlier run already finished
+    skipped: int = 0
+    # where each adaptive concurrency limit ended up ("stage:download",
+    #  "host:i.redd.it", ...)
+    limits: dict[str, int] = field(default_factory=dict)
+    # downloads that were slow to answer and got a second request (--hedge)
+    hedged: int = 0
+    # submission urls whose resolution was already known (see ResolutionCache)
+    cached: int = 0
+    # downloads shared with another post fetching the same url at the time
+    coalesced: int = 0
+
+    def record(self, job: Job) -> None:
+        self.submissions += 1
+        self.files += len(job.saved)
+        self.errors += bool(job.error)
 
 
 async def main(args: argparse.Namespace) -> None:
     """Scrapes and downloads any images from posts in the user's saved posts category on Reddit"""
 
-    file_manager = UniqueDirectoryFileManager(args.directory, organize=args.organize)
-
-    # semaphores are created here (not at module scope) so they bind to the event
-    # loop running this call rather than whichever loop first touched them
-    find_urls_sem = asyncio.Semaphore(MAX_FINDERS)
-    download_sem = asyncio.Semaphore(MAX_DOWNLOADS)
-
-    predicate = build_predicate(
-        args.karma, max_age_seconds(args.hours, args.days, args.years)
+    checkpoint = None
+    if args.resume is not None:
+        checkpoint = Checkpoint.load(os.path.join(args.resume, CHECKPOINT_FILENAME))
+        args = resumed_args(args, checkpoint.options)
+
+    # bytes held in memory: bodies being staged, and those prefetched while
+    #  resolving that wait for the download stage
+    budget = ByteBudget(args.max_inflight_mb << 20)
+    file_manager = UniqueDirectoryFileManager(
+        args.directory,
+        organize=args.organize,
+        budget=budget,
+        dedupe=args.dedupe,
+        run_directory=args.resume,
     )
+    if checkpoint is None:
+        checkpoint = Checkpoint(
+            os.path.join(file_manager.directory, CHECKPOINT_FILENAME),
+            checkpoint_options(args),
+        )
+    # what the interrupted run left unfinished (nothing, for a fresh run)
+    resumed = dict(checkpoint.pending)
 
-    tasks: list[asyncio.Task[list[str]]] = []
-    async with asyncio.TaskGroup() as task_group, AsyncClientBundle() as clients:
-        stream = await build_stream(
-            clients,
-            saved=args.saved,
-            subreddits=args.subreddit,
-            sortby=args.sortby,
-            limit=args.limit,
-            predicate=predicate,
+    if args.http2 and not http2_available():
+        print(
+            "--http2 needs the h2 package (pip install 'httpx[http2]'); using HTTP/1.1"
         )
 
-        tasks = [
-            task_group.create_task(
-                process_submission(
-                    wrapped,
+    max_age = max_age_seconds(args.hours, args.days, args.years)
+    predicate = build_predicate(args.karma, max_age)
+
+    stats = RunStats()
+    try:
+        async with (
+            (
+                Catalog(os.path.join(args.directory, CATALOG_FILENAME))
+                if args.catalog
+                else contextlib.nullcontext()
+            ) as catalog,
+            AsyncClientBundle(
+                limiter=HostLimiter(hosts=dict.fromkeys(CDN_HOSTS, CDN_LIMITS)),
+                config=client_config(args),
+                budget=budget,
+            ) as clients,
+        ):
+            if catalog is not None:
+                # urls earlier runs found dead aren't requested again
+                clients.health.load(await catalog.dead_urls())
+            # where each listing started last time; listings stop there
+            watermarks = Watermarks(
+                await catalog.watermarks()
+                if catalog is not None and not args.relist
+                else None
+            )
+            # ids of the submissions that failed, which are listed again
+            failed: set[str] = set()
+            try:
+                stream = await build_stream(
+                    clients,
+                    saved=args.saved,
+                    subreddits=args.subreddit,
+                    sortby=args.sortby,
+                    limit=args.limit,
+                    predicate=predicate,
+                    floors=listing_floors(args.karma, max_age),
+                    watermarks=watermarks,
+                    resume=resumed,
+                )
+
+                hedger = Hedger() if args.hedge else None
+                # kept in the catalog, so later runs needn't resolve urls again
+                resolutions = ResolutionCache(catalog)
+                # one fetch for a url several posts link at once (crossposts)
+                flights = SingleFlight()
+                stages = build_stages(
                     clients,
                     file_manager,
-                    find_urls_sem,
-                    download_sem,
+                    stats,
+                    catalog=catalog,
+                    checkpoint=checkpoint,
+                    resolutions=resolutions,
+                    hedger=hedger,
+                    max_bytes=(
+                        args.max_size_mb << 20 if args.max_size_mb is not None else None
+                    ),
+                    flights=flights,
                     log=args.log,
                     unsave=args.unsave,
+                    failed=failed,
                 )
-            )
-            async for wrapped in stream
-        ]
+                # submissions flow through the stages as they're listed; nothing
+                #  is collected, so memory stays flat however long the run is
+                async with checkpoint:
+                    await run_stages(
+                        amap(partial(start_job, checkpoint=checkpoint), stream),
+                        stages,
+                    )
+                # a post that failed is retried by listing it again, so each
+                #  listing only skips ahead as far as its oldest failure
+                if catalog is not None:
+                    await catalog.record_watermarks(watermarks.advanced(failed))
+                stats.limits = concurrency_limits(stages, clients)
+                stats.hedged = hedger.hedged if hedger is not None else 0
+                stats.cached = resolutions.hits
+                stats.coalesced = flights.coalesced
+            finally:
+                if catalog is not None:
+                    await catalog.record_dead(clients.health.new_dead())
+
+        if args.log:
+            # per-parser hit rates, so url routing can be checked against real traffic
+            await file_manager.log({"parser_stats": default_router.stats()})
+            await file_manager.log({"run_stats": asdict(stats)})
+    finally:
+        # log records are buffered -- write them out even if the run failed
+        await file_manager.aclose()
+
+    skipped = f" ({stats.skipped} already done)" if stats.skipped else ""
+    settled = ", ".join(
+        f"{name.removeprefix('stage:')} {limit}"
+        for name, limit in stats.limits.items()
+        if name.startswith("stage:")
+    )
+    print(
+        f"Done -- saved {stats.files} file(s) from {stats.submissions} "
+        f"submission(s){skipped}."
+        + (f" Concurrency settled at: {settled}." if settled else "")
+    )
+
+
+def resumed_args(
+    args: argparse.Namespace, options: dict[str, object]
+) -> argparse.Namespace:
+    """
+    The arguments for resuming a run: ``args``, but with the options the run
+    was started with (see ``checkpoint_options``), and writing into its folder
+    """
+    resumed = {name: options[name] for name in RESUMED_OPTIONS if name in options}
+    if "sortby" in resumed:
+        resumed["sortby"] = SortOption[str(resumed["sortby"])]
+    directory = os.path.dirname(os.path.abspath(args.resume))
+    return argparse.Namespace(**{**vars(args), **resumed, "directory": directory})
+
+
+def checkpoint_options(args: argparse.Namespace) -> dict[str, object]:
+    """The options a resumed run takes from its checkpoint, as JSON values"""
+    options = {name: getattr(args, name) for name in RESUMED_OPTIONS}
+    options["sortby"] = args.sortby.name
+    return options
+
+
+def start_job(wrapped: SubmissionWrapper, checkpoint: Checkpoint) -> Job:
+    """A submission entering the pipeline, with its urls if a checkpoint has them"""
+    urls = checkpoint.pending.get(wrapped.id)
+    checkpoint.start(wrapped.id)
+    if urls is None:
+        return Job(wrapped)
+    wrapped.urls = set(urls)
+    return Job(wrapped, resolved=True)
+
+
+def concurrency_limits(
+    stages: list[Stage[Job]], clients: AsyncClientBundle
+) -> dict[str, int]:
+    """The current value of every adaptive limit: per stage, then per host"""
+    limits = {
+        f"stage:{stage.name}": stage.limit.current
+        for stage in stages
+        if stage.limit is not None
+    }
+    limits.update(
+        {f"host:{host}": limit for host, limit in clients.limiter.limits().items()}
+    )
+    return limits
+
+
+def client_config(args: argparse.Namespace) -> ClientConfig:
+    """The http client setup for a run, sized to the pipeline's concurrency"""
+    # every resolve and download worker may hold a connection at once
+    connections = MAX_FINDERS + MAX_DOWNLOADS
+    return ClientConfig(
+        http2=args.http2,
+        max_connections=connections,
+        max_keepalive_connections=connections,
+        # the media CDNs nearly every run downloads from
+        preconnect=tuple(default_router.direct),
+    )
+
+
+def build_stages(
+    clients: AsyncClientBundle,
+    file_manager: UniqueDirectoryFileManager,
+    stats: RunStats,
+    *,
+    catalog: Catalog | None = None,
+    checkpoint: Checkpoint | None = None,
+    resolutions: ResolutionCache | None = None,
+    hedger: Hedger | None = None,
+    max_bytes: int | None = None,
+    flights: SingleFlight | None = None,
+    log: bool = False,
+    unsave: bool = False,
+    failed: set[str] | None = None,
+) -> list[Stage[Job]]:
+    """
+    The pipeline each listed submission runs through:
+    [check (catalog)] -> resolve (find_urls) -> download -> store (save_files)
+    -> finish (log/unsave/record)
+    """
+    assert clients.http is not None, "bundle must be entered (async with) first"
+    resolve_step = guarded(
+        partial(
+            resolve, clients=clients, checkpoint=checkpoint, resolutions=resolutions
+        )
+    )
+    download_step = guarded(
+        partial(
+            download,
+            client=clients.http,
+            file_manager=file_manager,
+            catalog=catalog,
+            # shared by every download, so an outage can't set off a retry storm
+            retries=RetryBudget(),
+            hedger=hedger,
+            max_bytes=max_bytes,
+            flights=flights,
+        )
+    )
+    store_step = guarded(partial(store, file_manager=file_manager))
+    finish_step = partial(
+        finish,
+        file_manager=file_manager,
+        stats=stats,
+        catalog=catalog,
+        checkpoint=checkpoint,
+        log=log,
+        unsave=unsave,
+        failed=failed,
+    )
+    stages = [
+        Stage(
+            "resolve",
+            resolve_step,
+            workers=MAX_FINDERS,
+            limit=AdaptiveLimit(INITIAL_FINDERS, maximum=MAX_FINDERS),
+        ),
+        Stage(
+            "download",
+            download_step,
+            workers=MAX_DOWNLOADS,
+            limit=AdaptiveLimit(INITIAL_DOWNLOADS, maximum=MAX_DOWNLOADS),
+        ),
+        Stage("store", store_step, workers=MAX_WRITERS),
+        Stage("finish", finish_step, workers=MAX_FINISHERS),
+    ]
+    if catalog is not None:
+        check_step = partial(check, catalog=catalog, stats=stats, checkpoint=checkpoint)
+        stages.insert(0, Stage("check", check_step, workers=MAX_CHECKERS))
+    return stages
+
+
+def guarded(step: Callable[[Job], Awaitable[None]]) -> Callable[[Job], Awaitable[Job]]:
+    """
+    Wraps a stage so it skips jobs that already failed and records (rather than
+    raises) its own errors: an exception escaping a stage would cancel the
+    whole pipeline, and one bad post should just be skipped (and logged).
+    ``Retry`` is let through for the pipeline to reschedule the job.
+    """
+
+    async def run(job: Job) -> Job:
+        if not job.error:
+            try:
+                await step(job)
+            except Retry:
+                raise
+            # deliberately broad: one bad submission must never crash the whole run
+            except Exception as e:  # noqa: BLE001
+                job.error = str(e)
+        return job
+
+    return run
+
+
+async def check(
+    job: Job,
+    catalog: Catalog,
+    stats: RunStats,
+    checkpoint: Checkpoint | None = None,
+) -> Job | None:
+    # drops submissions an earlier run finished, before any network i/o
+    if await catalog.is_done(job.wrapped.id):
+        stats.skipped += 1
+        if checkpoint is not None:
+            checkpoint.finish(job.wrapped.id)
+        return None
+    return job
+
+
+async def resolve(
+    job: Job,
+    clients: AsyncClientBundle,
+    checkpoint: Checkpoint | None = None,
+    resolutions: ResolutionCache | None = None,
+) -> None:
+    if job.resolved:
+        return
+    # find_urls needs the full bundle (parsers use http AND reddit)
+    await job.wrapped.find_urls(clients, resolutions)
+    job.resolved = True
+    if checkpoint is not None:
+        checkpoint.resolved(job.wrapped.id, job.wrapped.urls)
+
+
+async def download(
+    job: Job,
+    client: httpx.AsyncClient,
+    file_manager: UniqueDirectoryFileManager,
+    catalog: Catalog | None = None,
+    retries: RetryBudget | None = None,
+    hedger: Hedger | None = None,
+    max_bytes: int | None = None,
+    flights: SingleFlight | None = None,
+) -> None:
+    if catalog is not None:
+        # media already saved through another submission (crossposts, reposts)
+        job.wrapped.urls -= await catalog.known_urls(job.wrapped.urls)
+    # bodies stream straight into the file manager's staging area; transient
+    #  failures raise Retry, freeing this worker until the job comes back
+    job.downloads = await job.wrapped.download(
+        client, file_manager, retries, hedger, max_bytes, flights
+    )
+    if job.wrapped.unfinished and not job.downloads:
+        # nothing came through, but only for now: failing the job gets it
+        #  recorded as such, so a later run tries it again
+        job.error = f"{len(job.wrapped.unfinished)} url(s) kept failing"
 
-    # process_submission never raises, so the group always joins cleanly and
-    # every .result() is a (possibly empty) list of saved paths
-    results: list[str] = [path for task in tasks for path in task.result()]
 
-    print(f"Done -- saved {len(results)} file(s) from {len(tasks)} submission(s).")
+async def store(job: Job, file_manager: UniqueDirectoryFileManager) -> None:
+    job.saved = await file_manager.save_files(
+        job.wrapped.title, job.downloads, subreddit=job.wrapped.subreddit
+    )
+    # every staged file has been moved into place
+    job.downloads = []
+
+
+async def finish(
+    job: Job,
+    file_manager: UniqueDirectoryFileManager,
+    stats: RunStats,
+    *,
+    catalog: Catalog | None = None,
+    checkpoint: Checkpoint | None = None,
+    log: bool = False,
+    unsave: bool = False,
+    failed: set[str] | None = None,
+) -> None:
+    # urls that kept failing while the rest came through (if none had, the job
+    #  failed): a later run tries the submission again, for just those
+    partial = bool(job.wrapped.unfinished) and not job.error
+
+    # only un-save posts we actually downloaded everything from
+    if unsave and job.saved and not job.error and not partial:
+        try:
+            await job.wrapped.unsave()
+        except Exception as e:  # noqa: BLE001
+            job.error = str(e)
+
+    # bodies received while resolving that weren't downloaded hold budget
+    job.wrapped.drop_prefetched()
+
+    # a job that failed after downloading still has files in staging
+    if job.downloads:
+        await file_manager.discard(job.downloads)
+        job.downloads = []
+
+    if catalog is not None:
+        if job.error:
+            outcome = Catalog.FAILED
+        elif partial:
+            outcome = Catalog.PARTIAL
+        else:
+            outcome = Catalog.SAVED if job.saved else Catalog.EMPTY
+        await catalog.record(job.wrapped.id, outcome, job.wrapped.downloaded, job.saved)
+    if checkpoint is not None:
+        checkpoint.finish(job.wrapped.id)
+
+    stats.record(job)
+    if (job.error or partial) and failed is not None:
+        failed.add(job.wrapped.id)
+
+    if job.error:
+        print(f"error processing {job.wrapped.url}: {job.error}")
+    elif partial:
+        print(
+            f"saved {len(job.saved)} file(s), {len(job.wrapped.unfinished)} "
+            f"url(s) kept failing: {job.wrapped.title}"
+        )
+    elif job.saved:
+        print(f"saved {len(job.saved)} file(s): {job.wrapped.title}")
+
+    if log:
+        await file_manager.log(job.wrapped.log_record(exception=job.error))
 
 
 def max_age_seconds(
@@ -86,6 +543,20 @@ def build_predicate(
     return predicate
 
 
+def listing_floors(min_score: int | None, max_age: float | None) -> dict[str, float]:
+    """
+    The lowest score and creation time ``build_predicate`` lets through, for
+    cutting ordered listings short (see ``StreamBuilder``)
+    """
+    floors: dict[str, float] = {}
+    if min_score is not None:
+        floors["score"] = min_score
+    if max_age is not None:
+        # the predicate's cutoff only moves later, so this stays a safe floor
+        floors["created_utc"] = time.time() - max_age
+    return floors
+
+
 async def build_stream(
     clients: AsyncClientBundle,
     *,
@@ -94,8 +565,15 @@ async def build_stream(
     sortby: SortOption,
     limit: int,
     predicate: Predicate[SubmissionWrapper],
+    floors: Mapping[str, float] | None = None,
+    watermarks: Watermarks | None = None,
+    resume: Iterable[str] = (),
 ):
-    builder = StreamBuilder(predicate=predicate, limit=limit)
+    builder = StreamBuilder(
+        predicate=predicate, limit=limit, floors=floors, watermarks=watermarks
+    )
+    # submissions an interrupted run didn't get to finish
+    builder.add_submissions(resume)
 
     if saved:
         # input()/getpass() are blocking -- offload them so the loop stays free
@@ -109,65 +587,6 @@ async def build_stream(
     return await builder.build(clients)
 
 
-async def process_submission(
-    wrapped: SubmissionWrapper,
-    clients: AsyncClientBundle,
-    file_manager: UniqueDirectoryFileManager,
-    find_urls_sem: asyncio.Semaphore,
-    download_sem: asyncio.Semaphore,
-    *,
-    log: bool = False,
-    unsave: bool = False,
-) -> list[str]:
-    # Catch everything: this runs in a TaskGroup, so a propagating exception would
-    # cancel every other submission and abort the whole run. One bad post should
-    # just be skipped (and logged), not fatal.
-    try:
-        assert clients.http is not None, "bundle must be entered (async with) first"
-
-        # find_urls needs the full bundle (parsers use http AND reddit)
-        async with find_urls_sem:
-            await wrapped.find_urls(clients)
-
-        # download only needs the http client; awaiting inline keeps the result
-        # reachable for collection while the download semaphore bounds concurrency
-        saved = await process_download(
-            wrapped, clients.http, file_manager, download_sem
-        )
-
-        # only un-save posts we actually downloaded something from
-        if unsave and saved:
-            await wrapped.unsave()
-
-        if log:
-            await file_manager.log(wrapped.log_record())
-
-        if saved:
-            print(f"saved {len(saved)} file(s): {wrapped.title}")
-
-        return saved
-    # deliberately broad: one bad submission must never crash the whole run
-    except Exception as e:  # noqa: BLE001
-        print(f"error processing {wrapped.url}: {e}")
-        if log:
-            await file_manager.log(wrapped.log_record(exception=str(e)))
-        return []
-
-
-async def process_download(
-    wrapped: SubmissionWrapper,
-    client: httpx.AsyncClient,
-    file_manager: UniqueDirectoryFileManager,
-    download_sem: asyncio.Semaphore,
-) -> list[str]:
-    async with download_sem:
-        return await file_manager.save_files(
-            wrapped.title,
-            await wrapped.download(client),
-            subreddit=wrapped.subreddit,
-        )
-
-
 def build_parser() -> argparse.ArgumentParser:
     """Builds the CLI argument parser for the scraper."""
     parser = argparse.ArgumentParser(description="Scrapes images from Reddit")
@@ -177,6 +596,19 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_false",
         help="disable writing a JSON log of processed posts",
     )
+    parser.add_argument(
+        "--nocatalog",
+        dest="catalog",
+        action="store_false",
+        help="ignore (and don't update) the record of posts earlier runs "
+        "downloaded, re-downloading everything",
+    )
+    parser.add_argument(
+        "--relist",
+        action="store_true",
+        help="list every post again, not just those newer than the last run saw "
+        "(e.g. after lowering --karma)",
+    )
     parser.add_argument(
         "-u",
         "--saved",
@@ -225,6 +657,43 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="un-save saved posts after successfully downloading them (requires login)",
     )
+    parser.add_argument(
+        "--max-inflight-mb",
+        type=int,
+        default=256,
+        help="max megabytes of downloads in flight (received but not yet on disk) "
+        "at once",
+    )
+    parser.add_argument(
+        "--max-size-mb",
+        type=int,
+        help="skip any file bigger than this many megabytes, without downloading"
+        " more of it than it takes to tell",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="store each distinct file once (under objects/ in the output directory)"
+        " and hardlink it to its usual name(s)",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="use HTTP/2 where hosts support it (needs the optional h2 package: "
+        "pip install 'httpx[http2]')",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="DIR",
+        help="finish an interrupted run in its output folder DIR, with the options"
+        " it was started with, resuming partly downloaded files",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="send a second request for a download that's slower to start than"
+        " most from its host, and use whichever answers first",
+    )
     parser.add_argument(
         "--organize",
         action="store_true",
@@ -1,14 +1,15 @@
 import asyncio
-from collections.abc import Callable, Coroutine, Iterable
+from collections.abc import Iterable, Mapping
 from typing import Any
 
 from ..core import AsyncClientBundle
+from .cache import ResolutionCache
+from .canonical import canonical_url
 from .flickr import flickr_parser
 from .imgur import imgur_parser
-from .reddit import reddit_parser
-from .single_image import single_image_parser
-
-type Parser = Callable[[str, AsyncClientBundle], Coroutine[Any, Any, set[str]]]
+from .reddit import media_from_payload, reddit_parser
+from .router import CACHED, DIRECT, LISTING, Parser, ParserRouter, parser_name
+from .single_image import IMAGE_EXTENSIONS, single_image_parser
 
 parsers = (
     single_image_parser,
@@ -17,30 +18,97 @@ parsers = (
     flickr_parser,
 )
 
+default_router = ParserRouter(
+    routes={
+        "reddit.com": (reddit_parser,),
+        "redd.it": (reddit_parser,),
+        # media hosts under redd.it: probe them rather than asking the API
+        "i.redd.it": (single_image_parser,),
+        "preview.redd.it": (single_image_parser,),
+        "imgur.com": (imgur_parser,),
+        "flickr.com": (flickr_parser,),
+        "flic.kr": (flickr_parser,),
+    },
+    # an unknown host can only be resolved by probing it for an image
+    fallback=(single_image_parser,),
+    direct={
+        "i.redd.it": IMAGE_EXTENSIONS,
+        "i.imgur.com": IMAGE_EXTENSIONS,
+    },
+)
+
 
 async def find_urls(
     url: str,
     clients: AsyncClientBundle,
-    parsers: Iterable[Parser] = parsers,
+    parsers: Iterable[Parser] | None = None,
+    *,
+    payload: Mapping[str, Any] | None = None,
+    cache: ResolutionCache | None = None,
 ) -> set[str]:  # we use sets to avoid duplicates
     """
     Attempts to find images on a linked page
     Currently supports directly linked images and imgur pages
     :param url: a link to a webpage
-    :param parsing_strategies: a list of parsing functions to use
-    :return: a list of direct links to images found on that webpage
+    :param parsers: parsers to run on every url; by default each url is routed
+        to just the parsers for its host (see ``default_router``)
+    :param payload: the already-loaded fields of the submission that linked
+        ``url``; reddit images, galleries, and crossposts resolve from it
+        without any request
+    :param cache: consulted before any parser runs, and given what they find
+    :return: a list of direct links to images found on that webpage, each in
+        its canonical form (see ``canonical_url``)
     """
-    return set().union(
-        *(await asyncio.gather(*(parser(url, clients) for parser in parsers)))
-    )
+    if payload is not None and (found := media_from_payload(payload)) is not None:
+        default_router.record(LISTING, found)
+        return _canonical(found, clients)
+    url = canonical_url(url)
+    if parsers is None and default_router.is_direct(url):
+        # resolving it costs nothing, so there's nothing to cache
+        return await default_router.find_urls(url, clients)
+    if cache is not None and (found := await cache.get(url)) is not None:
+        default_router.record(CACHED, found)
+        return found
+    if parsers is None:
+        parsers = default_router.route(url)
+        found = await default_router.find_urls(url, clients)
+    else:
+        parsers = tuple(parsers)
+        found = set().union(
+            *(await asyncio.gather(*(parser(url, clients) for parser in parsers)))
+        )
+    found = _canonical(found, clients)
+    if cache is not None:
+        await cache.put(url, found, map(parser_name, parsers))
+    return found
+
+
+def _canonical(found: set[str], clients: AsyncClientBundle) -> set[str]:
+    """``found``, canonicalized"""
+    urls = set()
+    for url in found:
+        urls.add(canonical := canonical_url(url))
+        if canonical != url:
+            # what was prefetched from one spelling needn't be what another
+            #  serves (preview.redd.it resizes), so it's fetched again
+            clients.drop_prefetched(url)
+    return urls
 
 
 __all__ = [
+    "CACHED",
+    "DIRECT",
+    "LISTING",
     "Parser",
+    "ParserRouter",
+    "ResolutionCache",
+    "canonical_url",
+    "default_router",
     "find_urls",
     "flickr_parser",
     "get_response_file_extension",
     "imgur_parser",
+    "media_from_payload",
     "parsers",
     "reddit_parser",
     "single_image_parser",
@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping
+
+from ..core import Catalog
+
+# how long (seconds) each parser's results are trusted: a probed image or a
+#  flickr photo doesn't change, an imgur album can be edited, and a reddit post
+#  can be edited or deleted
+TTLS = {
+    "single_image_parser": 30 * 86400,
+    "flickr_parser": 30 * 86400,
+    "imgur_parser": 7 * 86400,
+    "reddit_parser": 86400,
+}
+
+
+class ResolutionCache:
+    """
+    Remembers what submission urls resolved to, so one that turns up again --
+    in another listing, as a crosspost, or in a later run -- isn't parsed (or
+    its host's API asked) again. A result is kept for the shortest TTL of the
+    parsers that produced it (``ttls``, by parser name; ``default_ttl`` for any
+    not listed). Nothing found isn't cached: it may have been a passing failure.
+
+    The ``capacity`` most recently used results are kept in memory. With a
+    ``store``, every result is also saved there and looked up there on a miss,
+    so they carry across runs.
+    """
+
+    def __init__(
+        self,
+        store: Catalog | None = None,
+        ttls: Mapping[str, float] = TTLS,
+        default_ttl: float = 86400,
+        capacity: int = 4096,
+    ):
+        self.store = store
+        self.ttls = dict(ttls)
+        self.default_ttl = default_ttl
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        # url -> (what it resolved to, expiry as a unix time), oldest use first
+        self._entries: OrderedDict[str, tuple[frozenset[str], float]] = OrderedDict()
+
+    async def get(self, url: str) -> set[str] | None:
+        """What ``url`` resolved to, if that's known and hasn't expired"""
+        if (entry := self._entries.get(url)) is not None:
+            if entry[1] > time.time():
+                self._entries.move_to_end(url)
+                self.hits += 1
+                return set(entry[0])
+            # the store's copy expires at the same time
+            del self._entries[url]
+        elif (
+            self.store is not None
+            and (stored := await self.store.resolution(url)) is not None
+        ):
+            urls, expires = stored
+            self._remember(url, frozenset(urls), expires)
+            self.hits += 1
+            return urls
+        self.misses += 1
+        return None
+
+    async def put(self, url: str, urls: set[str], parsers: Iterable[str]) -> None:
+        """
+        Remembers what ``url`` resolved to
+        :param parsers: the names of the parsers that resolved it
+        """
+        if not urls:
+            return
+        ttl = min(
+            (self.ttls.get(name, self.default_ttl) for name in parsers),
+            default=self.default_ttl,
+        )
+        expires = time.time() + ttl
+        self._remember(url, frozenset(urls), expires)
+        if self.store is not None:
+            await self.store.record_resolution(url, urls, expires)
+
+    def _remember(self, url: str, urls: frozenset[str], expires: float) -> None:
+        self._entries[url] = (urls, expires)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
@@ -0,0 +1,40 @@
+from urllib.parse import urlsplit, urlunsplit
+
+# hosts whose links are the same over http and https, with or without "www."
+#  and from their mobile subdomains
+_HTTPS_HOSTS = ("reddit.com", "redd.it", "imgur.com")
+_MOBILE = {"m.imgur.com": "imgur.com", "m.reddit.com": "reddit.com"}
+
+# media hosts whose query strings only resize, re-encode or sign the file
+_MEDIA_HOSTS = ("i.redd.it", "i.imgur.com")
+
+
+def canonical_url(url: str) -> str:
+    """
+    One spelling for every link to the same thing, so they can be recognized
+    as such (and cached, or fetched, once): the host lowercased, without
+    ``www.`` or a mobile subdomain, https for hosts that serve it, and no
+    fragment. Media links are reduced to the original file, e.g.
+
+        http://preview.redd.it/abc.jpg?width=640&s=... -> https://i.redd.it/abc.jpg
+        https://i.imgur.com/xyz.gifv -> https://i.imgur.com/xyz.mp4
+
+    :param url: any link, with or without a scheme
+    :return: the canonical form of ``url`` (a fetchable url itself)
+    """
+    parts = urlsplit(url if "//" in url else "//" + url)
+    host = (parts.hostname or "").lower().removeprefix("www.")
+    host = _MOBILE.get(host, host)
+    scheme, path, query = parts.scheme.lower() or "https", parts.path, parts.query
+    if host == "preview.redd.it" and "." in path.rpartition("/")[2]:
+        # a resized (and often re-encoded) copy of the i.redd.it original
+        host = "i.redd.it"
+    if host in _MEDIA_HOSTS:
+        query = ""
+    if host == "i.imgur.com" and path.endswith(".gifv"):
+        # an html page around the .mp4
+        path = path.removesuffix(".gifv") + ".mp4"
+    if any(host == h or host.endswith("." + h) for h in _HTTPS_HOSTS):
+        scheme = "https"
+    netloc = host if parts.port is None else f"{host}:{parts.port}"
+    return urlunsplit((scheme, netloc, path, query, ""))
@@ -1,36 +1,58 @@
+from collections.abc import Mapping
+from typing import Any
 from urllib.parse import urlparse
 
 from ..core import AsyncClientBundle
 
+_MEDIA_HOSTS = ("i.redd.it", "preview.redd.it")
 
-async def reddit_parser(url: str, clients: AsyncClientBundle) -> set[str]:
+
+def media_from_payload(data: Mapping[str, Any]) -> set[str] | None:
     """
-    :param url: the url to parse
-    :param client: the http client to use for any requests
-    :param reddit: the praw reddit instance to use for parsing
-    :returns: A list of all scrapeable urls found in the given webpage
+    Resolves a submission's media from its already-loaded data (the fields of an
+    ``asyncpraw.models.Submission``, or an entry of ``crosspost_parent_list``)
+    without any request.
+    :param data: the submission's fields, e.g. ``vars(submission)``
+    :returns: the direct media urls, an empty set if the post conclusively has
+        none (a text post), or None if its url still has to be parsed
     """
+    # a crosspost carries its media on the parent
+    if parents := data.get("crosspost_parent_list"):
+        data = parents[0]
 
-    assert clients.reddit is not None, "set_reddit() must be called first"
-    submission = await clients.reddit.submission(url=url)
+    if data.get("is_self"):
+        return set()
 
-    parsed = urlparse(submission.url)
+    url = data.get("url")
 
     # single image
-    if parsed.netloc in ("i.redd.it", "preview.redd.it"):
-        return {submission.url}
+    if isinstance(url, str) and urlparse(url).netloc in _MEDIA_HOSTS:
+        return {url}
 
     # gallery post
-    if submission.is_gallery:
+    if data.get("is_gallery"):
+        metadata = data.get("media_metadata") or {}
         items = []
-        for item in submission.gallery_data["items"]:
-            media_id = item["media_id"]
+        for item in (data.get("gallery_data") or {}).get("items", []):
+            # items that failed processing have no source image
+            source = metadata.get(item["media_id"], {}).get("s", {})
+            if img_url := source.get("u") or source.get("gif"):
+                # Get the original image and unescape ampersands
+                items.append(img_url.replace("&amp;", "&"))
+        return set(items)
 
-            metadata = submission.media_metadata[media_id]
+    return None
 
-            # Get the original image and unescape ampersands
-            img_url = metadata["s"]["u"].replace("&amp;", "&")
-            items.append(img_url)
-        return set(items)
 
-    return set()
+async def reddit_parser(url: str, clients: AsyncClientBundle) -> set[str]:
+    """
+    :param url: the url to parse
+    :param client: the http client to use for any requests
+    :param reddit: the praw reddit instance to use for parsing
+    :returns: A list of all scrapeable urls found in the given webpage
+    """
+
+    assert clients.reddit is not None, "set_reddit() must be called first"
+    submission = await clients.reddit.submission(url=url)
+
+    return media_from_payload(vars(submission)) or set()
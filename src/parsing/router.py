@@ -0,0 +1,110 @@
+import asyncio
+from collections import Counter
+from collections.abc import Callable, Coroutine, Iterable, Mapping
+from typing import Any
+from urllib.parse import urlparse
+
+from ..core import AsyncClientBundle
+
+type Parser = Callable[[str, AsyncClientBundle], Coroutine[Any, Any, set[str]]]
+
+# names under which direct-media fast-path hits, urls resolved from the
+#  submission's own listing data, and ones answered by a ``ResolutionCache``
+#  are counted
+DIRECT = "direct"
+LISTING = "listing"
+CACHED = "cached"
+
+
+def parser_name(parser: Parser) -> str:
+    """What a parser's calls are counted (and its results cached) under"""
+    # its function's name; a callable without one (a partial, say) goes by its type
+    return getattr(parser, "__name__", type(parser).__name__)
+
+
+def _hostname(url: str) -> str:
+    # urlparse only finds the host after a "//", and some links omit the scheme
+    return urlparse(url if "//" in url else "//" + url).hostname or ""
+
+
+def _extension(url: str) -> str:
+    path = urlparse(url if "//" in url else "//" + url).path
+    _, dot, extension = path.rpartition(".")
+    return "." + extension.lower() if dot and "/" not in extension else ""
+
+
+class ParserRouter:
+    """
+    Sends each url only to the parsers that can handle its host, instead of
+    running every parser on every url.
+
+    ``routes`` maps a host to its parsers; a url matches its own host or the
+    nearest registered parent domain (``old.reddit.com`` -> ``reddit.com``), and
+    falls back to ``fallback`` if nothing matches. Urls on a ``direct`` host
+    whose path ends in one of that host's extensions are media already, so they
+    are returned as-is without any request.
+
+    Every call is counted per parser (and under ``DIRECT`` for the fast path),
+    so routing can be checked against real traffic via ``stats()``.
+    """
+
+    def __init__(
+        self,
+        routes: Mapping[str, Iterable[Parser]],
+        fallback: Iterable[Parser] = (),
+        direct: Mapping[str, Iterable[str]] | None = None,
+    ):
+        self.routes = {host: tuple(parsers) for host, parsers in routes.items()}
+        self.fallback = tuple(fallback)
+        self.direct = {
+            host: frozenset(extensions) for host, extensions in (direct or {}).items()
+        }
+        self.calls: Counter[str] = Counter()
+        self.hits: Counter[str] = Counter()
+
+    def is_direct(self, url: str) -> bool:
+        """True if ``url`` is a known direct-media link that needs no parsing"""
+        extensions = self.direct.get(_hostname(url))
+        return extensions is not None and _extension(url) in extensions
+
+    def route(self, url: str) -> tuple[Parser, ...]:
+        """The parsers registered for ``url``'s host (or its nearest parent)"""
+        labels = _hostname(url).split(".")
+        for i in range(len(labels) - 1):
+            if (parsers := self.routes.get(".".join(labels[i:]))) is not None:
+                return parsers
+        return self.fallback
+
+    async def find_urls(self, url: str, clients: AsyncClientBundle) -> set[str]:
+        """
+        Resolves ``url`` with just the parsers routed to it
+        :param url: a link to a webpage
+        :param clients: the client bundle handed to each parser
+        :return: direct links to the media found on that webpage
+        """
+        if self.is_direct(url):
+            self.record(DIRECT, {url})
+            return {url}
+
+        parsers = self.route(url)
+        results = await asyncio.gather(*(parser(url, clients) for parser in parsers))
+        for parser, found in zip(parsers, results, strict=True):
+            self.record(parser_name(parser), found)
+        return set().union(*results)
+
+    def record(self, name: str, found: set[str]) -> None:
+        """Counts one call to ``name`` (a hit if it ``found`` anything)"""
+        self.calls[name] += 1
+        if found:
+            self.hits[name] += 1
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Calls, hits, and hit rate of every parser that has been routed to"""
+        return {
+            name: {
+                "calls": calls,
+                "hits": self.hits[name],
+                "hit_rate": self.hits[name] / calls,
+            }
+            for name, calls in self.calls.items()
+        }
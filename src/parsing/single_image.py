@@ -1,22 +1,52 @@
-from ..core import AsyncClientBundle, get_response_file_extension
+from ..core import AsyncClientBundle, Prefetched, get_response_file_extension
+
+IMAGE_EXTENSIONS = (".webp", ".png", ".jpg", ".jpeg", ".gif")
+
+# bodies up to this size are read during the probe and handed to the download
+#  stage (via clients.prefetched), so small images cross the wire exactly once;
+#  anything larger is judged on its headers alone and the stream is closed
+#  before the body arrives, so a finder slot is never held for a big transfer
+PREFETCH_LIMIT = 1 << 20  # 1 MiB
 
 
 # TODO: this could just work for any filetype, not just images
 #  Maybe rename to single_file_parser?
 async def single_image_parser(url: str, clients: AsyncClientBundle) -> set[str]:
     """
-    :param response: A web page that has been recognized by this parser
-    :returns: A list of all scrapeable urls found in the given webpage
+    Probes ``url`` with a streamed GET and recognizes it if it serves an image.
+    Only the headers are needed to decide; small bodies are kept in
+    ``clients.prefetched`` (keyed by the final url) so they needn't be refetched,
+    if ``clients.budget`` has room for them.
+    :param url: a link that might point directly at an image
+    :param clients: the client bundle; only ``clients.http`` is used
+    :returns: the (post-redirect) url of the image, or an empty set
     """
     assert clients.http is not None, "bundle must be entered (async with) first"
-    response = await clients.http.get(url)  # we do this to follow redirects
-    if response.status_code == 200 and get_response_file_extension(response) in [
-        ".webp",
-        ".png",
-        ".jpg",
-        ".jpeg",
-        ".gif",
-    ]:
+    async with clients.http.stream("GET", url) as response:
+        if (
+            response.status_code != 200
+            or get_response_file_extension(response) not in IMAGE_EXTENSIONS
+        ):
+            return set()
+
         # response.url is an httpx.URL; the rest of the pipeline expects str
-        return {str(response.url)}
-    return set()
+        found = str(response.url)
+        length = response.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) <= PREFETCH_LIMIT:
+            budget = clients.budget
+            # only if there's room right now: a download waiting for bytes could
+            #  be waiting on this very body, which sits in a queue behind it
+            if budget is not None and not budget.try_acquire(int(length)):
+                return {found}
+            # held until the body is staged, or dropped with its submission
+            prefetched = Prefetched(
+                response, budget, int(length) if budget is not None else 0
+            )
+            try:
+                await response.aread()
+            except BaseException:
+                prefetched.release()
+                raise
+            clients.drop_prefetched(found)
+            clients.prefetched[found] = prefetched
+    return {found}
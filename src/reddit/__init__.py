@@ -1,5 +1,5 @@
 from .sortoption import SortOption
-from .submission_source import StreamBuilder
+from .submission_source import StreamBuilder, Watermarks
 from .submission_wrapper import (
     SubmissionWrapper,
 )
@@ -8,4 +8,5 @@ __all__ = [
     "SortOption",
     "StreamBuilder",
     "SubmissionWrapper",
+    "Watermarks",
 ]
@@ -26,3 +26,16 @@ class SortOption(Enum):
 
     def __call__(self, *args, **kwargs):
         return self.value(*args, **kwargs)
+
+    @property
+    def descending(self) -> str | None:
+        """
+        The submission attribute this listing is ordered by, highest first, if
+        it's ordered by one at all: newest first for NEW, and by score for the
+        TOP listings (hot and controversial mix several factors)
+        """
+        if self is SortOption.NEW:
+            return "created_utc"
+        if self.name.startswith("TOP_"):
+            return "score"
+        return None
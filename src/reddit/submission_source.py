@@ -1,13 +1,69 @@
-from collections.abc import AsyncIterable
+from collections.abc import (
+    AsyncIterable,
+    AsyncIterator,
+    Collection,
+    Iterable,
+    Mapping,
+)
 from typing import Self
 
 import asyncpraw
 import asyncpraw.models
 
-from ..core import AsyncClientBundle, Predicate, afilter, amap, merge
+from ..core import AsyncClientBundle, Predicate, SeenSet, afilter, amap, merge
 from .sortoption import SortOption
 from .submission_wrapper import SubmissionWrapper
 
+# submissions remembered for dropping repeats; a repeat further apart than this
+#  gets through (and is then skipped by the catalog, if it's done)
+SEEN_CAPACITY = 100_000
+
+# an ordered listing is abandoned after this many submissions in a row below
+#  the floor: one is enough for NEW, but scores shift (and are fuzzed) while a
+#  TOP listing is paged through, so a straggler may still come after it
+FLOOR_PATIENCE = 5
+
+# what a listing yields: saved() lists Comments alongside Submissions
+type Listed = asyncpraw.models.Submission | asyncpraw.models.Comment
+
+
+class Watermarks:
+    """
+    Where each newest-first listing stopped being new last run (its mark), and
+    what it listed this run, from which the next run's marks are worked out
+    """
+
+    def __init__(self, marks: Mapping[str, tuple[str, float]] | None = None):
+        # source -> (fullname, created_utc) of the item its listing stops at
+        self.marks = dict(marks or {})
+        # source -> (id, fullname, created_utc) of each item listed this run,
+        #  newest first
+        self.listed: dict[str, list[tuple[str, str, float]]] = {}
+
+    def note(self, source: str, item: Listed) -> None:
+        """Records that ``source`` listed ``item`` (after everything noted so far)"""
+        self.listed.setdefault(source, []).append(
+            (item.id, item.fullname, item.created_utc)
+        )
+
+    def advanced(self, failed: Collection[str]) -> dict[str, tuple[str, float]]:
+        """
+        The marks for the next run: the newest item each listing got to -- or,
+        if some of what it listed ``failed`` (by id), the item it listed after
+        the oldest of those, so they're all listed again. A listing with nothing
+        after that keeps its old mark.
+        """
+        marks = dict(self.marks)
+        for source, items in self.listed.items():
+            start = 0
+            for i, (item_id, _, _) in enumerate(items):
+                if item_id in failed:
+                    start = i + 1
+            if start < len(items):
+                _, fullname, created = items[start]
+                marks[source] = (fullname, created)
+        return marks
+
 
 class StreamBuilder:
 
@@ -21,13 +77,24 @@ class StreamBuilder:
         sortby: SortOption = SortOption.HOT,
         predicate: Predicate[SubmissionWrapper] = lambda x: True,
         limit: int | None = None,
+        floors: Mapping[str, float] | None = None,
+        watermarks: Watermarks | None = None,
     ):
         self.sortby = sortby
         self.predicate = predicate
         self.limit = limit  # max submissions to pull from each source
+        # the lowest value of a submission attribute the predicate lets through
+        #  (e.g. "score"); a listing ordered by that attribute (see
+        #  SortOption.descending) is only paged through until it drops below
+        self.floors = dict(floors or {})
+        # where the saved and NEW listings (newest first) stop, and what they
+        #  list now (see Watermarks)
+        self.watermarks = watermarks if watermarks is not None else Watermarks()
         # per-subreddit predicates aren't supported right now
         self.subreddits: list[tuple[str, SortOption]] = []
         self.redditor: tuple[str, str] | None = None
+        # particular submissions to include, e.g. those an interrupted run left
+        self.submission_ids: list[str] = []
 
     def add_subreddit(self, name: str, sortby: SortOption | None = None) -> Self:
         name = name.lower().removeprefix("r/")
@@ -40,6 +107,10 @@ class StreamBuilder:
         self.redditor = (username, password)
         return self
 
+    def add_submissions(self, ids: Iterable[str]) -> Self:
+        self.submission_ids.extend(ids)
+        return self
+
     def set_default_sortby(self, sortby: SortOption) -> Self:
         self.sortby = sortby
         return self
@@ -58,17 +129,31 @@ class StreamBuilder:
 
         streams: list[AsyncIterable[asyncpraw.models.Submission]] = []
 
+        # a post turned away for its score while fresh may qualify later, but
+        #  only a listing ordered by score would ever come back to it
+        marked = "score" not in self.floors
+
         if self.redditor:
             # saved posts belong to the authenticated user; reddit.user.me() and
             # reddit.redditor() are coroutines, so build() has to be async
             me = await reddit.user.me()
-            streams.append(me.saved(limit=self.limit))
+            saved = me.saved(limit=self.limit)
+            streams.append(self._since(saved, "saved") if marked else saved)
 
         for name, sortby in self.subreddits:
-            streams.append(sortby(reddit.subreddit(name), limit=self.limit))
+            listing = sortby(reddit.subreddit(name), limit=self.limit)
+            key = sortby.descending
+            if key == "created_utc" and marked:
+                listing = self._since(listing, f"r/{name}:{sortby.name.lower()}")
+            if key is not None and (floor := self.floors.get(key)) is not None:
+                listing = _above(listing, key, floor)
+            streams.append(listing)
 
         stream: AsyncIterable[asyncpraw.models.Submission] = merge(*streams)
 
+        if self.submission_ids:
+            stream = merge(_fetch_submissions(reddit, self.submission_ids), stream)
+
         def mapfunc(submission: asyncpraw.models.Submission) -> SubmissionWrapper:
             return SubmissionWrapper(submission, http)
 
@@ -77,4 +162,68 @@ class StreamBuilder:
             lambda item: not isinstance(item, asyncpraw.models.Comment), stream
         )
 
-        return afilter(self.predicate, amap(mapfunc, submissions))
+        seen: SeenSet[str] = SeenSet(SEEN_CAPACITY)
+
+        def unseen(wrapped: SubmissionWrapper) -> bool:
+            # the same post may be listed by several sources, and a crosspost
+            #  shares its media with the original (and any other crossposts);
+            #  only those the predicate let through count, so a crosspost it
+            #  turned away doesn't hide its original
+            ids = [wrapped.id]
+            parent = vars(wrapped._submission).get("crosspost_parent")
+            if isinstance(parent, str):
+                ids.append(parent.removeprefix("t3_"))
+            first = not any(i in seen for i in ids)
+            for i in ids:
+                seen.add(i)
+            return first
+
+        return afilter(unseen, afilter(self.predicate, amap(mapfunc, submissions)))
+
+    async def _since[T: Listed](
+        self, listing: AsyncIterable[T], source: str
+    ) -> AsyncIterator[T]:
+        """
+        A newest-first listing, up to its watermark -- everything past that was
+        listed by an earlier run. What it lists is noted, for the next run's.
+        """
+        mark = self.watermarks.marks.get(source)
+        async for item in listing:
+            if mark is not None and (
+                item.fullname == mark[0]
+                # the watermark itself may have been deleted; saved items come
+                #  in the order they were saved, not created, though
+                or (source != "saved" and item.created_utc < mark[1])
+            ):
+                return
+            self.watermarks.note(source, item)
+            yield item
+
+
+async def _above(
+    listing: AsyncIterable[asyncpraw.models.Submission], key: str, floor: float
+) -> AsyncIterator[asyncpraw.models.Submission]:
+    """
+    A listing ordered by ``key`` (highest first), up to where it falls below
+    ``floor`` -- past that nothing could pass the predicate, so no more pages
+    are requested
+    """
+    below = 0
+    async for submission in listing:
+        if getattr(submission, key) >= floor:
+            below = 0
+            yield submission
+        elif (below := below + 1) >= FLOOR_PATIENCE:
+            return
+
+
+async def _fetch_submissions(
+    reddit: asyncpraw.Reddit, ids: Iterable[str]
+) -> AsyncIterator[asyncpraw.models.Submission]:
+    """Fetches each submission by id, skipping any that can't be (e.g. deleted)"""
+    for submission_id in ids:
+        try:
+            yield await reddit.submission(submission_id)
+        # deliberately broad: one missing submission mustn't end the listing
+        except Exception:  # noqa: BLE001, S112
+            continue
@@ -1,42 +1,393 @@
 import asyncio
+import contextlib
+from collections.abc import AsyncIterator, Awaitable, Callable, Generator
+from functools import partial
 
 import asyncpraw
 import asyncpraw.models
 import httpx
 
-from ..core import AsyncClientBundle, get_response_file_extension
+from ..core import (
+    AsyncClientBundle,
+    CircuitOpenError,
+    DownloadsExtensions,
+    Hedger,
+    Prefetched,
+    Retry,
+    RetryBudget,
+    SingleFlight,
+    UniqueDirectoryFileManager,
+    media_extension,
+    watch_throughput,
+)
+from ..parsing import ResolutionCache
 from ..parsing import find_urls as parse_find_urls
 
 # transient statuses worth retrying (rate limit + gateway/server errors)
 _RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
+# bytes read from the network per write to disk
+CHUNK_SIZE = 1 << 16  # 64 KiB
 
-async def _get_with_retry(
+# seconds to connect, and to wait for the response to start or for the body to
+#  resume after it pauses; how long the whole body may take isn't capped, since
+#  that depends on its size (see MIN_THROUGHPUT)
+CONNECT_TIMEOUT = 5
+TIMEOUT = 10
+TIMEOUTS = httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT)
+
+# a body arriving slower than this (bytes/second, measured over the window in
+#  seconds) is given up on as stalled, and retried like a dropped connection
+MIN_THROUGHPUT = 16 * 1024
+THROUGHPUT_WINDOW = 5.0
+
+# tries per download, and the delay before the first retry (doubling after)
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 0.5
+
+# bodies at least this big, from servers that take Range requests, are fetched
+#  as this many segments over parallel connections
+SEGMENT_THRESHOLD = 8 << 20  # 8 MiB
+SEGMENTS = 4
+
+
+class _TransientError(Exception):
+    """A GET failed in a way that's worth retrying later (429/5xx, network)"""
+
+
+class _Unavailable(_TransientError):
+    """A GET wasn't sent: its host is failing, so not before a later run"""
+
+
+class _RangeNotSatisfiable(Exception):
+    """A resumed GET was refused (416): what's staged can't be continued"""
+
+
+class _Rejected(Exception):
+    """A body isn't worth keeping: it isn't media, or it's over the size cap"""
+
+
+async def _get[T](
     client: httpx.AsyncClient,
     url: str,
+    handle: Callable[[httpx.Response], Awaitable[T]],
     *,
-    attempts: int = 3,
-    backoff: float = 0.5,
-    timeout: float = 10,
-) -> httpx.Response | None:
+    timeout: float | httpx.Timeout = TIMEOUTS,
+    hedger: Hedger | None = None,
+    headers: dict[str, str] | None = None,
+) -> T:
+    """
+    Streams one GET of ``url`` and passes the response, body still unread, to
+    ``handle``, whose result is returned. Nothing is retried (or slept on)
+    here: a 429/5xx response or a transport error -- including one while
+    ``handle`` reads the body -- raises ``_TransientError``, and the caller
+    decides whether to schedule a retry or give the url up. A host whose
+    circuit is open (see ``HostHealth``) raises ``_Unavailable`` at once. With
+    a ``hedger``, a request that's slow to answer is hedged (see ``Hedger``).
+    """
+    stream = (
+        client.stream("GET", url, timeout=timeout, headers=headers)
+        if hedger is None
+        else hedger.stream(client, url, timeout=timeout, headers=headers)
+    )
+    with _classified(url):
+        async with stream as response:
+            if response.status_code in _RETRYABLE_STATUS:
+                raise _TransientError(f"{url}: HTTP {response.status_code}")
+            return await handle(response)
+
+
+@contextlib.contextmanager
+def _classified(url: str) -> Generator[None]:
+    """
+    Raises ``_Unavailable`` for a request its host's circuit refused, and
+    ``_TransientError`` for one that failed in transport (see ``_get``)
+    """
+    try:
+        yield
+    except CircuitOpenError as e:
+        # the host is down; failing fast is the point, so don't come back soon
+        raise _Unavailable(f"{url}: {e}") from e
+    except (httpx.TransportError, httpx.TimeoutException) as e:
+        raise _TransientError(f"{url}: {e!r}") from e
+
+
+async def _stage_body(
+    response: httpx.Response,
+    file_manager: UniqueDirectoryFileManager,
+    url: str | None = None,
+    offset: int = 0,
+    validator: str | None = None,
+    client: httpx.AsyncClient | None = None,
+    max_bytes: int | None = None,
+    reserved: int = 0,
+) -> tuple[str, str] | None:
     """
-    GETs ``url``, retrying transient transport errors and 429/5xx responses with
-    exponential backoff. Returns the response once it's non-retryable (success or
-    a hard error like 404), or ``None`` if every attempt failed at the transport
-    level — so one persistently-broken url drops a single file rather than failing
-    the whole submission.
+    Streams a successful response's body to disk in chunks, reserving its
+    Content-Length (when sent) against the file manager's in-flight byte budget
+    before reading any of it -- unless ``reserved`` bytes are already held for
+    it (a prefetched body, see ``Prefetched``), which are used instead. A body that slows to a trickle raises
+    ``StallError`` (see ``watch_throughput``).
+
+    Only media is kept: the body's first chunk is checked for a known format
+    (see ``media_extension``), which also decides its extension, and one that
+    isn't media -- an HTML error page, say -- is abandoned there. So is a body
+    bigger than ``max_bytes``: before any of it is read if its Content-Length
+    says so, else as soon as that many bytes have arrived. Either way nothing
+    of it is kept, and None is returned.
+
+    Given its ``url``, a body sent with a validator is staged resumably, and a
+    206 answering a request for the rest of it (from ``offset``, if it still
+    matches ``validator``) is appended to what's already staged; its format is
+    then checked on the first bytes staged, whatever the 206's headers say.
+    Given a ``client`` too, a large body is fetched in segments (see
+    ``_stage_segments``) once its first bytes have been checked.
     """
-    response: httpx.Response | None = None
-    for attempt in range(attempts):
-        try:
-            response = await client.get(url, timeout=timeout)
-            if response.status_code not in _RETRYABLE_STATUS:
-                return response
-        except (httpx.TransportError, httpx.TimeoutException):
-            response = None
-        if attempt < attempts - 1:
-            await asyncio.sleep(backoff * (2**attempt))
-    return response
+    if response.status_code == 416 and offset:
+        raise _RangeNotSatisfiable(url)
+    resumed = response.status_code == 206 and _range_start(response) == offset > 0
+    if response.status_code != 200 and not resumed:
+        return None
+    start = offset if resumed else 0
+    length = response.headers.get("Content-Length", "")
+    chunks = _watched(response)
+    # bytes held for this body that nothing has taken over yet
+    held = reserved
+    try:
+        if (
+            max_bytes is not None
+            and length.isdigit()
+            and start + int(length) > max_bytes
+        ):
+            raise _Rejected(f"{url}: {start + int(length)} bytes")
+        if resumed and url is not None:
+            # its first bytes were staged already: the same check on them gives
+            #  the extension the first try would have
+            head = await file_manager.partial_head(url, CHUNK_SIZE)
+        else:
+            head = await anext(chunks, b"")
+            chunks = _prepended(head, chunks)
+        if (extension := media_extension(head, response)) is None:
+            raise _Rejected(f"{url}: not media")
+        if max_bytes is not None:
+            chunks = _capped(chunks, max_bytes - start)
+        if (
+            client is not None
+            and url is not None
+            and not resumed
+            and _segmentable(response)
+        ):
+            path = await _stage_segments(
+                response, client, url, int(length), file_manager, extension
+            )
+            return path, extension
+        if not reserved and length.isdigit():
+            reserved = await file_manager.reserve(int(length))
+        # stage() releases them, however it goes
+        held = 0
+        path = await file_manager.stage(
+            chunks,
+            reserved,
+            url=url,
+            # a 206 needn't repeat the validator it was matched against
+            validator=_validator(response.headers) or (validator if resumed else None),
+            offset=start,
+        )
+    except _Rejected:
+        if url is not None:
+            # a resumable stage keeps what it got, but none of this is wanted
+            await file_manager.drop_partial(url)
+        return None
+    finally:
+        file_manager.release(held)
+    return path, extension
+
+
+def _segmentable(response: httpx.Response) -> bool:
+    """True if a body is big enough to split, and can be (as sent, uncompressed)"""
+    headers = response.headers
+    length = headers.get("Content-Length", "")
+    return (
+        response.status_code == 200
+        and headers.get("Accept-Ranges", "").lower() == "bytes"
+        and headers.get("Content-Encoding", "identity") == "identity"
+        and length.isdigit()
+        and int(length) >= SEGMENT_THRESHOLD
+    )
+
+
+async def _stage_segments(
+    response: httpx.Response,
+    client: httpx.AsyncClient,
+    url: str,
+    length: int,
+    file_manager: UniqueDirectoryFileManager,
+    extension: str,
+) -> str:
+    """
+    Fetches a large body as ``SEGMENTS`` byte ranges at once, each with a
+    Range request of its own, written at its offset into a preallocated file.
+    ``response`` is closed first: it holds a connection slot for its host,
+    which the ranges would otherwise wait on for good once they fill the rest.
+    A body sent with a validator is staged resumably (see ``_fetch_segments``).
+    :return: the staged file's path
+    """
+    validator = _validator(response.headers)
+    await response.aclose()
+    path = await file_manager.preallocate(
+        length, url=url, validator=validator, extension=extension
+    )
+    return await _fetch_segments(
+        client, url, file_manager, path, length, validator, frozenset()
+    )
+
+
+async def _fetch_segments(
+    client: httpx.AsyncClient,
+    url: str,
+    file_manager: UniqueDirectoryFileManager,
+    path: str,
+    length: int,
+    validator: str | None,
+    written: frozenset[tuple[int, int]],
+) -> str:
+    """
+    Fetches the segments of a body that aren't ``written`` yet into ``path``,
+    all at once, each to its end even if another fails. If any failed, the
+    body fails with ``_TransientError`` (or the error that stopped it) for the
+    pipeline to retry later -- keeping the segments that are in, if it's
+    resumable, so only the rest are fetched again. A body that changed
+    meanwhile is dropped, to be fetched afresh.
+    :return: the staged file's path
+    """
+    size = -(-length // SEGMENTS)
+    missing = [
+        (start, min(start + size, length))
+        for start in range(0, length, size)
+        if (start, min(start + size, length)) not in written
+    ]
+    try:
+        results = await asyncio.gather(
+            *(
+                _fetch_segment(client, url, file_manager, path, start, end, validator)
+                for start, end in missing
+            ),
+            return_exceptions=True,
+        )
+    except BaseException:
+        if validator is None:
+            await file_manager.discard([(path, "")])
+        raise
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if not errors:
+        return await file_manager.seal(path)
+    changed = any(isinstance(error, _RangeNotSatisfiable) for error in errors)
+    if validator is None:
+        await file_manager.discard([(path, "")])
+    elif changed:
+        await file_manager.drop_partial(url)
+    if changed:
+        raise _TransientError(f"{url}: changed while it was fetched")
+    raise errors[0]
+
+
+async def _fetch_segment(
+    client: httpx.AsyncClient,
+    url: str,
+    file_manager: UniqueDirectoryFileManager,
+    path: str,
+    start: int,
+    end: int,
+    validator: str | None,
+) -> None:
+    """
+    Writes bytes ``start`` to ``end`` of ``url`` into ``path`` with a Range
+    request, and records them as written. Nothing is retried here: a dropped
+    connection propagates, a range that can't be had raises ``_TransientError``,
+    and a whole body instead (it's changed) ``_RangeNotSatisfiable``.
+    """
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    if validator is not None:
+        headers["If-Range"] = validator
+    received = 0
+
+    async def counted(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        nonlocal received
+        async for chunk in chunks:
+            received += len(chunk)
+            yield chunk
+
+    async with client.stream("GET", url, headers=headers, timeout=TIMEOUTS) as ranged:
+        # a 200 is the whole body: it's changed since the first response
+        if ranged.status_code == 200:
+            raise _RangeNotSatisfiable(url)
+        if ranged.status_code != 206 or _range_start(ranged) != start:
+            raise _TransientError(f"{url}: HTTP {ranged.status_code} for a range")
+        await file_manager.write_at(
+            path, start, counted(_take(_watched(ranged), end - start))
+        )
+    if received < end - start:
+        raise _TransientError(f"{url}: bytes {start + received}-{end - 1} missing")
+    await file_manager.written(path, start, end)
+
+
+def _watched(response: httpx.Response) -> AsyncIterator[bytes]:
+    """A response's body, watched for stalls (see ``watch_throughput``)"""
+    return watch_throughput(
+        response.aiter_bytes(CHUNK_SIZE), MIN_THROUGHPUT, THROUGHPUT_WINDOW
+    )
+
+
+async def _prepended(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """``chunks``, after a ``head`` already read from them"""
+    if head:
+        yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+async def _capped(chunks: AsyncIterator[bytes], nbytes: int) -> AsyncIterator[bytes]:
+    """``chunks``, raising ``_Rejected`` once more than ``nbytes`` arrive"""
+    async for chunk in chunks:
+        if (nbytes := nbytes - len(chunk)) < 0:
+            raise _Rejected("over the size cap")
+        yield chunk
+
+
+async def _take(chunks: AsyncIterator[bytes], nbytes: int) -> AsyncIterator[bytes]:
+    """The first ``nbytes`` of ``chunks``"""
+    async for chunk in chunks:
+        if len(chunk) >= nbytes:
+            if nbytes:
+                yield chunk[:nbytes]
+            return
+        nbytes -= len(chunk)
+        yield chunk
+
+
+def _validator(headers: httpx.Headers) -> str | None:
+    """What identifies this version of a body for ``If-Range``, if anything"""
+    # weak ETags only say two bodies are equivalent, not byte-for-byte equal
+    if (etag := headers.get("ETag")) and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _range_start(response: httpx.Response) -> int | None:
+    """Where a 206's body starts, from its ``Content-Range: bytes a-b/n``"""
+    unit, _, spec = response.headers.get("Content-Range", "").partition(" ")
+    start, _, _ = spec.partition("-")
+    return int(start) if unit == "bytes" and start.isdigit() else None
+
+
+async def _share(
+    result: tuple[str, str] | None, file_manager: UniqueDirectoryFileManager
+) -> tuple[str, str] | None:
+    """A copy of a download, for another post waiting on the same url"""
+    if result is None:
+        return None
+    path, extension = result
+    return await file_manager.clone(path), extension
 
 
 class SubmissionWrapper:
@@ -50,6 +401,7 @@ class SubmissionWrapper:
     ):
         self._submission = submission
 
+        self.id = submission.id
         self.title = submission.title
         self.subreddit = str(submission.subreddit)
         self.url = submission.url
@@ -58,6 +410,16 @@ class SubmissionWrapper:
         self.score = submission.score
         self.created_utc = submission.created_utc
         self.urls: set[str] = set()
+        # bodies the parsers already received for some of self.urls
+        self._prefetched: dict[str, Prefetched] = {}
+        # urls download() is done with (staged, or None if dropped), kept
+        #  across retries so only the ones that failed are fetched again
+        self._fetched: dict[str, tuple[str, str] | None] = {}
+        self._attempts = 0
+        # urls the last download() staged, and those it gave up on for now
+        #  (still failing transiently when it ran out of tries)
+        self.downloaded: set[str] = set()
+        self.unfinished: set[str] = set()
 
     async def unsave(self):
         """
@@ -68,39 +430,184 @@ class SubmissionWrapper:
     async def download(
         self,
         client: httpx.AsyncClient,
-    ) -> list[tuple[bytes, str]]:
+        file_manager: UniqueDirectoryFileManager,
+        retries: RetryBudget | None = None,
+        hedger: Hedger | None = None,
+        max_bytes: int | None = None,
+        flights: SingleFlight[str, tuple[str, str] | None] | None = None,
+    ) -> DownloadsExtensions:
         """
-        Downloads all urls and bundles them with their file extension
+        Streams every url into the file manager's staging area (each album
+        member is written as it arrives, never buffered whole) and bundles it
+        with its file extension.
+
+        Transient failures (429/5xx, dropped connections) aren't retried in
+        place: if ``retries`` can spare a retry for each of them and attempts
+        remain, whatever did arrive is kept and ``Retry`` is raised, so the
+        pipeline brings this submission back after a backoff -- without it
+        holding a download worker meanwhile -- and only the failed urls are
+        fetched again. Otherwise they're dropped, and listed in
+        ``self.unfinished``; so are urls whose host is failing (see
+        ``HostHealth``). Anything that isn't media, or is too big (see
+        ``_stage_body``), is dropped for good as soon as that's clear.
+
+        With ``flights``, a url another post is already downloading isn't
+        fetched again: this one waits for that download and gets its own copy
+        of the file.
         :client: the httpx client to use for downloading
-        :return: a list of tuples, where the first element is
-        the content of the downloaded file and the second element is the file extension
+        :file_manager: stages each body on disk as it streams in
+        :retries: the run's retry budget; no retries without one
+        :hedger: hedges requests that are slow to answer, if given
+        :max_bytes: bodies bigger than this are abandoned (and dropped); no cap
+        if None
+        :flights: coalesces downloads of the same url across posts, if given
+        :return: a list of tuples, where the first element is the path of the
+        staged file and the second element is the file extension
+        :raises Retry: when the failed urls should be tried again later
         """
-        if not self.urls:
-            return []
+        pending = [url for url in self.urls if url not in self._fetched]
+        final = retries is None or self._attempts >= RETRY_ATTEMPTS - 1
+        if retries is not None:
+            retries.record(len(pending))
 
-        responses = await asyncio.gather(
-            *(_get_with_retry(client, url) for url in self.urls)
+        def fetch(url: str) -> Awaitable[tuple[str, str] | None]:
+            call = partial(self._fetch, client, url, file_manager, hedger, max_bytes)
+            if flights is None:
+                return call()
+            return flights.do(
+                url, call, share=partial(_share, file_manager=file_manager)
+            )
+
+        results = await asyncio.gather(
+            *(fetch(url) for url in pending), return_exceptions=True
         )
+        transient: list[str] = []
+        unavailable: list[str] = []
+        errors: list[BaseException] = []
+        for url, result in zip(pending, results, strict=True):
+            if isinstance(result, _Unavailable):
+                unavailable.append(url)
+            elif isinstance(result, _TransientError):
+                transient.append(url)
+            elif isinstance(result, BaseException):
+                errors.append(result)
+            else:
+                self._fetched[url] = result
+
+        staged = [r for r in self._fetched.values() if r is not None]
+        if errors:
+            # don't leave the members that did make it orphaned in staging
+            await file_manager.discard(staged)
+            self._fetched = {}
+            raise errors[0]
+        if (
+            transient
+            and not final
+            and retries is not None
+            and retries.spend(len(transient))
+        ):
+            self._attempts += 1
+            raise Retry(RETRY_BACKOFF * 2 ** (self._attempts - 1))
+
+        # one persistently-failing url drops a single file, not the submission
+        self.downloaded = {url for url, r in self._fetched.items() if r is not None}
+        self.unfinished = {*transient, *unavailable}
+        self._fetched = {}
+        return staged
+
+    async def _fetch(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        file_manager: UniqueDirectoryFileManager,
+        hedger: Hedger | None = None,
+        max_bytes: int | None = None,
+    ) -> tuple[str, str] | None:
+        """
+        Stages the body a parser already received for ``url``, else GETs it --
+        or, if an earlier attempt (or run) left part of it staged, just the
+        rest of it, provided it hasn't changed since
+        """
+        if (prefetched := self._prefetched.pop(url, None)) is not None:
+            return await _stage_body(
+                prefetched.response,
+                file_manager,
+                max_bytes=max_bytes,
+                reserved=prefetched.take(),
+            )
+
+        if (staged := await file_manager.preallocated(url)) is not None:
+            # a segmented body: just the segments that aren't in yet
+            with _classified(url):
+                path = await _fetch_segments(
+                    client,
+                    url,
+                    file_manager,
+                    staged.path,
+                    staged.length,
+                    staged.validator,
+                    staged.written,
+                )
+            return path, staged.extension
 
-        return [
-            (
-                response.content,
-                get_response_file_extension(response),
+        if (partial_body := await file_manager.partial(url)) is not None:
+            offset, validator = partial_body
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+            handle = partial(
+                _stage_body,
+                file_manager=file_manager,
+                url=url,
+                offset=offset,
+                validator=validator,
+                max_bytes=max_bytes,
             )
-            for response in responses
-            if response is not None and response.status_code == 200
-        ]
+            try:
+                return await _get(client, url, handle, hedger=hedger, headers=headers)
+            except _RangeNotSatisfiable:
+                await file_manager.drop_partial(url)
+
+        handle = partial(
+            _stage_body,
+            file_manager=file_manager,
+            url=url,
+            client=client,
+            max_bytes=max_bytes,
+        )
+        return await _get(client, url, handle, hedger=hedger)
 
-    async def find_urls(self, clients: AsyncClientBundle) -> set[str]:
+    async def find_urls(
+        self, clients: AsyncClientBundle, cache: ResolutionCache | None = None
+    ) -> set[str]:
         """
-        Runs every parser against this submission's url and stores the resulting
-        direct media links in ``self.urls``.
+        Resolves this submission's url and stores the resulting direct media
+        links in ``self.urls``. The submission's own listing data is handed to
+        the parsers, so reddit media needs no extra reddit request. Any bodies
+        the parsers already received are claimed from ``clients.prefetched``
+        for ``download()``.
         :param clients: the full client bundle (parsers need http AND reddit)
+        :param cache: what urls resolved to before, if kept (see
+            ``ResolutionCache``)
         :return: the set of discovered urls (also stored on self.urls)
         """
-        self.urls = await parse_find_urls(self.url, clients)
+        self.urls = await parse_find_urls(
+            self.url, clients, payload=vars(self._submission), cache=cache
+        )
+        self._prefetched = {
+            url: prefetched
+            for url in self.urls
+            if (prefetched := clients.prefetched.pop(url, None)) is not None
+        }
         return self.urls
 
+    def drop_prefetched(self) -> None:
+        """
+        Lets go of the bodies ``find_urls`` claimed that ``download()`` didn't
+        stage (urls already saved, say), freeing the bytes held for them
+        """
+        for prefetched in self._prefetched.values():
+            prefetched.release()
+        self._prefetched = {}
+
     def log_record(self, exception: str = "") -> dict:
         """
         Builds a JSON-serializable record describing this post, suitable for
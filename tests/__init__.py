@@ -1,4 +1,6 @@
 from .utils import (
+    StreamingClientMock,
+    StreamResponseMock,
     SubmissionMockFactory,
     SubmissionWrapperFactory,
     acollect,
@@ -6,6 +8,8 @@ from .utils import (
 )
 
 __all__ = [
+    "StreamResponseMock",
+    "StreamingClientMock",
     "SubmissionMockFactory",
     "SubmissionWrapperFactory",
     "acollect",
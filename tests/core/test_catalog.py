@@ -0,0 +1,94 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.core import Catalog
+
+
+class TestCatalog(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "catalog.sqlite3")
+        self.catalog = await Catalog(self.path).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.catalog.__aexit__(None, None, None)
+        self._tmp.cleanup()
+
+    async def test_unknown_submission_is_not_done(self):
+        self.assertFalse(await self.catalog.is_done("abc"))
+        self.assertEqual(await self.catalog.paths("abc"), [])
+
+    async def test_saved_and_empty_are_done(self):
+        await self.catalog.record("a", Catalog.SAVED, ["u"], ["/out/a.jpg"])
+        await self.catalog.record("b", Catalog.EMPTY)
+        self.assertTrue(await self.catalog.is_done("a"))
+        self.assertTrue(await self.catalog.is_done("b"))
+        self.assertEqual(await self.catalog.paths("a"), ["/out/a.jpg"])
+
+    async def test_failed_is_retried(self):
+        await self.catalog.record("a", Catalog.FAILED, ["u"])
+        self.assertFalse(await self.catalog.is_done("a"))
+        # urls of a failed submission weren't saved, so they aren't known
+        self.assertEqual(await self.catalog.known_urls(["u"]), set())
+
+    async def test_partial_is_retried_for_the_rest(self):
+        await self.catalog.record("a", Catalog.PARTIAL, ["u"], ["/out/a.jpg"])
+        self.assertFalse(await self.catalog.is_done("a"))
+        # what was saved is known, so only the rest is fetched again
+        self.assertEqual(await self.catalog.known_urls(["u", "v"]), {"u"})
+
+    async def test_later_record_replaces_earlier(self):
+        await self.catalog.record("a", Catalog.FAILED)
+        await self.catalog.record("a", Catalog.SAVED, ["u"], ["/out/a.jpg"])
+        self.assertTrue(await self.catalog.is_done("a"))
+
+    async def test_known_urls(self):
+        await self.catalog.record("a", Catalog.SAVED, ["u1", "u2"], ["/1", "/2"])
+        self.assertEqual(
+            await self.catalog.known_urls(["u1", "u3", "u2"]), {"u1", "u2"}
+        )
+        self.assertEqual(await self.catalog.known_urls([]), set())
+
+    async def test_persists_across_opens(self):
+        await self.catalog.record("a", Catalog.SAVED, ["u"], ["/out/a.jpg"])
+        async with Catalog(self.path) as reopened:
+            self.assertTrue(await reopened.is_done("a"))
+            self.assertEqual(await reopened.known_urls(["u"]), {"u"})
+
+    async def test_dead_urls_round_trip(self):
+        expires = time.time() + 60
+        await self.catalog.record_dead([("u", 404, expires)])
+        await self.catalog.record_dead([])
+        self.assertEqual(await self.catalog.dead_urls(), {"u": (404, expires)})
+
+    async def test_expired_dead_urls_are_dropped(self):
+        await self.catalog.record_dead([("old", 404, time.time() - 1)])
+        self.assertEqual(await self.catalog.dead_urls(), {})
+
+    async def test_resolutions_round_trip(self):
+        expires = time.time() + 60
+        await self.catalog.record_resolution("u", {"a", "b"}, expires)
+        self.assertEqual(await self.catalog.resolution("u"), ({"a", "b"}, expires))
+        self.assertIsNone(await self.catalog.resolution("other"))
+
+    async def test_expired_resolution_is_not_returned(self):
+        await self.catalog.record_resolution("u", {"a"}, time.time() - 1)
+        self.assertIsNone(await self.catalog.resolution("u"))
+
+    async def test_watermarks_round_trip(self):
+        await self.catalog.record_watermarks({"saved": ("t3_a", 1.0)})
+        await self.catalog.record_watermarks(
+            {"saved": ("t3_b", 2.0), "r/pics:new": ("t3_c", 3.0)}
+        )
+        await self.catalog.record_watermarks({})
+        self.assertEqual(
+            await self.catalog.watermarks(),
+            {"saved": ("t3_b", 2.0), "r/pics:new": ("t3_c", 3.0)},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
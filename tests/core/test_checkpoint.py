@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from src.core import Checkpoint
+
+
+class TestCheckpoint(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "checkpoint.json")
+
+    async def asyncTearDown(self):
+        self._tmp.cleanup()
+
+    def _read(self):
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    async def test_written_on_entry(self):
+        async with Checkpoint(self.path, {"limit": 5}) as checkpoint:
+            checkpoint.start("a")
+            await asyncio.sleep(0.05)
+            self.assertEqual(self._read()["options"], {"limit": 5})
+            checkpoint.finish("a")
+
+    async def test_tracks_pending_submissions_and_their_urls(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.start("a")
+        checkpoint.start("b")
+        checkpoint.resolved("a", {"u2", "u1"})
+        checkpoint.finish("b")
+        self.assertEqual(checkpoint.pending, {"a": ["u1", "u2"]})
+
+    async def test_resolving_a_finished_submission_is_ignored(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.resolved("a", ["u"])
+        self.assertEqual(checkpoint.pending, {})
+
+    async def test_removed_once_nothing_is_pending(self):
+        async with Checkpoint(self.path, interval=0) as checkpoint:
+            checkpoint.start("a")
+            await asyncio.sleep(0.05)
+            self.assertTrue(os.path.exists(self.path))
+            checkpoint.finish("a")
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_kept_with_the_latest_state_when_interrupted(self):
+        with self.assertRaises(asyncio.CancelledError):
+            async with Checkpoint(self.path, {"limit": 5}) as checkpoint:
+                checkpoint.start("a")
+                checkpoint.start("b")
+                checkpoint.resolved("b", ["u"])
+                raise asyncio.CancelledError
+        self.assertEqual(
+            self._read(), {"options": {"limit": 5}, "pending": {"a": None, "b": ["u"]}}
+        )
+
+    async def test_load_round_trips(self):
+        with self.assertRaises(KeyboardInterrupt):
+            async with Checkpoint(self.path, {"limit": 5}) as checkpoint:
+                checkpoint.start("a")
+                raise KeyboardInterrupt
+        loaded = Checkpoint.load(self.path)
+        self.assertEqual(loaded.options, {"limit": 5})
+        self.assertEqual(loaded.pending, {"a": None})
+
+    async def test_load_without_checkpoint(self):
+        with self.assertRaises(FileNotFoundError):
+            Checkpoint.load(self.path)
@@ -1,9 +1,17 @@
-from unittest.mock import patch
+import asyncio
+from unittest.mock import AsyncMock, patch
 
 import httpx
 import pytest
 
-from src.core import AsyncClientBundle
+from src.core import (
+    AsyncClientBundle,
+    CircuitOpenError,
+    ClientConfig,
+    HostHealth,
+    HostLimiter,
+    RateLimitedTransport,
+)
 
 
 class TestConstructor:
@@ -138,3 +146,179 @@ class TestSetReddit:
             )
             assert reddit, self.reddit_sentinel
             assert reddit == self.reddit_sentinel
+
+
+async def _body():
+    # a streamed body, like a real connection's (plain content is pre-read)
+    yield b"data"
+
+
+def _transport(limiter, handler, health=None):
+    return RateLimitedTransport(limiter, httpx.MockTransport(handler), health)
+
+
+class TestRateLimitedTransport:
+
+    @pytest.mark.asyncio
+    async def test_bundle_client_is_limited(self):
+        limiter = HostLimiter()
+        async with AsyncClientBundle(limiter=limiter) as clients:
+            assert clients.limiter is limiter
+            assert isinstance(clients.http._transport, RateLimitedTransport)
+
+    @pytest.mark.asyncio
+    async def test_slot_is_held_until_body_is_closed(self):
+        limiter = HostLimiter(connections=1)
+        transport = _transport(
+            limiter, lambda request: httpx.Response(200, content=_body())
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "https://a.com/1"):
+                assert limiter._host("a.com").connections.in_flight == 1
+            assert limiter._host("a.com").connections.in_flight == 0
+            # a plain (non-streamed) request releases once it's read
+            await client.get("https://a.com/2")
+            assert limiter._host("a.com").connections.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_slot_is_released_on_error(self):
+        def fail(request):
+            raise httpx.ConnectError("down")
+
+        limiter = HostLimiter(connections=1)
+        async with httpx.AsyncClient(transport=_transport(limiter, fail)) as client:
+            with pytest.raises(httpx.ConnectError):
+                await client.get("https://a.com/")
+        assert limiter._host("a.com").connections.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_response_headers_are_observed(self):
+        limiter = HostLimiter()
+        transport = _transport(
+            limiter, lambda request: httpx.Response(429, headers={"Retry-After": "5"})
+        )
+        with patch.object(limiter, "observe") as observe:
+            async with httpx.AsyncClient(transport=transport) as client:
+                await client.get("https://a.com/")
+        host, headers = observe.call_args.args
+        assert host == "a.com"
+        assert headers["Retry-After"] == "5"
+
+
+class TestHostHealthInTransport:
+
+    @pytest.mark.asyncio
+    async def test_bundle_client_tracks_health(self):
+        health = HostHealth()
+        async with AsyncClientBundle(health=health) as clients:
+            assert clients.health is health
+            assert clients.http._transport.health is health
+
+    @pytest.mark.asyncio
+    async def test_dead_url_is_answered_from_cache(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url)
+            return httpx.Response(404)
+
+        transport = _transport(HostLimiter(), handler, HostHealth())
+        async with httpx.AsyncClient(transport=transport) as client:
+            first = await client.get("https://a.com/gone")
+            second = await client.get("https://a.com/gone")
+        assert first.status_code == second.status_code == 404
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url)
+            raise httpx.ConnectError("down")
+
+        limiter = HostLimiter()
+        transport = _transport(limiter, handler, HostHealth(threshold=2))
+        async with httpx.AsyncClient(transport=transport) as client:
+            for _ in range(2):
+                with pytest.raises(httpx.ConnectError):
+                    await client.get("https://a.com/")
+            with pytest.raises(CircuitOpenError):
+                await client.get("https://a.com/")
+        assert len(calls) == 2
+        assert limiter._host("a.com").connections.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_server_errors_open_the_circuit(self):
+        transport = _transport(
+            HostLimiter(), lambda request: httpx.Response(503), HostHealth(threshold=1)
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get("https://a.com/")
+            with pytest.raises(CircuitOpenError):
+                await client.get("https://a.com/other")
+
+
+def _transport_kwargs(config: ClientConfig) -> dict:
+    """The keyword arguments ``config`` builds its httpx transport with"""
+    with patch("httpx.AsyncHTTPTransport") as transport:
+        config.transport()
+    return dict(transport.call_args.kwargs)
+
+
+class TestClientConfig:
+
+    def test_pool_limits(self):
+        config = ClientConfig(
+            max_connections=50, max_keepalive_connections=40, keepalive_expiry=5
+        )
+        assert _transport_kwargs(config)["limits"] == httpx.Limits(
+            max_connections=50, max_keepalive_connections=40, keepalive_expiry=5
+        )
+
+    def test_http2_only_with_h2_installed(self):
+        with patch("src.core.client_bundle.http2_available", return_value=False):
+            assert not _transport_kwargs(ClientConfig(http2=True))["http2"]
+
+    def test_http2_is_opt_in(self):
+        with patch("src.core.client_bundle.http2_available", return_value=True):
+            assert not _transport_kwargs(ClientConfig())["http2"]
+            assert _transport_kwargs(ClientConfig(http2=True))["http2"]
+
+    @pytest.mark.asyncio
+    async def test_bundle_uses_config(self):
+        config = ClientConfig(timeout=3)
+        async with AsyncClientBundle(config=config) as clients:
+            assert clients.config is config
+            assert clients.http.timeout.read == 3
+
+    @pytest.mark.asyncio
+    async def test_preconnect_heads_each_host(self):
+        config = ClientConfig(preconnect=("a.com", "b.com"))
+        with patch.object(httpx.AsyncClient, "head", new_callable=AsyncMock) as head:
+            head.side_effect = [None, httpx.ConnectError("down")]  # errors ignored
+            async with AsyncClientBundle(config=config) as clients:
+                await clients._preconnecting
+        assert {call.args[0] for call in head.await_args_list} == {
+            "https://a.com/",
+            "https://b.com/",
+        }
+
+    @pytest.mark.asyncio
+    async def test_unfinished_preconnect_is_cancelled_on_exit(self):
+        started = asyncio.Event()
+
+        async def hang(url):
+            started.set()
+            await asyncio.sleep(60)
+
+        config = ClientConfig(preconnect=("a.com",))
+        with patch.object(httpx.AsyncClient, "head", side_effect=hang):
+            async with AsyncClientBundle(config=config) as clients:
+                await started.wait()
+        assert clients._preconnecting.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_no_preconnect_by_default(self):
+        async with AsyncClientBundle() as clients:
+            assert clients._preconnecting is None
@@ -1,12 +1,14 @@
 import asyncio
+import hashlib
 import json
 import os
 import tempfile
 import unittest
 from datetime import datetime
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
-from src.core import UniqueDirectoryFileManager
+from src.core import ByteBudget, UniqueDirectoryFileManager
+from tests import async_iter
 
 
 class TestUniqueDirectoryFileManagerConstructor(unittest.TestCase):
@@ -30,16 +32,24 @@ class _TempManagerTestCase(unittest.IsolatedAsyncioTestCase):
     """Base case giving each test a manager rooted in a fresh temp directory"""
 
     organize = False
+    dedupe = False
 
     async def asyncSetUp(self):
         self._tmp = tempfile.TemporaryDirectory()
         self.manager = UniqueDirectoryFileManager(
-            self._tmp.name, organize=self.organize
+            self._tmp.name, organize=self.organize, dedupe=self.dedupe
         )
 
     async def asyncTearDown(self):
         self._tmp.cleanup()
 
+    async def _staged(self, *contents_extensions):
+        """Stages each (content, extension) pair, as a download would"""
+        return [
+            (await self.manager.stage(async_iter([content])), extension)
+            for content, extension in contents_extensions
+        ]
+
 
 class TestLog(_TempManagerTestCase):
 
@@ -47,24 +57,42 @@ class TestLog(_TempManagerTestCase):
         path1 = await self.manager.log({"a": 1})
         path2 = await self.manager.log({"b": 2})
         self.assertEqual(path1, path2)  # same default log file
+        await self.manager.flush()
         with open(path1, encoding="utf-8") as f:
             records = [json.loads(line) for line in f.read().splitlines()]
         self.assertEqual(records, [{"a": 1}, {"b": 2}])
 
     async def test_concurrent_logs_are_serialized(self):
-        # the lock must keep concurrent appends from interleaving; every line
-        # should be independently valid JSON
+        # one writer owns the file, so concurrent records can't interleave;
+        #  every line should be independently valid JSON
         await asyncio.gather(*(self.manager.log({"i": i}) for i in range(20)))
+        await self.manager.flush()
         path = os.path.join(self.manager.directory, "log.txt")
         with open(path, encoding="utf-8") as f:
             records = [json.loads(line) for line in f.read().splitlines()]
         self.assertEqual(sorted(r["i"] for r in records), list(range(20)))
 
+    async def test_aclose_writes_buffered_records(self):
+        path = await self.manager.log({"a": 1})
+        await self.manager.aclose()
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.read()), {"a": 1})
+
+    async def test_separate_files_get_separate_writers(self):
+        path1 = await self.manager.log({"a": 1})
+        path2 = await self.manager.log({"b": 2}, filename="other.txt")
+        await self.manager.flush()
+        self.assertNotEqual(path1, path2)
+        with open(path2, encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.read()), {"b": 2})
+
 
 class TestSaveFiles(_TempManagerTestCase):
 
     async def test_single_file(self):
-        paths = await self.manager.save_files("My Title", [(b"data", "jpg")])
+        paths = await self.manager.save_files(
+            "My Title", await self._staged((b"data", "jpg"))
+        )
         self.assertEqual(len(paths), 1)
         self.assertTrue(paths[0].endswith("My Title.jpg"))
         with open(paths[0], "rb") as f:
@@ -74,7 +102,9 @@ class TestSaveFiles(_TempManagerTestCase):
         self.assertEqual(await self.manager.save_files("t", []), [])
 
     async def test_album_creates_dir_and_numbered_files(self):
-        paths = await self.manager.save_files("Album", [(b"a", "jpg"), (b"b", "png")])
+        paths = await self.manager.save_files(
+            "Album", await self._staged((b"a", "jpg"), (b"b", "png"))
+        )
         self.assertEqual(len(paths), 2)
         self.assertTrue(paths[0].endswith(os.path.join("Album", "0.jpg")))
         self.assertTrue(paths[1].endswith(os.path.join("Album", "1.png")))
@@ -84,20 +114,367 @@ class TestSaveFiles(_TempManagerTestCase):
             self.assertEqual(f.read(), b"b")
 
     async def test_unique_filename_on_collision(self):
-        await self.manager.save_files("Dup", [(b"1", "jpg")])
-        paths = await self.manager.save_files("Dup", [(b"2", "jpg")])
+        await self.manager.save_files("Dup", await self._staged((b"1", "jpg")))
+        paths = await self.manager.save_files("Dup", await self._staged((b"2", "jpg")))
         self.assertTrue(paths[0].endswith("Dup (1).jpg"))
 
     async def test_invalid_chars_in_title(self):
-        paths = await self.manager.save_files("a/b:c", [(b"x", "jpg")])
+        paths = await self.manager.save_files(
+            "a/b:c", await self._staged((b"x", "jpg"))
+        )
         self.assertTrue(paths[0].endswith("a_b_c.jpg"))
 
 
+class TestStage(_TempManagerTestCase):
+
+    async def test_writes_chunks_in_order(self):
+        path = await self.manager.stage(async_iter([b"ab", b"cd", b"ef"]))
+        self.assertTrue(path.startswith(self.manager.staging))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"abcdef")
+
+    async def test_each_stage_gets_its_own_file(self):
+        a = await self.manager.stage(async_iter([b"a"]))
+        b = await self.manager.stage(async_iter([b"b"]))
+        self.assertNotEqual(a, b)
+
+    async def test_failed_stream_leaves_nothing_behind(self):
+        async def broken():
+            yield b"partial"
+            raise ConnectionError("dropped")
+
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(broken())
+        self.assertEqual(os.listdir(self.manager.staging), [])
+
+    async def test_save_moves_staged_file(self):
+        staged = await self._staged((b"x", "jpg"))
+        await self.manager.save_files("T", staged)
+        self.assertFalse(os.path.exists(staged[0][0]))
+
+    async def test_discard(self):
+        staged = await self._staged((b"x", "jpg"))
+        await self.manager.discard(staged + [("/nonexistent/file.part", "jpg")])
+        self.assertEqual(os.listdir(self.manager.staging), [])
+
+    async def test_aclose_removes_empty_staging(self):
+        await self.manager.save_files("T", await self._staged((b"x", "jpg")))
+        await self.manager.aclose()
+        self.assertFalse(os.path.exists(self.manager.staging))
+
+    async def test_aclose_keeps_nonempty_staging(self):
+        await self._staged((b"x", "jpg"))
+        await self.manager.aclose()
+        self.assertEqual(len(os.listdir(self.manager.staging)), 1)
+
+    async def test_aclose_without_staging(self):
+        await self.manager.aclose()  # nothing was ever staged
+
+
+class TestResumableStage(_TempManagerTestCase):
+
+    url = "https://i.redd.it/a.jpg"
+
+    @staticmethod
+    async def _broken(*chunks):
+        for chunk in chunks:
+            yield chunk
+        raise ConnectionError("dropped")
+
+    async def test_failed_stream_is_kept_for_resuming(self):
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(
+                self._broken(b"part"), url=self.url, validator='"v1"'
+            )
+        self.assertEqual(await self.manager.partial(self.url), (4, '"v1"'))
+
+    async def test_nothing_to_resume_without_validator(self):
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(self._broken(b"part"), url=self.url)
+        self.assertIsNone(await self.manager.partial(self.url))
+        self.assertEqual(os.listdir(self.manager.staging), [])
+
+    async def test_resumes_from_offset(self):
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(
+                self._broken(b"part", b"junk"), url=self.url, validator='"v1"'
+            )
+        # only the first 4 bytes are to be kept: the rest starts from there
+        path = await self.manager.stage(
+            async_iter([b"ial"]), url=self.url, validator='"v1"', offset=4
+        )
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"partial")
+        # complete: nothing is left to resume, and nothing else is left behind
+        self.assertIsNone(await self.manager.partial(self.url))
+        self.assertEqual(os.listdir(self.manager.staging), [os.path.basename(path)])
+
+    async def test_restart_overwrites_what_was_kept(self):
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(
+                self._broken(b"stale"), url=self.url, validator='"v1"'
+            )
+        path = await self.manager.stage(
+            async_iter([b"fresh"]), url=self.url, validator='"v2"'
+        )
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"fresh")
+
+    async def test_partial_is_per_url(self):
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(
+                self._broken(b"part"), url=self.url, validator='"v1"'
+            )
+        self.assertIsNone(await self.manager.partial("https://i.redd.it/b.jpg"))
+
+    async def test_partial_head(self):
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(
+                self._broken(b"part"), url=self.url, validator='"v1"'
+            )
+        self.assertEqual(await self.manager.partial_head(self.url, 2), b"pa")
+        self.assertEqual(await self.manager.partial_head("https://i.redd.it/b", 2), b"")
+
+    async def test_drop_partial(self):
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(
+                self._broken(b"part"), url=self.url, validator='"v1"'
+            )
+        await self.manager.drop_partial(self.url)
+        self.assertIsNone(await self.manager.partial(self.url))
+        self.assertEqual(os.listdir(self.manager.staging), [])
+
+    async def test_run_directory_is_reused(self):
+        manager = UniqueDirectoryFileManager(
+            self._tmp.name, run_directory=self.manager.directory
+        )
+        self.assertEqual(manager.directory, self.manager.directory)
+
+    def test_missing_run_directory(self):
+        with self.assertRaises(FileNotFoundError):
+            UniqueDirectoryFileManager("out", run_directory="out/nope")
+
+
+class TestWriteAt(_TempManagerTestCase):
+
+    async def test_pieces_land_at_their_offsets(self):
+        path = await self.manager.preallocate(6)
+        self.assertEqual(os.path.getsize(path), 6)
+        await asyncio.gather(
+            self.manager.write_at(path, 3, async_iter([b"d", b"ef"])),
+            self.manager.write_at(path, 0, async_iter([b"abc"])),
+        )
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"abcdef")
+        self.assertEqual(await self.manager.seal(path), path)
+
+    async def test_counts_against_budget(self):
+        self.manager.budget = ByteBudget(100)
+        path = await self.manager.preallocate(4)
+        await self.manager.write_at(path, 0, async_iter([b"ab", b"cd"]))
+        self.assertEqual(self.manager.budget.available, 100)
+
+    async def test_resumable_pieces_are_remembered(self):
+        url = "https://v.redd.it/big.mp4"
+        path = await self.manager.preallocate(
+            6, url=url, validator='"v1"', extension=".mp4"
+        )
+        await self.manager.write_at(path, 3, async_iter([b"def"]))
+        await self.manager.written(path, 3, 6)
+        staged = await self.manager.preallocated(url)
+        assert staged is not None
+        self.assertEqual(
+            (staged.path, staged.length, staged.validator, staged.extension),
+            (path, 6, '"v1"', ".mp4"),
+        )
+        self.assertEqual(staged.written, {(3, 6)})
+        # it isn't a prefix to continue from
+        self.assertIsNone(await self.manager.partial(url))
+
+        await self.manager.write_at(path, 0, async_iter([b"abc"]))
+        sealed = await self.manager.seal(path)
+        with open(sealed, "rb") as f:
+            self.assertEqual(f.read(), b"abcdef")
+        self.assertIsNone(await self.manager.preallocated(url))
+        self.assertEqual(os.listdir(self.manager.staging), [os.path.basename(sealed)])
+
+    async def test_nothing_preallocated_without_validator(self):
+        url = "https://v.redd.it/big.mp4"
+        path = await self.manager.preallocate(6, url=url)
+        await self.manager.written(path, 0, 6)
+        self.assertIsNone(await self.manager.preallocated(url))
+
+
+class TestClone(_TempManagerTestCase):
+
+    async def test_each_copy_is_saved_separately(self):
+        [(staged, extension)] = await self._staged((b"shared", "jpg"))
+        clone = await self.manager.clone(staged)
+        [a] = await self.manager.save_files("A", [(staged, extension)])
+        [b] = await self.manager.save_files("B", [(clone, extension)])
+        for path in (a, b):
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"shared")
+
+
+class TestStageWithBudget(_TempManagerTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.budget = self.manager.budget = ByteBudget(10)
+
+    async def test_budget_is_free_once_written(self):
+        reserved = await self.manager.reserve(6)
+        self.assertEqual(self.budget.available, 4)
+        await self.manager.stage(async_iter([b"abc", b"def"]), reserved)
+        self.assertEqual(self.budget.available, 10)
+
+    async def test_unknown_length_is_reserved_per_chunk(self):
+        budget = self.budget
+        with patch.object(budget, "acquire", wraps=budget.acquire) as acquire:
+            path = await self.manager.stage(async_iter([b"abcd", b"efgh"]))
+        self.assertEqual([c.args for c in acquire.await_args_list], [(4,), (4,)])
+        self.assertEqual(budget.available, 10)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"abcdefgh")
+
+    async def test_unused_reservation_is_returned(self):
+        # the server promised more than it sent
+        reserved = await self.manager.reserve(8)
+        await self.manager.stage(async_iter([b"ab"]), reserved)
+        self.assertEqual(self.budget.available, 10)
+
+    async def test_failed_stream_returns_its_bytes(self):
+        async def broken():
+            yield b"abcd"
+            raise ConnectionError("dropped")
+
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(broken(), await self.manager.reserve(8))
+        self.assertEqual(self.budget.available, 10)
+
+    async def test_reserve_without_budget(self):
+        self.manager.budget = None
+        self.assertEqual(await self.manager.reserve(100), 0)
+
+
+class TestDedupe(_TempManagerTestCase):
+
+    dedupe = True
+
+    def _objects(self):
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.manager.objects)
+            for name in names
+        ]
+
+    async def test_identical_content_is_stored_once(self):
+        [a] = await self.manager.save_files("A", await self._staged((b"same", "jpg")))
+        [b] = await self.manager.save_files("B", await self._staged((b"same", "jpg")))
+        [stored] = self._objects()
+        self.assertEqual(os.stat(a).st_ino, os.stat(stored).st_ino)
+        self.assertEqual(os.stat(b).st_ino, os.stat(stored).st_ino)
+        self.assertEqual(os.stat(stored).st_nlink, 3)
+        with open(b, "rb") as f:
+            self.assertEqual(f.read(), b"same")
+
+    async def test_clone_is_stored_once_too(self):
+        [(staged, extension)] = await self._staged((b"shared", "jpg"))
+        clone = await self.manager.clone(staged)
+        await self.manager.save_files("A", [(staged, extension)])
+        [b] = await self.manager.save_files("B", [(clone, extension)])
+        [stored] = self._objects()
+        self.assertEqual(os.stat(b).st_ino, os.stat(stored).st_ino)
+
+    async def test_store_is_sharded_by_hash(self):
+        await self.manager.save_files("A", await self._staged((b"data", "jpg")))
+        digest = hashlib.sha256(b"data").hexdigest()
+        objects = self.manager.objects
+        assert objects is not None
+        self.assertEqual(
+            self._objects(),
+            [os.path.join(objects, digest[:2], digest[2:4], f"{digest}.jpg")],
+        )
+
+    async def test_album_members_are_stored(self):
+        paths = await self.manager.save_files(
+            "Album", await self._staged((b"a", "jpg"), (b"b", "png"), (b"a", "jpg"))
+        )
+        self.assertEqual(len(self._objects()), 2)
+        self.assertEqual(os.stat(paths[0]).st_ino, os.stat(paths[2]).st_ino)
+
+    async def test_store_is_shared_by_later_runs(self):
+        await self.manager.save_files("A", await self._staged((b"same", "jpg")))
+        with patch("src.core.file_manager.datetime") as mock_datetime:
+            mock_datetime.today.return_value = datetime(2000, 1, 1)
+            later = UniqueDirectoryFileManager(self._tmp.name, dedupe=True)
+        staged = await later.stage(async_iter([b"same"]))
+        await later.save_files("A", [(staged, "jpg")])
+        self.assertEqual(len(self._objects()), 1)
+
+    async def test_falls_back_to_copy_without_hardlinks(self):
+        with patch("aiofiles.os.link", side_effect=OSError("not supported")):
+            [path] = await self.manager.save_files(
+                "A", await self._staged((b"data", "jpg"))
+            )
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"data")
+
+    async def test_resumed_body_is_hashed_whole(self):
+        url = "https://i.redd.it/a.jpg"
+
+        async def broken():
+            yield b"part"
+            raise ConnectionError("dropped")
+
+        with self.assertRaises(ConnectionError):
+            await self.manager.stage(broken(), url=url, validator='"v1"')
+        staged = await self.manager.stage(
+            async_iter([b"ial"]), url=url, validator='"v1"', offset=4
+        )
+        await self.manager.save_files("T", [(staged, "jpg")])
+        digest = hashlib.sha256(b"partial").hexdigest()
+        [stored] = self._objects()
+        self.assertEqual(os.path.basename(stored), f"{digest}.jpg")
+
+    async def test_sealed_file_is_hashed(self):
+        path = await self.manager.preallocate(4)
+        await self.manager.write_at(path, 0, async_iter([b"data"]))
+        await self.manager.save_files("T", [(await self.manager.seal(path), "jpg")])
+        [stored] = self._objects()
+        digest = hashlib.sha256(b"data").hexdigest()
+        self.assertEqual(os.path.basename(stored), f"{digest}.jpg")
+
+    async def test_discard_forgets_hash(self):
+        downloads = await self._staged((b"data", "jpg"))
+        await self.manager.discard(downloads)
+        self.assertEqual(self.manager._digests, {})
+
+    async def test_no_store_without_dedupe(self):
+        manager = UniqueDirectoryFileManager(os.path.join(self._tmp.name, "plain"))
+        staged = await manager.stage(async_iter([b"data"]))
+        [path] = await manager.save_files("A", [(staged, "jpg")])
+        self.assertIsNone(manager.objects)
+        self.assertEqual(os.stat(path).st_nlink, 1)
+
+
 class TestSaveFilesOrganized(_TempManagerTestCase):
     organize = True
 
+    async def test_organized_album_goes_in_subreddit_dir(self):
+        paths = await self.manager.save_files(
+            "A", await self._staged((b"a", "jpg"), (b"b", "jpg")), subreddit="pics"
+        )
+        self.assertEqual(
+            os.path.dirname(paths[0]),
+            os.path.join(self.manager.directory, "pics", "A"),
+        )
+
     async def test_organize_creates_subreddit_dir(self):
-        paths = await self.manager.save_files("T", [(b"x", "jpg")], subreddit="pics")
+        paths = await self.manager.save_files(
+            "T", await self._staged((b"x", "jpg")), subreddit="pics"
+        )
         self.assertIn(os.path.join("pics", "T.jpg"), paths[0])
 
 
@@ -131,6 +508,61 @@ class TestGetUniqueFilepath(_TempManagerTestCase):
         self.assertTrue(path.endswith("a_b_c.jpg"))
 
 
+class TestNameRegistry(_TempManagerTestCase):
+
+    async def test_directory_is_listed_once(self):
+        with patch(
+            "aiofiles.os.listdir", new_callable=AsyncMock, return_value=[]
+        ) as listdir:
+            for _ in range(5):
+                await self.manager.get_unique_filepath(
+                    self.manager.directory, "title", "jpg"
+                )
+        listdir.assert_awaited_once_with(self.manager.directory)
+
+    async def test_names_are_unique_without_touching_disk(self):
+        # nothing is written between calls, yet every claimed name is distinct
+        paths = [
+            await self.manager.get_unique_filepath(
+                self.manager.directory, "title", "jpg"
+            )
+            for _ in range(3)
+        ]
+        self.assertEqual(
+            [os.path.basename(p) for p in paths],
+            ["title.jpg", "title (1).jpg", "title (2).jpg"],
+        )
+
+    async def test_concurrent_saves_get_distinct_names(self):
+        paths = await asyncio.gather(
+            *(
+                self.manager.get_unique_filepath(self.manager.directory, "t", "jpg")
+                for _ in range(20)
+            )
+        )
+        self.assertEqual(len(set(paths)), 20)
+
+    async def test_counter_skips_names_taken_otherwise(self):
+        # "title (1).jpg" was taken by a post literally titled "title (1)"
+        await self.manager.get_unique_filepath(self.manager.directory, "title", "jpg")
+        await self.manager.get_unique_filepath(
+            self.manager.directory, "title (1)", "jpg"
+        )
+        path = await self.manager.get_unique_filepath(
+            self.manager.directory, "title", "jpg"
+        )
+        self.assertTrue(path.endswith("title (2).jpg"))
+
+    async def test_makedirs_is_cached(self):
+        staged = [
+            (await self.manager.stage(async_iter([b"x"])), "jpg") for _ in range(3)
+        ]
+        with patch("aiofiles.os.makedirs", new_callable=AsyncMock) as makedirs:
+            for download in staged:
+                await self.manager.save_files("T", [download])
+        makedirs.assert_not_awaited()  # the run directory already exists
+
+
 class TestGetUniqueDirname(_TempManagerTestCase):
 
     async def test_no_conflict(self):
@@ -143,6 +575,12 @@ class TestGetUniqueDirname(_TempManagerTestCase):
         dirname = await self.manager.get_unique_dirname("album")
         self.assertEqual(dirname, os.path.join(self.manager.directory, "album (0)"))
 
+    async def test_unique_within_parent(self):
+        parent = os.path.join(self.manager.directory, "pics")
+        os.makedirs(os.path.join(parent, "album"))
+        dirname = await self.manager.get_unique_dirname("album", parent)
+        self.assertEqual(dirname, os.path.join(parent, "album (0)"))
+
 
 class TestEnsureValidFilename(_TempManagerTestCase):
 
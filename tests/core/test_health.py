@@ -0,0 +1,109 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from src.core import CircuitBreaker, HostHealth
+
+
+def _request(url="https://a.com/x", method="GET"):
+    return httpx.Request(method, url)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_threshold_failures_in_a_row(self):
+        breaker = CircuitBreaker(threshold=3, cooldown=30)
+        for _ in range(2):
+            breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_the_count(self):
+        breaker = CircuitBreaker(threshold=2)
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        self.assertFalse(breaker.is_open)
+
+    def test_single_probe_after_cooldown(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=30)
+        breaker.failure()
+        with patch("time.monotonic", return_value=time.monotonic() + 31):
+            self.assertTrue(breaker.allow())  # the probe
+            self.assertFalse(breaker.allow())  # everyone else waits on it
+
+    def test_successful_probe_closes(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(threshold=5, cooldown=30)
+        for _ in range(5):
+            breaker.failure()
+        with patch("time.monotonic", return_value=time.monotonic() + 31):
+            self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+    def test_abandoned_probe_can_be_retried(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.abandon()
+        self.assertTrue(breaker.allow())
+
+
+class TestHostHealth(unittest.TestCase):
+
+    def test_failures_are_tracked_per_host(self):
+        health = HostHealth(threshold=2)
+        health.observe(_request("https://a.com/1"), None)
+        health.observe(_request("https://a.com/2"), 503)
+        self.assertTrue(health.breaker("a.com").is_open)
+        self.assertFalse(health.breaker("b.com").is_open)
+
+    def test_rate_limit_and_not_found_are_not_failures(self):
+        health = HostHealth(threshold=1)
+        health.observe(_request(), 429)
+        health.observe(_request(), 404)
+        self.assertFalse(health.breaker("a.com").is_open)
+
+    def test_dead_urls_are_cached(self):
+        health = HostHealth()
+        health.observe(_request("https://a.com/gone"), 404)
+        health.observe(_request("https://a.com/ok"), 200)
+        self.assertEqual(health.dead_status("https://a.com/gone"), 404)
+        self.assertIsNone(health.dead_status("https://a.com/ok"))
+
+    def test_only_gets_are_cached(self):
+        health = HostHealth()
+        health.observe(_request(method="POST"), 404)
+        self.assertIsNone(health.dead_status("https://a.com/x"))
+
+    def test_dead_entries_expire(self):
+        health = HostHealth(dead_ttl=10)
+        health.mark_dead("u", 410)
+        with patch("time.time", return_value=time.time() + 11):
+            self.assertIsNone(health.dead_status("u"))
+
+    def test_new_dead_is_taken_once(self):
+        health = HostHealth(dead_ttl=10)
+        health.load({"old": (404, time.time() + 5)})
+        health.mark_dead("new", 410)
+        [(url, status, expires)] = health.new_dead()
+        self.assertEqual((url, status), ("new", 410))
+        self.assertAlmostEqual(expires, time.time() + 10, delta=1)
+        self.assertEqual(list(health.new_dead()), [])
+        self.assertEqual(health.dead_status("old"), 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import unittest
+
+import httpx
+
+from src.core import Hedger
+
+
+def _client(*delays: float) -> tuple[httpx.AsyncClient, list[str]]:
+    """
+    A client whose n-th request answers after ``delays[n]`` seconds with body
+    b"n" (a negative delay raises a ConnectError after that long instead).
+    Also returns a log of what became of each request.
+    """
+    calls = iter(range(len(delays)))
+    log: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        n = next(calls)
+        try:
+            await asyncio.sleep(abs(delays[n]))
+        except asyncio.CancelledError:
+            log.append(f"{n} cancelled")
+            raise
+        if delays[n] < 0:
+            log.append(f"{n} failed")
+            raise httpx.ConnectError("refused", request=request)
+        log.append(f"{n} answered")
+        return httpx.Response(200, content=str(n).encode())
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), log
+
+
+def _warmed(latency: float = 0.01, **kwargs) -> Hedger:
+    """A hedger that's seen enough of a.com to hedge it after ~``latency``"""
+    hedger = Hedger(min_delay=0, **kwargs)
+    for _ in range(hedger.min_samples):
+        hedger.record("a.com", latency)
+    return hedger
+
+
+class TestHedger(unittest.IsolatedAsyncioTestCase):
+
+    def test_rejects_bad_percentile(self):
+        with self.assertRaises(ValueError):
+            Hedger(percentile=1)
+
+    def test_no_delay_until_enough_samples(self):
+        hedger = Hedger(min_samples=3)
+        hedger.record("a.com", 1.0)
+        hedger.record("a.com", 1.0)
+        self.assertIsNone(hedger.delay("a.com"))
+        hedger.record("a.com", 1.0)
+        self.assertEqual(hedger.delay("a.com"), 1.0)
+        self.assertIsNone(hedger.delay("b.com"))
+
+    def test_delay_is_the_percentile(self):
+        hedger = Hedger(percentile=0.9, min_samples=1, min_delay=0)
+        for latency in range(1, 11):
+            hedger.record("a.com", latency / 10)
+        self.assertEqual(hedger.delay("a.com"), 0.9)
+
+    def test_delay_has_a_floor(self):
+        hedger = Hedger(min_samples=1, min_delay=0.5)
+        hedger.record("a.com", 0.01)
+        self.assertEqual(hedger.delay("a.com"), 0.5)
+
+    def test_window_forgets_old_latencies(self):
+        hedger = Hedger(window=2, min_samples=1, min_delay=0)
+        for latency in (5.0, 0.1, 0.1):
+            hedger.record("a.com", latency)
+        self.assertEqual(hedger.delay("a.com"), 0.1)
+
+    async def test_fast_response_is_not_hedged(self):
+        client, log = _client(0)
+        hedger = _warmed(latency=1)
+        async with client, hedger.stream(client, "https://a.com/x") as response:
+            self.assertEqual(await response.aread(), b"0")
+        self.assertEqual(log, ["0 answered"])
+        self.assertEqual(hedger.hedged, 0)
+
+    async def test_slow_response_is_hedged_and_loser_cancelled(self):
+        client, log = _client(5, 0)
+        hedger = _warmed()
+        async with client, hedger.stream(client, "https://a.com/x") as response:
+            self.assertEqual(await response.aread(), b"1")
+        self.assertEqual(sorted(log), ["0 cancelled", "1 answered"])
+        self.assertEqual(hedger.hedged, 1)
+
+    async def test_original_can_still_win(self):
+        client, log = _client(0.05, 5)
+        hedger = _warmed()
+        async with client, hedger.stream(client, "https://a.com/x") as response:
+            self.assertEqual(await response.aread(), b"0")
+        self.assertEqual(sorted(log), ["0 answered", "1 cancelled"])
+
+    async def test_failed_request_waits_for_the_other(self):
+        client, _ = _client(-0.05, 0.1)
+        hedger = _warmed()
+        async with client, hedger.stream(client, "https://a.com/x") as response:
+            self.assertEqual(await response.aread(), b"1")
+
+    async def test_error_raised_when_every_request_fails(self):
+        client, _ = _client(-0.05, -0.1)
+        hedger = _warmed()
+        with self.assertRaises(httpx.ConnectError):
+            async with client:
+                await hedger.send(client, "https://a.com/x")
+
+    async def test_hedges_are_capped_by_budget(self):
+        client, log = _client(*[0.05] * 4)
+        # one hedge up front, then a twentieth of one per request
+        hedger = _warmed(ratio=0.05)
+        async with client:
+            for _ in range(2):
+                response = await hedger.send(client, "https://a.com/x")
+                await response.aclose()
+        self.assertEqual(hedger.hedged, 1)
+        self.assertEqual(len(log), 3)
+
+    async def test_cancelling_cancels_every_request(self):
+        client, log = _client(5, 5)
+        hedger = _warmed()
+        async with client:
+            task = asyncio.create_task(hedger.send(client, "https://a.com/x"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertEqual(log, ["0 cancelled", "1 cancelled"])
@@ -0,0 +1,338 @@
+import asyncio
+import time
+import unittest
+from email.utils import formatdate
+from unittest.mock import patch
+
+from src.core import (
+    AdaptiveLimit,
+    ByteBudget,
+    HostLimiter,
+    HostLimits,
+    RetryBudget,
+    TokenBucket,
+)
+
+
+class TestByteBudget(unittest.IsolatedAsyncioTestCase):
+
+    def test_rejects_empty_budget(self):
+        with self.assertRaises(ValueError):
+            ByteBudget(0)
+
+    async def test_acquire_and_release(self):
+        budget = ByteBudget(100)
+        self.assertEqual(await budget.acquire(60), 60)
+        self.assertEqual(budget.available, 40)
+        budget.release(60)
+        self.assertEqual(budget.available, 100)
+
+    async def test_try_acquire_never_waits(self):
+        budget = ByteBudget(100)
+        self.assertTrue(budget.try_acquire(60))
+        self.assertFalse(budget.try_acquire(50))
+        self.assertEqual(budget.available, 40)
+        # nor jumps ahead of anyone who is waiting
+        waiter = asyncio.create_task(budget.acquire(50))
+        await asyncio.sleep(0)
+        self.assertFalse(budget.try_acquire(10))
+        budget.release(60)
+        await waiter
+
+    async def test_nobody_waits_on_parked_bytes(self):
+        budget = ByteBudget(100)
+        self.assertTrue(budget.try_acquire(30))  # a body queued for download
+        await budget.acquire(50)
+        # clamped to what isn't parked, so it's granted once the 50 are back
+        waiter = asyncio.create_task(budget.acquire(1000))
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        budget.release(50)
+        self.assertEqual(await waiter, 70)
+
+    async def test_claimed_bytes_are_held_until_released(self):
+        budget = ByteBudget(100)
+        budget.try_acquire(30)
+        budget.claim(30)
+        self.assertEqual((budget.available, budget.parked), (70, 0))
+        budget.release(30)
+        self.assertEqual(budget.available, 100)
+
+    async def test_oversized_request_is_clamped(self):
+        budget = ByteBudget(100)
+        self.assertEqual(await budget.acquire(1000), 100)
+        self.assertEqual(budget.available, 0)
+
+    async def test_waits_until_bytes_are_released(self):
+        budget = ByteBudget(100)
+        await budget.acquire(80)
+        waiter = asyncio.create_task(budget.acquire(50))
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        budget.release(80)
+        self.assertEqual(await asyncio.wait_for(waiter, timeout=1), 50)
+        self.assertEqual(budget.available, 50)
+
+    async def test_waiters_are_served_in_order(self):
+        # a small request arriving later must not jump ahead of a big one
+        budget = ByteBudget(100)
+        await budget.acquire(100)
+        order = []
+
+        async def take(nbytes):
+            await budget.acquire(nbytes)
+            order.append(nbytes)
+
+        big = asyncio.create_task(take(90))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(take(10))
+        await asyncio.sleep(0)
+        budget.release(20)  # enough for small, not for big
+        await asyncio.sleep(0)
+        self.assertEqual(order, [])
+        budget.release(80)
+        await asyncio.wait_for(asyncio.gather(big, small), timeout=1)
+        self.assertEqual(order, [90, 10])
+
+    async def test_cancelled_waiter_gives_way(self):
+        budget = ByteBudget(100)
+        await budget.acquire(100)
+        blocked = asyncio.create_task(budget.acquire(90))
+        await asyncio.sleep(0)
+        behind = asyncio.create_task(budget.acquire(10))
+        await asyncio.sleep(0)
+        budget.release(10)
+        blocked.cancel()
+        self.assertEqual(await asyncio.wait_for(behind, timeout=1), 10)
+        self.assertEqual(budget.available, 0)
+
+
+class TestTokenBucket(unittest.IsolatedAsyncioTestCase):
+
+    def test_rejects_bad_parameters(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+        with self.assertRaises(ValueError):
+            TokenBucket(1, burst=0)
+
+    async def test_burst_is_immediate(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        with patch("asyncio.sleep") as sleep:
+            for _ in range(3):
+                await bucket.acquire()
+        sleep.assert_not_called()
+
+    async def test_waits_for_refill_past_burst(self):
+        bucket = TokenBucket(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        # two refills at 50/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.035)
+
+    async def test_pause_delays_tokens(self):
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.pause(0.05)
+        start = time.monotonic()
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+
+class TestAdaptiveLimit(unittest.IsolatedAsyncioTestCase):
+
+    def test_rejects_bad_bounds(self):
+        with self.assertRaises(ValueError):
+            AdaptiveLimit(initial=0)
+        with self.assertRaises(ValueError):
+            AdaptiveLimit(initial=5, maximum=4)
+        with self.assertRaises(ValueError):
+            AdaptiveLimit(initial=2, minimum=3)
+
+    def test_grows_by_about_one_per_round(self):
+        limit = AdaptiveLimit(initial=4)
+        for _ in range(4):
+            limit.record(ok=True)
+        self.assertEqual(limit.current, 4)
+        # 4 + 1/4 + ~1/4.25 + ... crosses 5 within the next round
+        for _ in range(2):
+            limit.record(ok=True)
+        self.assertEqual(limit.current, 5)
+
+    def test_failure_halves(self):
+        limit = AdaptiveLimit(initial=16)
+        limit.record(ok=False)
+        self.assertEqual(limit.current, 8)
+
+    def test_burst_of_failures_is_one_cut(self):
+        limit = AdaptiveLimit(initial=16)
+        limit.record(ok=True, latency=10)
+        for _ in range(5):
+            limit.record(ok=False)
+        self.assertEqual(limit.current, 8)
+
+    def test_stays_within_bounds(self):
+        limit = AdaptiveLimit(initial=2, minimum=2, maximum=3)
+        for _ in range(50):
+            limit.record(ok=True)
+        self.assertEqual(limit.current, 3)
+        with patch("time.monotonic", side_effect=range(50)):
+            for _ in range(50):
+                limit.record(ok=False)
+        self.assertEqual(limit.current, 2)
+
+    def test_rising_latency_backs_off(self):
+        limit = AdaptiveLimit(initial=10, maximum=10)
+        for _ in range(20):
+            limit.record(ok=True, latency=0.1)
+        self.assertEqual(limit.current, 10)
+        for _ in range(5):
+            limit.record(ok=True, latency=1.0)
+        self.assertLess(limit.current, 10)
+
+    async def test_caps_in_flight_at_current(self):
+        limit = AdaptiveLimit(initial=2)
+        await limit.acquire()
+        await limit.acquire()
+        blocked = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        self.assertFalse(blocked.done())
+        limit.release()
+        await asyncio.wait_for(blocked, timeout=1)
+        self.assertEqual(limit.in_flight, 2)
+
+    async def test_growth_admits_waiters(self):
+        limit = AdaptiveLimit(initial=1)
+        await limit.acquire()
+        blocked = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        limit.record(ok=True)
+        await asyncio.wait_for(blocked, timeout=1)
+        self.assertEqual(limit.in_flight, 2)
+
+    async def test_cancelled_waiter_gives_way(self):
+        limit = AdaptiveLimit(initial=1)
+        await limit.acquire()
+        blocked = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        behind = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        blocked.cancel()
+        limit.release()
+        await asyncio.wait_for(behind, timeout=1)
+        self.assertEqual(limit.in_flight, 1)
+
+
+class TestHostLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_caps_connections_per_host(self):
+        limiter = HostLimiter(connections=2, rate=1000, burst=100)
+        await limiter.acquire("a.com")
+        await limiter.acquire("a.com")
+        blocked = asyncio.create_task(limiter.acquire("a.com"))
+        # other hosts are unaffected
+        await asyncio.wait_for(limiter.acquire("b.com"), timeout=1)
+        await asyncio.sleep(0)
+        self.assertFalse(blocked.done())
+        limiter.release("a.com")
+        await asyncio.wait_for(blocked, timeout=1)
+
+    def test_connection_limit_adapts_per_host(self):
+        limiter = HostLimiter(connections=4, max_connections=8)
+        for _ in range(40):
+            limiter.record("fast.com", ok=True)
+        limiter.record("slow.com", ok=False)
+        self.assertEqual(limiter.limits(), {"fast.com": 8, "slow.com": 2})
+
+    async def test_hosts_can_have_their_own_limits(self):
+        cdn = HostLimits(connections=3, max_connections=3)
+        limiter = HostLimiter(connections=1, rate=1000, burst=100, hosts={"cdn": cdn})
+        for _ in range(3):
+            await asyncio.wait_for(limiter.acquire("cdn"), timeout=1)
+        await limiter.acquire("api")
+        self.assertEqual(limiter.limits(), {"cdn": 3, "api": 1})
+        self.assertEqual(limiter._host("cdn").bucket.rate, cdn.rate)
+
+    def _paused_for(self, limiter, host):
+        return limiter._host(host).bucket._paused_until - time.monotonic()
+
+    def test_retry_after_seconds(self):
+        limiter = HostLimiter()
+        limiter.observe("a.com", {"Retry-After": "5"})
+        self.assertAlmostEqual(self._paused_for(limiter, "a.com"), 5, delta=0.5)
+        self.assertLessEqual(self._paused_for(limiter, "b.com"), 0)
+
+    def test_retry_after_date(self):
+        limiter = HostLimiter()
+        limiter.observe("a.com", {"Retry-After": formatdate(time.time() + 10)})
+        self.assertAlmostEqual(self._paused_for(limiter, "a.com"), 10, delta=1.5)
+
+    def test_exhausted_ratelimit_pauses_until_reset(self):
+        limiter = HostLimiter()
+        limiter.observe(
+            "api.imgur.com",
+            {
+                "X-RateLimit-UserRemaining": "0",
+                "X-RateLimit-UserReset": str(int(time.time()) + 20),
+            },
+        )
+        self.assertAlmostEqual(
+            self._paused_for(limiter, "api.imgur.com"), 20, delta=1.5
+        )
+
+    def test_ratelimit_reset_in_seconds(self):
+        limiter = HostLimiter()
+        limiter.observe(
+            "a.com", {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "7"}
+        )
+        self.assertAlmostEqual(self._paused_for(limiter, "a.com"), 7, delta=0.5)
+
+    def test_remaining_quota_does_not_pause(self):
+        limiter = HostLimiter()
+        limiter.observe(
+            "a.com", {"X-RateLimit-Remaining": "12", "X-RateLimit-Reset": "7"}
+        )
+        self.assertLessEqual(self._paused_for(limiter, "a.com"), 0)
+
+    def test_pause_is_capped(self):
+        limiter = HostLimiter(max_pause=30)
+        limiter.observe("a.com", {"Retry-After": "3600"})
+        self.assertLessEqual(self._paused_for(limiter, "a.com"), 30)
+
+    def test_garbage_headers_are_ignored(self):
+        limiter = HostLimiter()
+        limiter.observe(
+            "a.com", {"Retry-After": "soon", "X-RateLimit-Remaining": "lots"}
+        )
+        self.assertLessEqual(self._paused_for(limiter, "a.com"), 0)
+
+
+class TestRetryBudget(unittest.TestCase):
+
+    def test_initial_retries(self):
+        budget = RetryBudget(ratio=0, initial=2)
+        self.assertTrue(budget.spend())
+        self.assertTrue(budget.spend())
+        self.assertFalse(budget.spend())
+
+    def test_requests_earn_retries(self):
+        budget = RetryBudget(ratio=0.5, initial=0)
+        self.assertFalse(budget.spend())
+        budget.record(4)
+        self.assertTrue(budget.spend(2))
+        self.assertFalse(budget.spend())
+
+    def test_all_or_nothing(self):
+        budget = RetryBudget(ratio=0, initial=1)
+        self.assertFalse(budget.spend(2))
+        self.assertTrue(budget.spend(1))
+
+    def test_earnings_are_capped(self):
+        # a long healthy stretch mustn't bank an unlimited storm
+        budget = RetryBudget(ratio=1, initial=0, cap=3)
+        budget.record(100)
+        self.assertTrue(budget.spend(3))
+        self.assertFalse(budget.spend())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.core import JsonLogWriter
+
+
+class TestJsonLogWriter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "log.txt")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _records(self):
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f.read().splitlines()]
+
+    async def test_flush_writes_queued_records_in_order(self):
+        writer = JsonLogWriter(self.path, interval=60)
+        for i in range(5):
+            await writer.write({"i": i})
+        await writer.flush()
+        self.assertEqual(self._records(), [{"i": i} for i in range(5)])
+        await writer.aclose()
+
+    async def test_full_batch_is_written_without_flush(self):
+        writer = JsonLogWriter(self.path, batch_size=3, interval=60)
+        for i in range(3):
+            await writer.write({"i": i})
+        # the batch is full, so it goes out without waiting on the interval
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            if os.path.exists(self.path) and len(self._records()) == 3:
+                break
+        self.assertEqual(len(self._records()), 3)
+        await writer.aclose()
+
+    async def test_partial_batch_is_written_after_interval(self):
+        writer = JsonLogWriter(self.path, interval=0.01)
+        await writer.write({"a": 1})
+        await asyncio.sleep(0.2)
+        self.assertEqual(self._records(), [{"a": 1}])
+        await writer.aclose()
+
+    async def test_aclose_writes_and_stops(self):
+        writer = JsonLogWriter(self.path, interval=60)
+        await writer.write({"a": 1})
+        await writer.aclose()
+        self.assertEqual(self._records(), [{"a": 1}])
+        self.assertIsNone(writer._task)
+
+    async def test_flush_and_close_without_records_create_nothing(self):
+        writer = JsonLogWriter(self.path)
+        await writer.flush()
+        await writer.aclose()
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_unserializable_record_raises_immediately(self):
+        writer = JsonLogWriter(self.path)
+        with self.assertRaises(TypeError):
+            await writer.write({"bad": object()})
+        self.assertIsNone(writer._task)
+
+    async def test_write_error_is_raised_from_flush(self):
+        writer = JsonLogWriter(self.path, interval=60)
+        await writer.write({"a": 1})
+        await writer.flush()
+        with patch("aiofiles.threadpool.text.AsyncTextIOWrapper.write") as write:
+            write.side_effect = OSError("disk full")
+            await writer.write({"b": 2})
+            with self.assertRaises(OSError):
+                await writer.flush()
+        # reported once; the writer keeps going afterwards
+        await writer.write({"c": 3})
+        await writer.aclose()
+        self.assertEqual(self._records(), [{"a": 1}, {"c": 3}])
+
+    async def test_unopenable_file_is_reported_without_hanging(self):
+        missing = os.path.join(self._tmp.name, "missing", "log.txt")
+        writer = JsonLogWriter(missing, batch_size=1, interval=60)
+        # more records than the queue holds
+        for i in range(20):
+            await asyncio.wait_for(writer.write({"i": i}), 1)
+        with self.assertRaises(FileNotFoundError):
+            await asyncio.wait_for(writer.flush(), 1)
+        with self.assertRaises(FileNotFoundError):
+            await asyncio.wait_for(writer.aclose(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+import asyncio
+import unittest
+from collections import Counter
+
+from src.core import AdaptiveLimit, Retry, Stage, run_stages
+from tests import async_iter
+
+
+class TestRunStages(unittest.IsolatedAsyncioTestCase):
+    # every run is wrapped in wait_for so a shutdown regression fails instead of
+    # hanging the whole suite
+
+    async def _run(self, source, stages):
+        await asyncio.wait_for(run_stages(source, stages), timeout=2)
+
+    async def test_items_flow_through_every_stage(self):
+        out = []
+
+        async def double(x):
+            return x * 2
+
+        async def collect(x):
+            out.append(x)
+
+        await self._run(
+            async_iter(range(5)),
+            [Stage("double", double, workers=3), Stage("collect", collect)],
+        )
+        self.assertEqual(Counter(out), Counter([0, 2, 4, 6, 8]))
+
+    async def test_none_drops_item(self):
+        out = []
+
+        async def evens(x):
+            return x if x % 2 == 0 else None
+
+        async def collect(x):
+            out.append(x)
+
+        await self._run(
+            async_iter(range(6)), [Stage("evens", evens), Stage("collect", collect)]
+        )
+        self.assertEqual(out, [0, 2, 4])
+
+    async def test_single_worker_keeps_order(self):
+        out = []
+
+        async def collect(x):
+            out.append(x)
+
+        await self._run(async_iter(range(20)), [Stage("collect", collect)])
+        self.assertEqual(out, list(range(20)))
+
+    async def test_empty_source(self):
+        async def fail(_):
+            raise AssertionError("no items expected")
+
+        await self._run(async_iter([]), [Stage("a", fail, workers=4), Stage("b", fail)])
+
+    async def test_no_stages(self):
+        await self._run(async_iter([1, 2]), [])
+
+    async def test_worker_count_bounds_concurrency(self):
+        active = peak = 0
+
+        async def slow(x):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.001)
+            active -= 1
+            return x
+
+        await self._run(async_iter(range(30)), [Stage("slow", slow, workers=4)])
+        self.assertEqual(peak, 4)
+
+    async def test_limit_bounds_concurrency_below_workers(self):
+        active = peak = 0
+
+        async def slow(x):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.001)
+            active -= 1
+            return x
+
+        # pinned where it started, so only the limit (not workers) caps it
+        limit = AdaptiveLimit(initial=2, maximum=8)
+        limit.record = lambda ok, latency=None: None
+        await self._run(
+            async_iter(range(30)), [Stage("slow", slow, workers=8, limit=limit)]
+        )
+        self.assertEqual(peak, 2)
+        self.assertEqual(limit.in_flight, 0)
+
+    async def test_limit_grows_on_success_and_backs_off_on_retry(self):
+        retried = set()
+
+        async def flaky(x):
+            if x >= 40 and x not in retried:
+                retried.add(x)
+                raise Retry()
+            return x
+
+        limit = AdaptiveLimit(initial=2, maximum=8)
+        await self._run(
+            async_iter(range(40)), [Stage("a", flaky, workers=8, limit=limit)]
+        )
+        self.assertEqual(limit.current, 8)
+        await self._run(
+            async_iter(range(40, 44)), [Stage("a", flaky, workers=8, limit=limit)]
+        )
+        self.assertLess(limit.current, 8)
+
+    async def test_slow_stage_backpressures_source(self):
+        # with a stalled last stage, the source must not be drained ahead of it
+        pulled = 0
+        release = asyncio.Event()
+
+        async def source():
+            nonlocal pulled
+            for i in range(100):
+                pulled += 1
+                yield i
+
+        async def passthrough(x):
+            return x
+
+        async def stalled(x):
+            await release.wait()
+
+        task = asyncio.create_task(
+            run_stages(
+                source(),
+                [
+                    Stage("a", passthrough, workers=2, queue_size=2),
+                    Stage("b", stalled, workers=1, queue_size=1),
+                ],
+            )
+        )
+        await asyncio.sleep(0.05)
+        # 1 in b's worker, 1 queued for b, 2 in a's workers, 2 queued for a,
+        #  plus the one the feeder is blocked on
+        self.assertLessEqual(pulled, 7)
+        release.set()
+        await asyncio.wait_for(task, timeout=2)
+        self.assertEqual(pulled, 100)
+
+    async def test_stage_error_propagates(self):
+        async def boom(x):
+            raise ValueError("boom")
+
+        with self.assertRaises(ExceptionGroup) as ctx:
+            await self._run(async_iter([1]), [Stage("boom", boom, workers=2)])
+        self.assertTrue(ctx.exception.subgroup(ValueError))
+
+    async def test_retry_runs_item_again(self):
+        tries = Counter()
+        out = []
+
+        async def flaky(x):
+            tries[x] += 1
+            if x == 1 and tries[x] < 3:
+                raise Retry(0)
+            return x
+
+        async def collect(x):
+            out.append(x)
+
+        # one worker: a retry must not deadlock the stage it's waiting on
+        await self._run(
+            async_iter(range(3)), [Stage("flaky", flaky), Stage("collect", collect)]
+        )
+        self.assertEqual(sorted(out), [0, 1, 2])
+        self.assertEqual(tries[1], 3)
+
+    async def test_retry_frees_the_worker_during_its_delay(self):
+        out = []
+
+        async def first_waits(x):
+            if x == 0 and 0 not in out:
+                out.append(0)
+                raise Retry(0.2)
+            out.append(x)
+
+        await self._run(async_iter(range(3)), [Stage("a", first_waits)])
+        # the single worker moved on while item 0 waited out its delay
+        self.assertEqual(out, [0, 1, 2, 0])
+
+    async def test_stage_waits_for_pending_retries(self):
+        done = []
+
+        async def slow_retry(x):
+            if not done:
+                done.append("retried")
+                raise Retry(0.1)
+            return x
+
+        async def collect(x):
+            done.append(x)
+
+        await self._run(async_iter([7]), [Stage("a", slow_retry), Stage("b", collect)])
+        self.assertEqual(done, ["retried", 7])
@@ -0,0 +1,32 @@
+import unittest
+
+from src.core import SeenSet
+
+
+class TestSeenSet(unittest.TestCase):
+
+    def test_remembers_what_was_added(self):
+        seen = SeenSet()
+        seen.add("a")
+        self.assertIn("a", seen)
+        self.assertNotIn("b", seen)
+
+    def test_bounded_by_forgetting_the_oldest(self):
+        seen = SeenSet(capacity=2)
+        for key in "abc":
+            seen.add(key)
+        self.assertEqual(len(seen), 2)
+        self.assertNotIn("a", seen)
+        self.assertIn("c", seen)
+
+    def test_seeing_again_makes_recent(self):
+        seen = SeenSet(capacity=2)
+        for key in "aba":
+            seen.add(key)
+        seen.add("c")
+        self.assertIn("a", seen)
+        self.assertNotIn("b", seen)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+
+from src.core import SingleFlight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def _call(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.calls
+
+    async def _started(self, *keys):
+        """Starts a call per key, and lets them all reach the flight"""
+        tasks = [asyncio.create_task(self.flights.do(key, self._call)) for key in keys]
+        await asyncio.sleep(0)
+        return tasks
+
+    async def test_concurrent_calls_share_one(self):
+        tasks = await self._started("a", "a", "a")
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*tasks), [1, 1, 1])
+        self.assertEqual((self.calls, self.flights.coalesced), (1, 2))
+
+    async def test_different_keys_are_separate(self):
+        tasks = await self._started("a", "b")
+        self.release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.calls, 2)
+
+    async def test_finished_call_is_not_reused(self):
+        self.release.set()
+        await self.flights.do("a", self._call)
+        self.assertEqual(await self.flights.do("a", self._call), 2)
+
+    async def test_error_is_shared(self):
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("nope")
+
+        tasks = [asyncio.create_task(self.flights.do("a", fail)) for _ in range(2)]
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            self.assertIsInstance(result, ValueError)
+
+    async def test_waiters_get_what_share_makes(self):
+        async def share(result):
+            return result * 10
+
+        leader = asyncio.create_task(self.flights.do("a", self._call, share))
+        waiter = asyncio.create_task(self.flights.do("a", self._call, share))
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await asyncio.gather(leader, waiter), [1, 10])
+
+    async def test_cancelled_call_is_taken_over_by_a_waiter(self):
+        leader, waiter = await self._started("a", "a")
+        leader.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await waiter, 2)
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+    async def test_cancelled_waiter_leaves_the_call_running(self):
+        leader, waiter = await self._started("a", "a")
+        waiter.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await leader, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
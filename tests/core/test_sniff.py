@@ -0,0 +1,56 @@
+import unittest
+
+import httpx
+
+from src.core import media_extension, sniff_extension
+
+
+def _response(content_type: str | None) -> httpx.Response:
+    headers = {} if content_type is None else {"Content-Type": content_type}
+    return httpx.Response(200, headers=headers)
+
+
+class TestSniffExtension(unittest.TestCase):
+
+    def test_recognizes_media(self):
+        heads = {
+            b"\xff\xd8\xff\xe0\x00\x10JFIF": ".jpg",
+            b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR": ".png",
+            b"GIF89a\x01\x00": ".gif",
+            b"RIFF\x24\x00\x00\x00WEBPVP8 ": ".webp",
+            b"\x00\x00\x00\x18ftypmp42": ".mp4",
+            b"\x00\x00\x00\x14ftypqt  ": ".mov",
+            b"\x00\x00\x00\x1cftypavif": ".avif",
+            b"\x1aE\xdf\xa3\x9fB\x86\x81": ".webm",
+        }
+        for head, extension in heads.items():
+            with self.subTest(extension=extension):
+                self.assertEqual(sniff_extension(head), extension)
+
+    def test_unknown_or_short_head(self):
+        self.assertIsNone(sniff_extension(b"<!DOCTYPE html>"))
+        self.assertIsNone(sniff_extension(b"RIFF\x24\x00\x00\x00WAVE"))
+        self.assertIsNone(sniff_extension(b""))
+
+
+class TestMediaExtension(unittest.TestCase):
+
+    def test_sniffed_format_wins_over_content_type(self):
+        head = b"\x89PNG\r\n\x1a\n"
+        self.assertEqual(media_extension(head, _response("image/jpeg")), ".png")
+        self.assertEqual(media_extension(head, _response("text/html")), ".png")
+
+    def test_html_error_page_is_rejected(self):
+        head = b"<!DOCTYPE html><html>"
+        self.assertIsNone(media_extension(head, _response("text/html")))
+        # even when it claims to be an image
+        self.assertIsNone(media_extension(b"\n  " + head, _response("image/jpeg")))
+
+    def test_unsniffed_media_falls_back_to_content_type(self):
+        head = b"\x00\x00\x01\x00\x01\x00"  # an icon
+        response = _response("image/x-icon; charset=binary")
+        self.assertEqual(media_extension(head, response), ".x-icon")
+
+    def test_unsniffed_non_media_is_rejected(self):
+        self.assertIsNone(media_extension(b"PK\x03\x04", _response("application/zip")))
+        self.assertIsNone(media_extension(b"\x00\x01", _response(None)))
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from src.core import StallError, watch_throughput
+
+
+async def _timed(*chunks: tuple[float, bytes]):
+    """Yields each chunk once the (patched) clock reads its time"""
+    for at, chunk in chunks:
+        _clock.now = at
+        yield chunk
+
+
+class _Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+_clock = _Clock()
+
+
+class TestWatchThroughput(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        _clock.now = 0.0
+        patcher = patch("src.core.throughput.time", monotonic=_clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _drain(self, *chunks, min_rate=100, window=5):
+        return [
+            chunk async for chunk in watch_throughput(_timed(*chunks), min_rate, window)
+        ]
+
+    async def test_passes_chunks_through(self):
+        chunks = [(1, b"a" * 500), (2, b"b" * 500)]
+        self.assertEqual(await self._drain(*chunks), [b"a" * 500, b"b" * 500])
+
+    async def test_large_body_may_take_as_long_as_it_keeps_moving(self):
+        # 200 B/s for a minute: far past any fixed deadline, but never slow
+        chunks = [(second, b"x" * 200) for second in range(1, 61)]
+        self.assertEqual(len(await self._drain(*chunks)), 60)
+
+    async def test_trickle_is_a_stall(self):
+        chunks = [(second, b"x" * 10) for second in range(1, 61)]
+        with self.assertRaises(StallError):
+            await self._drain(*chunks)
+
+    async def test_time_spent_by_the_consumer_is_not_a_stall(self):
+        async def steady():
+            # 200 B/s from the network...
+            for _ in range(10):
+                _clock.now += 1
+                yield b"x" * 200
+
+        received = 0
+        async for _ in watch_throughput(steady(), 100, 5):
+            # ...but each chunk then waits 10s on the consumer (a full budget)
+            _clock.now += 10
+            received += 1
+        self.assertEqual(received, 10)
+
+    async def test_stall_is_detected_after_about_a_window(self):
+        received = 0
+        chunks = [(second, b"x" * 10) for second in range(1, 61)]
+        with self.assertRaises(StallError):
+            async for _ in watch_throughput(_timed(*chunks), 100, 5):
+                received += 1
+        self.assertEqual(received, 4)
+
+    async def test_slowdown_midway_is_a_stall(self):
+        fast = [(second, b"x" * 1000) for second in range(1, 11)]
+        slow = [(second, b"x") for second in range(11, 30)]
+        with self.assertRaises(StallError):
+            await self._drain(*fast, *slow)
+
+    async def test_small_body_finishing_within_a_window_is_never_judged(self):
+        self.assertEqual(await self._drain((4, b"x")), [b"x"])
+
+    def test_stall_is_a_read_timeout(self):
+        # so callers treat it like any other timeout (retry, or give up)
+        self.assertTrue(issubclass(StallError, httpx.ReadTimeout))
@@ -23,6 +23,13 @@ class TestBuildParser(unittest.TestCase):
         self.assertIsNone(args.hours)
         self.assertIsNone(args.days)
         self.assertIsNone(args.years)
+        self.assertEqual(args.max_inflight_mb, 256)
+        self.assertTrue(args.catalog)
+        self.assertFalse(args.dedupe)
+        self.assertFalse(args.http2)
+        self.assertFalse(args.hedge)
+        self.assertIsNone(args.resume)
+        self.assertIsNone(args.max_size_mb)
 
     def test_subreddit_is_repeatable(self):
         args = self.parser.parse_args(["-r", "pics", "-r", "art"])
@@ -54,9 +61,33 @@ class TestBuildParser(unittest.TestCase):
     def test_nolog_disables_logging(self):
         self.assertFalse(self.parser.parse_args(["--nolog"]).log)
 
+    def test_nocatalog_disables_catalog(self):
+        self.assertFalse(self.parser.parse_args(["--nocatalog"]).catalog)
+
+    def test_dedupe_flag(self):
+        self.assertTrue(self.parser.parse_args(["--dedupe"]).dedupe)
+
+    def test_http2_flag(self):
+        self.assertTrue(self.parser.parse_args(["--http2"]).http2)
+
+    def test_hedge_flag(self):
+        self.assertTrue(self.parser.parse_args(["--hedge"]).hedge)
+
+    def test_resume_takes_a_directory(self):
+        args = self.parser.parse_args(["--resume", "Output/PaperScraper 2026"])
+        self.assertEqual(args.resume, "Output/PaperScraper 2026")
+
     def test_unsave_flag(self):
         self.assertTrue(self.parser.parse_args(["--unsave"]).unsave)
 
+    def test_max_inflight_mb(self):
+        args = self.parser.parse_args(["--max-inflight-mb", "64"])
+        self.assertEqual(args.max_inflight_mb, 64)
+
+    def test_max_size_mb(self):
+        args = self.parser.parse_args(["--max-size-mb", "50"])
+        self.assertEqual(args.max_size_mb, 50)
+
     def test_age_flag(self):
         self.assertEqual(self.parser.parse_args(["--days", "7"]).days, 7)
 
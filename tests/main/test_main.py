@@ -1,17 +1,38 @@
 import asyncio
+import json
+import os
 import tempfile
 import time
 import unittest
 from argparse import Namespace
+from functools import partial
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from src.core import Catalog, Checkpoint, HostLimiter, Retry
 from src.main import (
+    CATALOG_FILENAME,
+    CHECKPOINT_FILENAME,
+    MAX_DOWNLOADS,
+    MAX_FINDERS,
+    Job,
+    RunStats,
     build_predicate,
+    build_stages,
     build_stream,
+    check,
+    checkpoint_options,
+    client_config,
+    concurrency_limits,
+    download,
+    finish,
+    guarded,
+    listing_floors,
     main,
     max_age_seconds,
-    process_download,
-    process_submission,
+    resolve,
+    resumed_args,
+    start_job,
+    store,
 )
 from src.reddit import SortOption
 from tests import async_iter
@@ -32,18 +53,49 @@ def _args(**overrides):
         "years": None,
         "log": False,
         "unsave": False,
+        "max_inflight_mb": 256,
+        "catalog": True,
+        "dedupe": False,
+        "http2": False,
+        "hedge": False,
+        "resume": None,
+        "max_size_mb": None,
+        "relist": False,
     }
     defaults.update(overrides)
     return Namespace(**defaults)
 
 
-def _fake_wrapped(title, subreddit="pics", downloads=None):
-    """A stand-in for SubmissionWrapper with async find_urls/download/unsave."""
+def _fake_wrapped(title, subreddit="pics", downloads=None, urls=()):
+    """
+    A stand-in for SubmissionWrapper with async find_urls/download/unsave.
+    ``downloads`` are (content, extension) pairs that download() stages through
+    the file manager it's given, like the real one.
+    """
+
+    async def download(
+        client,
+        file_manager,
+        retries=None,
+        hedger=None,
+        max_bytes=None,
+        flights=None,
+    ):
+        wrapped.downloaded = set(wrapped.urls)
+        return [
+            (await file_manager.stage(async_iter([content])), extension)
+            for content, extension in downloads or []
+        ]
+
     wrapped = MagicMock()
+    wrapped.id = title.lower()
+    wrapped.urls = set(urls)
+    wrapped.downloaded = set()
+    wrapped.unfinished = set()
     wrapped.title = title
     wrapped.subreddit = subreddit
     wrapped.find_urls = AsyncMock()
-    wrapped.download = AsyncMock(return_value=downloads or [])
+    wrapped.download = AsyncMock(side_effect=download)
     wrapped.unsave = AsyncMock()
     wrapped.log_record = MagicMock(
         return_value={"title": title, "recognized_urls": [], "exception": ""}
@@ -71,6 +123,20 @@ class TestBuildStream(unittest.IsolatedAsyncioTestCase):
         builder.build.assert_awaited_once_with(clients)
         self.assertEqual(result, builder.build.return_value)
 
+    async def test_floors_reach_the_builder(self):
+        with patch("src.main.StreamBuilder") as MockBuilder:
+            MockBuilder.return_value.build = AsyncMock()
+            await build_stream(
+                MagicMock(),
+                saved=False,
+                subreddits=["pics"],
+                sortby=SortOption.NEW,
+                limit=10,
+                predicate=lambda _: True,
+                floors={"score": 3},
+            )
+        self.assertEqual(MockBuilder.call_args.kwargs["floors"], {"score": 3})
+
     async def test_saved_prompts_for_credentials(self):
         clients = MagicMock()
         with (
@@ -92,119 +158,287 @@ class TestBuildStream(unittest.IsolatedAsyncioTestCase):
         builder.add_subreddit.assert_not_called()
 
 
-class TestProcessDownload(unittest.IsolatedAsyncioTestCase):
+class TestStages(unittest.IsolatedAsyncioTestCase):
 
-    async def test_saves_downloaded_files(self):
-        wrapped = _fake_wrapped("T", "pics", downloads=[(b"x", "jpg")])
-        file_manager = MagicMock()
-        file_manager.save_files = AsyncMock(return_value=["/out/T.jpg"])
+    async def test_resolve_uses_whole_bundle(self):
+        wrapped = _fake_wrapped("T")
+        clients = MagicMock()
+        await resolve(Job(wrapped), clients)
+        # find_urls gets the whole bundle (parsers use http AND reddit)
+        wrapped.find_urls.assert_awaited_once_with(clients, None)
+
+    async def test_download_stages_into_file_manager(self):
+        wrapped = _fake_wrapped("T", downloads=[(b"x", "jpg")])
+        job = Job(wrapped)
         client = MagicMock()
+        file_manager = MagicMock()
+        file_manager.stage = AsyncMock(return_value="/staging/1.part")
+
+        await download(job, client, file_manager)
 
-        result = await process_download(
-            wrapped, client, file_manager, asyncio.Semaphore(1)
+        wrapped.download.assert_awaited_once_with(
+            client, file_manager, None, None, None, None
         )
+        self.assertEqual(job.downloads, [("/staging/1.part", "jpg")])
+
+    async def test_store_saves_staged_downloads(self):
+        job = Job(_fake_wrapped("T", "pics"), downloads=[("/staging/1.part", "jpg")])
+        file_manager = MagicMock()
+        file_manager.save_files = AsyncMock(return_value=["/out/T.jpg"])
+
+        await store(job, file_manager)
 
-        wrapped.download.assert_awaited_once_with(client)
         file_manager.save_files.assert_awaited_once_with(
-            "T", [(b"x", "jpg")], subreddit="pics"
+            "T", [("/staging/1.part", "jpg")], subreddit="pics"
+        )
+        self.assertEqual(job.saved, ["/out/T.jpg"])
+        self.assertEqual(job.downloads, [])  # everything staged was moved
+
+    async def test_build_stages_order(self):
+        stages = build_stages(MagicMock(), MagicMock(), RunStats())
+        self.assertEqual(
+            [stage.name for stage in stages],
+            ["resolve", "download", "store", "finish"],
         )
-        self.assertEqual(result, ["/out/T.jpg"])
-
 
-class TestProcessSubmission(unittest.IsolatedAsyncioTestCase):
+    async def test_build_stages_checks_catalog_first(self):
+        stages = build_stages(MagicMock(), MagicMock(), RunStats(), catalog=MagicMock())
+        self.assertEqual(
+            [stage.name for stage in stages],
+            ["check", "resolve", "download", "store", "finish"],
+        )
 
-    async def test_finds_urls_with_bundle_then_downloads_with_http(self):
-        wrapped = _fake_wrapped("T", "pics", downloads=[(b"x", "jpg")])
-        clients = MagicMock()
+    async def test_network_stages_adapt_up_to_their_worker_counts(self):
+        stages = {
+            stage.name: stage
+            for stage in build_stages(MagicMock(), MagicMock(), RunStats())
+        }
+        resolve, download = stages["resolve"].limit, stages["download"].limit
+        assert resolve is not None and download is not None
+        self.assertEqual(resolve.maximum, MAX_FINDERS)
+        self.assertEqual(download.maximum, MAX_DOWNLOADS)
+        self.assertIsNone(stages["store"].limit)
+
+    async def test_concurrency_limits_reports_stages_and_hosts(self):
+        clients = MagicMock(limiter=HostLimiter(connections=3))
+        clients.limiter.record("i.redd.it", ok=True)
+        stages = build_stages(clients, MagicMock(), RunStats())
+        limits = concurrency_limits(stages, clients)
+        download = stages[1].limit
+        assert download is not None
+        self.assertEqual(limits["host:i.redd.it"], 3)
+        self.assertEqual(limits["stage:download"], download.current)
+        self.assertNotIn("stage:store", limits)
+
+
+class TestCatalogSteps(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.catalog = await Catalog(
+            os.path.join(self._tmp.name, CATALOG_FILENAME)
+        ).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.catalog.__aexit__(None, None, None)
+        self._tmp.cleanup()
+
+    async def test_check_drops_finished_submissions(self):
+        await self.catalog.record("done", Catalog.SAVED, ["u"], ["/out/done.jpg"])
+        stats = RunStats()
+        self.assertIsNone(await check(Job(_fake_wrapped("Done")), self.catalog, stats))
+        self.assertEqual(stats.skipped, 1)
+
+    async def test_check_passes_new_and_failed_submissions(self):
+        await self.catalog.record("failed", Catalog.FAILED)
+        stats = RunStats()
+        for title in ("New", "Failed"):
+            job = Job(_fake_wrapped(title))
+            self.assertIs(await check(job, self.catalog, stats), job)
+        self.assertEqual(stats.skipped, 0)
+
+    async def test_download_skips_known_urls(self):
+        await self.catalog.record("other", Catalog.SAVED, ["old"], ["/out/o.jpg"])
+        job = Job(_fake_wrapped("T", urls=["old", "new"]))
+        await download(job, MagicMock(), MagicMock(), self.catalog)
+        self.assertEqual(job.wrapped.urls, {"new"})
+
+    async def _finish(self, job):
         file_manager = MagicMock()
-        file_manager.save_files = AsyncMock(return_value=["/out/T.jpg"])
+        file_manager.discard = AsyncMock()
+        with patch("builtins.print"):
+            await finish(job, file_manager, RunStats(), catalog=self.catalog)
+
+    async def test_finish_records_outcome(self):
+        a = _fake_wrapped("A", urls=["u", "w"])
+        # w was dropped (a 404, say)
+        a.downloaded = {"u"}
+        await self._finish(Job(a, saved=["/out/A.jpg"]))
+        await self._finish(Job(_fake_wrapped("B")))
+        await self._finish(Job(_fake_wrapped("C", urls=["v"]), error="boom"))
+        self.assertTrue(await self.catalog.is_done("a"))
+        self.assertEqual(await self.catalog.paths("a"), ["/out/A.jpg"])
+        self.assertTrue(await self.catalog.is_done("b"))
+        self.assertFalse(await self.catalog.is_done("c"))
+        self.assertEqual(await self.catalog.known_urls(["u", "v", "w"]), {"u"})
+
+    async def test_nothing_downloaded_for_now_is_failed(self):
+        wrapped = _fake_wrapped("A", urls=["u"])
+
+        async def gave_up(*args, **kwargs):
+            wrapped.unfinished = {"u"}
+            return []
+
+        wrapped.download = AsyncMock(side_effect=gave_up)
+        job = Job(wrapped)
+        step = guarded(partial(download, client=MagicMock(), file_manager=MagicMock()))
+        await step(job)
+        self.assertTrue(job.error)
+        await self._finish(job)
+        self.assertFalse(await self.catalog.is_done("a"))
+
+    async def test_partly_saved_album_is_retried_for_what_failed(self):
+        wrapped = _fake_wrapped("A", urls=["u", "v"], downloads=[(b"x", "jpg")])
+        fetch = wrapped.download.side_effect
+
+        async def one_failed(*args, **kwargs):
+            staged = await fetch(*args, **kwargs)
+            wrapped.downloaded, wrapped.unfinished = {"u"}, {"v"}
+            return staged
+
+        wrapped.download = AsyncMock(side_effect=one_failed)
+        file_manager = MagicMock()
+        file_manager.stage = AsyncMock(return_value="/staging/1.part")
+        file_manager.discard = AsyncMock()
+        job = Job(wrapped)
+        await download(job, MagicMock(), file_manager)
+        self.assertFalse(job.error)  # what did arrive is still stored
+
+        job.saved, job.downloads = ["/out/A.jpg"], []
+        failed: set[str] = set()
+        with patch("builtins.print"):
+            await finish(
+                job,
+                file_manager,
+                RunStats(),
+                catalog=self.catalog,
+                unsave=True,
+                failed=failed,
+            )
+        self.assertFalse(await self.catalog.is_done("a"))
+        self.assertEqual(failed, {"a"})
+        wrapped.unsave.assert_not_awaited()
+        # the next run fetches only the url that failed
+        job = Job(_fake_wrapped("A", urls=["u", "v"]))
+        await download(job, MagicMock(), MagicMock(), self.catalog)
+        self.assertEqual(job.wrapped.urls, {"v"})
 
-        result = await process_submission(
-            wrapped, clients, file_manager, asyncio.Semaphore(1), asyncio.Semaphore(1)
-        )
 
-        # find_urls gets the whole bundle; download gets just the http client
-        wrapped.find_urls.assert_awaited_once_with(clients)
-        wrapped.download.assert_awaited_once_with(clients.http)
-        self.assertEqual(result, ["/out/T.jpg"])
+class TestClientConfig(unittest.TestCase):
 
-    async def _run(self, *, saved_paths, log=False, unsave=False):
-        wrapped = _fake_wrapped("T", "pics", downloads=[(b"x", "jpg")])
-        clients = MagicMock()
+    def test_pool_matches_worker_counts(self):
+        config = client_config(_args())
+        self.assertEqual(config.max_connections, MAX_FINDERS + MAX_DOWNLOADS)
+        self.assertEqual(config.max_keepalive_connections, config.max_connections)
+        self.assertFalse(config.http2)
+        self.assertIn("i.redd.it", config.preconnect)
+
+    def test_http2_is_opt_in(self):
+        self.assertTrue(client_config(_args(http2=True)).http2)
+
+
+class TestGuarded(unittest.IsolatedAsyncioTestCase):
+
+    async def test_records_error_instead_of_raising(self):
+        # a raising stage must NOT propagate (it would cancel the pipeline)
+        step = guarded(AsyncMock(side_effect=RuntimeError("boom")))
+        job = await step(Job(_fake_wrapped("T")))
+        self.assertEqual(job.error, "boom")
+
+    async def test_lets_retry_through(self):
+        step = guarded(AsyncMock(side_effect=Retry(1)))
+        job = Job(_fake_wrapped("T"))
+        with self.assertRaises(Retry):
+            await step(job)
+        self.assertEqual(job.error, "")
+
+    async def test_skips_failed_jobs(self):
+        inner = AsyncMock()
+        job = Job(_fake_wrapped("T"), error="earlier")
+        self.assertIs(await guarded(inner)(job), job)
+        inner.assert_not_awaited()
+        self.assertEqual(job.error, "earlier")
+
+
+class TestFinish(unittest.IsolatedAsyncioTestCase):
+
+    async def _run(self, *, saved_paths, error="", log=False, unsave=False):
+        job = Job(_fake_wrapped("T", "pics"), saved=saved_paths, error=error)
         file_manager = MagicMock()
-        file_manager.save_files = AsyncMock(return_value=saved_paths)
         file_manager.log = AsyncMock()
-        await process_submission(
-            wrapped,
-            clients,
-            file_manager,
-            asyncio.Semaphore(1),
-            asyncio.Semaphore(1),
-            log=log,
-            unsave=unsave,
-        )
-        return wrapped, file_manager
+        file_manager.discard = AsyncMock()
+        stats = RunStats()
+        with patch("builtins.print"):
+            await finish(job, file_manager, stats, log=log, unsave=unsave)
+        return job, file_manager, stats
 
     async def test_unsave_when_enabled_and_something_saved(self):
-        wrapped, _ = await self._run(saved_paths=["/out/T.jpg"], unsave=True)
-        wrapped.unsave.assert_awaited_once()
+        job, _, _ = await self._run(saved_paths=["/out/T.jpg"], unsave=True)
+        job.wrapped.unsave.assert_awaited_once()
 
     async def test_no_unsave_when_nothing_saved(self):
         # opt-in unsave must not fire when the download produced no files
-        wrapped, _ = await self._run(saved_paths=[], unsave=True)
-        wrapped.unsave.assert_not_awaited()
+        job, _, _ = await self._run(saved_paths=[], unsave=True)
+        job.wrapped.unsave.assert_not_awaited()
 
     async def test_no_unsave_by_default(self):
-        wrapped, _ = await self._run(saved_paths=["/out/T.jpg"], unsave=False)
-        wrapped.unsave.assert_not_awaited()
+        job, _, _ = await self._run(saved_paths=["/out/T.jpg"], unsave=False)
+        job.wrapped.unsave.assert_not_awaited()
 
-    async def test_logs_via_file_manager_when_enabled(self):
-        wrapped, file_manager = await self._run(saved_paths=["/out/T.jpg"], log=True)
-        file_manager.log.assert_awaited_once_with(wrapped.log_record.return_value)
+    async def test_no_unsave_after_error(self):
+        job, _, _ = await self._run(saved_paths=["/out/T.jpg"], error="x", unsave=True)
+        job.wrapped.unsave.assert_not_awaited()
 
-    async def test_no_log_when_disabled(self):
-        _, file_manager = await self._run(saved_paths=["/out/T.jpg"], log=False)
-        file_manager.log.assert_not_awaited()
+    async def test_unsave_error_is_recorded(self):
+        job = Job(_fake_wrapped("T"), saved=["/out/T.jpg"])
+        job.wrapped.unsave = AsyncMock(side_effect=RuntimeError("nope"))
+        with patch("builtins.print"):
+            await finish(job, MagicMock(), RunStats(), unsave=True)
+        self.assertEqual(job.error, "nope")
 
-    async def test_swallows_errors_and_logs(self):
-        # a raising submission must NOT propagate (it would abort the TaskGroup)
-        wrapped = _fake_wrapped("T", "pics")
-        wrapped.find_urls = AsyncMock(side_effect=RuntimeError("boom"))
-        file_manager = MagicMock()
-        file_manager.save_files = AsyncMock(return_value=[])
-        file_manager.log = AsyncMock()
+    async def test_lets_go_of_bodies_not_downloaded(self):
+        job, _, _ = await self._run(saved_paths=[], error="x")
+        job.wrapped.drop_prefetched.assert_called_once_with()
 
-        result = await process_submission(
-            wrapped,
-            MagicMock(),
-            file_manager,
-            asyncio.Semaphore(1),
-            asyncio.Semaphore(1),
-            log=True,
-        )
+    async def test_logs_via_file_manager_when_enabled(self):
+        job, file_manager, _ = await self._run(saved_paths=["/out/T.jpg"], log=True)
+        file_manager.log.assert_awaited_once_with(job.wrapped.log_record.return_value)
+        job.wrapped.log_record.assert_called_once_with(exception="")
 
-        self.assertEqual(result, [])
-        wrapped.log_record.assert_called_once_with(exception="boom")
+    async def test_logs_error(self):
+        job, file_manager, _ = await self._run(saved_paths=[], error="boom", log=True)
+        job.wrapped.log_record.assert_called_once_with(exception="boom")
         file_manager.log.assert_awaited_once()
-        wrapped.unsave.assert_not_awaited()
 
-    async def test_error_without_log_is_silent(self):
-        wrapped = _fake_wrapped("T", "pics")
-        wrapped.find_urls = AsyncMock(side_effect=RuntimeError("boom"))
-        file_manager = MagicMock()
-        file_manager.log = AsyncMock()
+    async def test_no_log_when_disabled(self):
+        _, file_manager, _ = await self._run(saved_paths=["/out/T.jpg"], log=False)
+        file_manager.log.assert_not_awaited()
 
-        result = await process_submission(
-            wrapped,
-            MagicMock(),
-            file_manager,
-            asyncio.Semaphore(1),
-            asyncio.Semaphore(1),
-            log=False,
-        )
+    async def test_discards_staged_files_of_failed_job(self):
+        staged = [("/staging/1.part", "jpg")]
+        job = Job(_fake_wrapped("T"), downloads=staged, error="boom")
+        file_manager = MagicMock()
+        file_manager.discard = AsyncMock()
+        with patch("builtins.print"):
+            await finish(job, file_manager, RunStats())
+        file_manager.discard.assert_awaited_once_with(staged)
+        self.assertEqual(job.downloads, [])
 
-        self.assertEqual(result, [])
-        file_manager.log.assert_not_awaited()
+    async def test_streams_into_stats(self):
+        _, _, stats = await self._run(saved_paths=["/a", "/b"])
+        self.assertEqual(stats, RunStats(submissions=1, files=2, errors=0))
+        _, _, stats = await self._run(saved_paths=[], error="boom")
+        self.assertEqual(stats, RunStats(submissions=1, files=0, errors=1))
 
 
 class TestMaxAgeSeconds(unittest.TestCase):
@@ -252,6 +486,17 @@ class TestBuildPredicate(unittest.TestCase):
         self.assertFalse(predicate(self._wrapped(score=5, age_seconds=3600)))
 
 
+class TestListingFloors(unittest.TestCase):
+
+    def test_no_filters_no_floors(self):
+        self.assertEqual(listing_floors(None, None), {})
+
+    def test_floors_match_the_predicate(self):
+        floors = listing_floors(10, 86400)
+        self.assertEqual(floors["score"], 10)
+        self.assertAlmostEqual(floors["created_utc"], time.time() - 86400, delta=5)
+
+
 class TestMain(unittest.IsolatedAsyncioTestCase):
 
     async def test_runs_pipeline_and_collects_results(self):
@@ -270,8 +515,8 @@ class TestMain(unittest.IsolatedAsyncioTestCase):
             ):
                 await main(args)
 
-            # every submission is processed (real process_submission/_download +
-            # a real file_manager writing into the temp dir)
+            # every submission is processed (the real stages + a real
+            # file_manager writing into the temp dir)
             w1.find_urls.assert_awaited_once()
             w2.find_urls.assert_awaited_once()
             w1.download.assert_awaited_once()
@@ -281,3 +526,203 @@ class TestMain(unittest.IsolatedAsyncioTestCase):
             summary = mock_print.call_args_list[-1].args[0]
             self.assertIn("1 file(s)", summary)
             self.assertIn("2 submission(s)", summary)
+            self.assertIn("Concurrency settled at: resolve ", summary)
+
+    async def test_one_failing_submission_does_not_abort_the_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bad = _fake_wrapped("Bad")
+            bad.find_urls = AsyncMock(side_effect=RuntimeError("boom"))
+            good = _fake_wrapped("Good", downloads=[(b"g", "jpg")])
+
+            async def fake_build_stream(_clients, **_kwargs):
+                return async_iter([bad, good])
+
+            with (
+                patch("src.main.build_stream", side_effect=fake_build_stream),
+                patch("builtins.print") as mock_print,
+            ):
+                await main(_args(directory=directory))
+
+            bad.download.assert_not_awaited()
+            good.download.assert_awaited_once()
+            # the staging area is tidied away once the run is over
+            [run_dir] = set(os.listdir(directory)) - {CATALOG_FILENAME}
+            self.assertEqual(os.listdir(os.path.join(directory, run_dir)), ["Good.jpg"])
+            summary = mock_print.call_args_list[-1].args[0]
+            self.assertIn("1 file(s)", summary)
+            self.assertIn("2 submission(s)", summary)
+
+    async def test_rerun_skips_submissions_already_done(self):
+        with tempfile.TemporaryDirectory() as directory:
+
+            async def fake_build_stream(_clients, **_kwargs):
+                return async_iter([_fake_wrapped("Alpha", downloads=[(b"a", "jpg")])])
+
+            with (
+                patch("src.main.build_stream", side_effect=fake_build_stream),
+                patch("builtins.print") as mock_print,
+            ):
+                await main(_args(directory=directory))
+                # both runs would otherwise share a (per-minute) folder name
+                [run_dir] = set(os.listdir(directory)) - {CATALOG_FILENAME}
+                os.rename(
+                    os.path.join(directory, run_dir), os.path.join(directory, "first")
+                )
+                await main(_args(directory=directory))
+
+            summary = mock_print.call_args_list[-1].args[0]
+            self.assertIn("0 file(s) from 0 submission(s) (1 already done)", summary)
+
+
+class TestWatermarks(unittest.IsolatedAsyncioTestCase):
+
+    async def _run_twice(self, first_fails=False, **overrides):
+        """
+        Runs main() twice, the first run's listing marking where it started;
+        returns the watermarks each run's listing was given
+        """
+        given = []
+
+        async def fake_build_stream(_clients, *, watermarks, **_kwargs):
+            given.append(dict(watermarks.marks))
+            old = _fake_wrapped("Old")
+            new = _fake_wrapped(f"Post {len(given)}")
+            for wrapped, created in ((new, 100.0), (old, 50.0)):
+                item = MagicMock(id=wrapped.id, fullname=f"t3_{wrapped.id}")
+                item.created_utc = created
+                watermarks.note("r/pics:new", item)
+            if first_fails and len(given) == 1:
+                new.find_urls = AsyncMock(side_effect=RuntimeError("boom"))
+            return async_iter([new, old])
+
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            patch("src.main.build_stream", side_effect=fake_build_stream),
+            patch("builtins.print"),
+        ):
+            await main(_args(directory=directory))
+            [run_dir] = set(os.listdir(directory)) - {CATALOG_FILENAME}
+            os.rename(
+                os.path.join(directory, run_dir), os.path.join(directory, "first")
+            )
+            await main(_args(directory=directory, **overrides))
+        return given
+
+    async def test_next_run_starts_from_where_this_one_did(self):
+        first, second = await self._run_twice()
+        self.assertEqual(first, {})
+        self.assertEqual(second, {"r/pics:new": ("t3_post 1", 100.0)})
+
+    async def test_failed_post_is_listed_again(self):
+        _, second = await self._run_twice(first_fails=True)
+        self.assertEqual(second, {"r/pics:new": ("t3_old", 50.0)})
+
+    async def test_relist_ignores_them(self):
+        _, second = await self._run_twice(relist=True)
+        self.assertEqual(second, {})
+
+
+class TestCheckpointSteps(unittest.IsolatedAsyncioTestCase):
+
+    def test_options_round_trip_through_json(self):
+        args = _args(subreddit=["pics"], sortby=SortOption.TOP_WEEK, limit=3)
+        options = json.loads(json.dumps(checkpoint_options(args)))
+        resumed = resumed_args(
+            _args(resume="out/PaperScraper 2026-01-01 00:00", limit=99), options
+        )
+        self.assertEqual(resumed.subreddit, ["pics"])
+        self.assertIs(resumed.sortby, SortOption.TOP_WEEK)
+        self.assertEqual(resumed.limit, 3)
+        self.assertEqual(resumed.directory, os.path.abspath("out"))
+
+    def test_start_job_restores_resolved_urls(self):
+        checkpoint = Checkpoint("unused", pending={"alpha": ["u"], "beta": None})
+        alpha = start_job(_fake_wrapped("Alpha"), checkpoint)
+        beta = start_job(_fake_wrapped("Beta"), checkpoint)
+        gamma = start_job(_fake_wrapped("Gamma"), checkpoint)
+        self.assertTrue(alpha.resolved)
+        self.assertEqual(alpha.wrapped.urls, {"u"})
+        self.assertFalse(beta.resolved)
+        self.assertIn("gamma", checkpoint.pending)
+        self.assertFalse(gamma.resolved)
+
+    async def test_resolve_records_urls_once(self):
+        checkpoint = Checkpoint("unused", pending={"alpha": None})
+        wrapped = _fake_wrapped("Alpha", urls=["u"])
+        job = Job(wrapped)
+        await resolve(job, MagicMock(), checkpoint)
+        await resolve(job, MagicMock(), checkpoint)
+        wrapped.find_urls.assert_awaited_once()
+        self.assertEqual(checkpoint.pending, {"alpha": ["u"]})
+
+    async def test_finish_and_skip_clear_pending(self):
+        checkpoint = Checkpoint("unused", pending={"alpha": None, "beta": None})
+        await finish(
+            Job(_fake_wrapped("Alpha")), MagicMock(), RunStats(), checkpoint=checkpoint
+        )
+        catalog = MagicMock(is_done=AsyncMock(return_value=True))
+        await check(Job(_fake_wrapped("Beta")), catalog, RunStats(), checkpoint)
+        self.assertEqual(checkpoint.pending, {})
+
+
+class TestResume(unittest.IsolatedAsyncioTestCase):
+
+    async def test_interrupted_run_leaves_a_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stuck = _fake_wrapped("Alpha", urls=["u"])
+            downloading = asyncio.Event()
+
+            async def hang(*_args):
+                downloading.set()
+                await asyncio.Event().wait()
+
+            stuck.download = AsyncMock(side_effect=hang)
+
+            async def fake_build_stream(_clients, **_kwargs):
+                return async_iter([stuck])
+
+            with patch("src.main.build_stream", side_effect=fake_build_stream):
+                run = asyncio.create_task(main(_args(directory=directory, limit=3)))
+                await asyncio.wait_for(downloading.wait(), timeout=5)
+                run.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await run
+
+            [run_dir] = set(os.listdir(directory)) - {CATALOG_FILENAME}
+            checkpoint = Checkpoint.load(
+                os.path.join(directory, run_dir, CHECKPOINT_FILENAME)
+            )
+            self.assertEqual(checkpoint.pending, {"alpha": ["u"]})
+            self.assertEqual(checkpoint.options["limit"], 3)
+
+    async def test_resume_finishes_in_the_same_folder(self):
+        with tempfile.TemporaryDirectory() as directory:
+            run_dir = os.path.join(directory, "PaperScraper 2026-01-01 00:00")
+            os.makedirs(run_dir)
+            options = checkpoint_options(
+                _args(subreddit=["pics"], sortby=SortOption.NEW)
+            )
+            with open(os.path.join(run_dir, CHECKPOINT_FILENAME), "w") as f:
+                json.dump({"options": options, "pending": {"alpha": ["u"]}}, f)
+
+            resumed = _fake_wrapped("Alpha", downloads=[(b"a", "jpg")])
+            build_kwargs = {}
+
+            async def fake_build_stream(_clients, **kwargs):
+                build_kwargs.update(kwargs)
+                return async_iter([resumed])
+
+            with (
+                patch("src.main.build_stream", side_effect=fake_build_stream),
+                patch("builtins.print"),
+            ):
+                await main(_args(directory="elsewhere", resume=run_dir))
+
+            self.assertEqual(list(build_kwargs["resume"]), ["alpha"])
+            self.assertEqual(build_kwargs["subreddits"], ["pics"])
+            self.assertIs(build_kwargs["sortby"], SortOption.NEW)
+            resumed.find_urls.assert_not_awaited()
+            self.assertEqual(resumed.urls, {"u"})
+            # finished: saved alongside the first attempt's files, no checkpoint
+            self.assertEqual(os.listdir(run_dir), ["Alpha.jpg"])
+            self.assertTrue(os.path.exists(os.path.join(directory, CATALOG_FILENAME)))
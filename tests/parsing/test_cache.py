@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.core import Catalog
+from src.parsing import ResolutionCache
+
+
+class TestResolutionCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_miss_then_hit(self):
+        cache = ResolutionCache()
+        self.assertIsNone(await cache.get("u"))
+        await cache.put("u", {"a"}, ["imgur_parser"])
+        self.assertEqual(await cache.get("u"), {"a"})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    async def test_nothing_found_is_not_cached(self):
+        cache = ResolutionCache()
+        await cache.put("u", set(), ["imgur_parser"])
+        self.assertIsNone(await cache.get("u"))
+
+    async def test_shortest_parser_ttl_applies(self):
+        cache = ResolutionCache(ttls={"slow": 100, "fast": 10}, default_ttl=1000)
+        with patch("src.parsing.cache.time.time", return_value=0):
+            await cache.put("u", {"a"}, ["slow", "fast"])
+            await cache.put("v", {"b"}, ["unknown"])
+        with patch("src.parsing.cache.time.time", return_value=50):
+            self.assertIsNone(await cache.get("u"))
+            self.assertEqual(await cache.get("v"), {"b"})
+
+    async def test_least_recently_used_is_evicted(self):
+        cache = ResolutionCache(capacity=2)
+        await cache.put("a", {"1"}, [])
+        await cache.put("b", {"2"}, [])
+        await cache.get("a")
+        await cache.put("c", {"3"}, [])
+        self.assertIsNone(await cache.get("b"))
+        self.assertEqual(await cache.get("a"), {"1"})
+        self.assertEqual(await cache.get("c"), {"3"})
+
+    async def test_store_carries_results_across_caches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            async with Catalog(os.path.join(tmp, "catalog.sqlite3")) as catalog:
+                await ResolutionCache(catalog).put("u", {"a"}, ["imgur_parser"])
+                # a later run's cache starts empty, but finds it in the store
+                cache = ResolutionCache(catalog, capacity=1)
+                self.assertEqual(await cache.get("u"), {"a"})
+                self.assertEqual(cache.hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
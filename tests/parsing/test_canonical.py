@@ -0,0 +1,44 @@
+import unittest
+
+from src.parsing import canonical_url
+
+
+class TestCanonicalUrl(unittest.TestCase):
+
+    def test_spellings_of_the_same_link_agree(self):
+        for url in (
+            "https://i.imgur.com/abc.jpg",
+            "http://i.imgur.com/abc.jpg",
+            "https://I.Imgur.com/abc.jpg?1",
+            "i.imgur.com/abc.jpg#top",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(canonical_url(url), "https://i.imgur.com/abc.jpg")
+
+    def test_www_and_mobile_hosts(self):
+        self.assertEqual(canonical_url("http://m.imgur.com/x"), "https://imgur.com/x")
+        self.assertEqual(
+            canonical_url("https://www.reddit.com/r/pics/comments/1/x/"),
+            "https://reddit.com/r/pics/comments/1/x/",
+        )
+
+    def test_reddit_preview_is_the_original(self):
+        url = "https://preview.redd.it/abc.jpg?width=640&format=pjpg&s=f00"
+        self.assertEqual(canonical_url(url), "https://i.redd.it/abc.jpg")
+
+    def test_gifv_is_its_video(self):
+        self.assertEqual(
+            canonical_url("https://i.imgur.com/abc.gifv"), "https://i.imgur.com/abc.mp4"
+        )
+
+    def test_other_hosts_keep_scheme_and_query(self):
+        url = "http://example.com/image.php?id=3"
+        self.assertEqual(canonical_url(url), url)
+
+    def test_is_idempotent(self):
+        url = canonical_url("http://www.preview.redd.it/abc.png?s=1")
+        self.assertEqual(canonical_url(url), url)
+
+
+if __name__ == "__main__":
+    unittest.main()
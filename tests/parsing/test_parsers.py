@@ -1,32 +1,127 @@
 import unittest
 from unittest.mock import AsyncMock, MagicMock
 
-from src.parsing import find_urls, single_image_parser
+from src.core import ByteBudget
+from src.parsing import ResolutionCache, find_urls, single_image_parser
+from src.parsing.single_image import PREFETCH_LIMIT
+from tests import StreamingClientMock, StreamResponseMock
 
 
 class TestParsers(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def _bundle(response):
+        bundle = MagicMock()
+        bundle.http = StreamingClientMock(lambda url, **kw: response)
+        bundle.prefetched = {}
+        bundle.budget = None
+        return bundle
+
     async def test_single_image_parser(self):
-        mock_client = AsyncMock()
-        response = AsyncMock()
-        response.status_code = 200
-        response.headers = {"Content-type": "image/jpeg"}
-        response.url = "https://example.com/image.jpg"
-        mock_client.get.return_value = response
-        mock_client_bundle = MagicMock()
-        mock_client_bundle.http = mock_client
+        response = StreamResponseMock(
+            headers={"Content-type": "image/jpeg"},
+            url="https://example.com/image.jpg",
+        )
+        mock_client_bundle = self._bundle(response)
 
         result = await single_image_parser(
             "https://example.com/image.jpg", mock_client_bundle
         )
 
         self.assertEqual(result, {"https://example.com/image.jpg"})
+        # the probe is a streamed GET
+        mock_client_bundle.http.stream.assert_called_once_with(
+            "GET", "https://example.com/image.jpg"
+        )
+
+    async def test_single_image_parser_keeps_small_body(self):
+        response = StreamResponseMock(
+            headers={"Content-type": "image/png", "Content-Length": "4"},
+            url="https://example.com/small.png",
+            content=b"data",
+        )
+        bundle = self._bundle(response)
+
+        await single_image_parser("https://example.com/small.png", bundle)
+
+        response.aread.assert_awaited_once()
+        self.assertIs(
+            bundle.prefetched["https://example.com/small.png"].response, response
+        )
+
+    async def test_kept_body_holds_budget_until_let_go(self):
+        bundle = MagicMock()
+        bundle.http = StreamingClientMock(
+            lambda url, **kw: StreamResponseMock(
+                headers={"Content-type": "image/png", "Content-Length": "4"},
+                url=url,
+                content=b"data",
+            )
+        )
+        bundle.prefetched = {}
+        bundle.budget = ByteBudget(10)
+
+        await single_image_parser("https://example.com/small.png", bundle)
+        self.assertEqual(bundle.budget.available, 6)
+        # nobody waits on them while the body is queued for its download
+        self.assertEqual(bundle.budget.parked, 4)
+
+        # dropped with its submission
+        bundle.prefetched.pop("https://example.com/small.png").release()
+        self.assertEqual(bundle.budget.available, 10)
+        self.assertEqual(bundle.budget.parked, 0)
+
+    async def test_body_not_kept_without_budget_room(self):
+        response = StreamResponseMock(
+            headers={"Content-type": "image/png", "Content-Length": "4"},
+            url="https://example.com/small.png",
+            content=b"data",
+        )
+        bundle = self._bundle(response)
+        bundle.budget = ByteBudget(3)
+
+        result = await single_image_parser("https://example.com/small.png", bundle)
+
+        self.assertEqual(result, {"https://example.com/small.png"})
+        response.aread.assert_not_awaited()
+        self.assertEqual(bundle.prefetched, {})
+        self.assertEqual(bundle.budget.available, 3)
+
+    async def test_single_image_parser_skips_large_body(self):
+        response = StreamResponseMock(
+            headers={
+                "Content-type": "image/png",
+                "Content-Length": str(PREFETCH_LIMIT + 1),
+            },
+            url="https://example.com/big.png",
+        )
+        bundle = self._bundle(response)
+
+        result = await single_image_parser("https://example.com/big.png", bundle)
+
+        self.assertEqual(result, {"https://example.com/big.png"})
+        response.aread.assert_not_awaited()  # judged on headers alone
+        self.assertEqual(bundle.prefetched, {})
+
+    async def test_single_image_parser_rejects_non_image(self):
+        response = StreamResponseMock(
+            headers={"Content-type": "text/html", "Content-Length": "4"},
+            url="https://example.com/",
+        )
+        bundle = self._bundle(response)
+
+        self.assertEqual(
+            await single_image_parser("https://example.com/", bundle), set()
+        )
+        response.aread.assert_not_awaited()
+        self.assertEqual(bundle.prefetched, {})
 
     async def test_find_urls(self):
         async def parser_one(url, client):
-            return {"a"}
+            return {"https://a.com/1.jpg"}
 
         async def parser_two(url, client):
-            return {"b"}
+            return {"https://b.com/2.jpg"}
 
         mock_client = AsyncMock()
 
@@ -36,8 +131,58 @@ class TestParsers(unittest.IsolatedAsyncioTestCase):
             parsers=[parser_one, parser_two],
         )
 
-        self.assertEqual(result, {"a", "b"})
+        self.assertEqual(result, {"https://a.com/1.jpg", "https://b.com/2.jpg"})
+
+    async def test_find_urls_routes_by_default(self):
+        # a direct media link resolves to itself without running any parser
+        url = "https://i.redd.it/abc.jpg"
+        self.assertEqual(await find_urls(url, MagicMock()), {url})
+
+    async def test_find_urls_resolves_from_payload(self):
+        parser = AsyncMock(return_value={"unused"})
+        clients = MagicMock()
+        payload = {"url": "https://i.redd.it/abc.jpg"}
+
+        result = await find_urls(
+            "https://i.redd.it/abc.jpg", clients, [parser], payload=payload
+        )
+
+        self.assertEqual(result, {"https://i.redd.it/abc.jpg"})
+        parser.assert_not_awaited()
+        clients.reddit.submission.assert_not_called()
+
+    async def test_find_urls_parses_when_payload_is_undecided(self):
+        parser = AsyncMock(return_value={"https://i.imgur.com/x.jpg"})
+
+        result = await find_urls(
+            "https://imgur.com/x",
+            MagicMock(),
+            [parser],
+            payload={"url": "https://imgur.com/x"},
+        )
+
+        self.assertEqual(result, {"https://i.imgur.com/x.jpg"})
+        parser.assert_awaited_once()
 
 
 if __name__ == "__main__":
     unittest.main()
+
+    async def test_find_urls_consults_cache_before_parsing(self):
+        parser = AsyncMock(return_value={"https://i.imgur.com/x.jpg"})
+        cache = ResolutionCache()
+
+        for _ in range(2):
+            result = await find_urls(
+                "https://imgur.com/x", MagicMock(), [parser], cache=cache
+            )
+
+        self.assertEqual(result, {"https://i.imgur.com/x.jpg"})
+        parser.assert_awaited_once()
+        self.assertEqual(cache.hits, 1)
+
+    async def test_find_urls_does_not_cache_direct_links(self):
+        cache = ResolutionCache()
+        url = "https://i.redd.it/abc.jpg"
+        self.assertEqual(await find_urls(url, MagicMock(), cache=cache), {url})
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
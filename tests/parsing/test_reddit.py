@@ -4,7 +4,7 @@ import unittest
 import pytest
 
 from src.core import AsyncClientBundle
-from src.parsing import reddit_parser
+from src.parsing import media_from_payload, reddit_parser
 
 
 class TestRedditParser(unittest.IsolatedAsyncioTestCase):
@@ -36,3 +36,50 @@ class TestRedditParser(unittest.IsolatedAsyncioTestCase):
 
             actual = await reddit_parser(self.gallery_url, client_bundle)
             self.assertSetEqual(self.gallery_expected, actual)
+
+
+_GALLERY = {
+    "url": "https://www.reddit.com/gallery/abc",
+    "is_gallery": True,
+    "gallery_data": {"items": [{"media_id": "a"}, {"media_id": "b"}]},
+    "media_metadata": {
+        "a": {"s": {"u": "https://preview.redd.it/a.jpg?w=1&amp;s=x"}},
+        "b": {"s": {"u": "https://preview.redd.it/b.jpg?w=1&amp;s=y"}},
+    },
+}
+
+
+class TestMediaFromPayload(unittest.TestCase):
+
+    def test_single_image(self):
+        self.assertEqual(
+            media_from_payload({"url": "https://i.redd.it/abc.jpg"}),
+            {"https://i.redd.it/abc.jpg"},
+        )
+
+    def test_gallery_unescapes_ampersands(self):
+        self.assertEqual(
+            media_from_payload(_GALLERY),
+            {
+                "https://preview.redd.it/a.jpg?w=1&s=x",
+                "https://preview.redd.it/b.jpg?w=1&s=y",
+            },
+        )
+
+    def test_gallery_skips_failed_items(self):
+        gallery = dict(_GALLERY, media_metadata={"a": {"status": "failed"}})
+        self.assertEqual(media_from_payload(gallery), set())
+
+    def test_crosspost_uses_parent(self):
+        crosspost = {
+            "url": "/r/pics/comments/abc/title/",
+            "crosspost_parent_list": [_GALLERY],
+        }
+        self.assertEqual(media_from_payload(crosspost), media_from_payload(_GALLERY))
+
+    def test_text_post_has_nothing(self):
+        payload = {"url": "https://www.reddit.com/r/x/comments/a/", "is_self": True}
+        self.assertEqual(media_from_payload(payload), set())
+
+    def test_external_link_is_undecided(self):
+        self.assertIsNone(media_from_payload({"url": "https://imgur.com/a/abc"}))
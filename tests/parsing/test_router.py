@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.parsing import (
+    DIRECT,
+    ParserRouter,
+    default_router,
+    flickr_parser,
+    imgur_parser,
+    reddit_parser,
+    single_image_parser,
+)
+
+
+def _parser(name, result=frozenset()):
+    # routing and stats go by __name__, so give each mock a real one
+    parser = AsyncMock(return_value=set(result))
+    parser.__name__ = name
+    return parser
+
+
+class TestRoute(unittest.TestCase):
+
+    def test_reddit_hosts(self):
+        for url in (
+            "https://www.reddit.com/r/pics/comments/abc/title/",
+            "https://old.reddit.com/gallery/abc",
+            "https://redd.it/abc",
+        ):
+            self.assertEqual(default_router.route(url), (reddit_parser,), url)
+
+    def test_imgur_hosts(self):
+        self.assertEqual(
+            default_router.route("https://imgur.com/a/abc"), (imgur_parser,)
+        )
+        self.assertEqual(default_router.route("imgur.com/gallery/abc"), (imgur_parser,))
+
+    def test_flickr_hosts(self):
+        self.assertEqual(
+            default_router.route("https://www.flickr.com/photos/u/1/"), (flickr_parser,)
+        )
+        self.assertEqual(
+            default_router.route("https://flic.kr/p/abc"), (flickr_parser,)
+        )
+
+    def test_most_specific_host_wins(self):
+        # i.redd.it is registered on its own, ahead of its parent redd.it
+        self.assertEqual(
+            default_router.route("https://i.redd.it/abc"), (single_image_parser,)
+        )
+
+    def test_unknown_host_falls_back_to_probe(self):
+        self.assertEqual(
+            default_router.route("https://example.com/a.jpg"), (single_image_parser,)
+        )
+        self.assertEqual(default_router.route("not a url"), (single_image_parser,))
+
+    def test_lookalike_host_does_not_match(self):
+        self.assertEqual(
+            default_router.route("https://notreddit.com/r/x"), (single_image_parser,)
+        )
+
+
+class TestIsDirect(unittest.TestCase):
+
+    def test_direct_media_links(self):
+        self.assertTrue(default_router.is_direct("https://i.redd.it/abc.png"))
+        self.assertTrue(default_router.is_direct("https://i.imgur.com/abc.JPG"))
+        self.assertTrue(default_router.is_direct("https://i.imgur.com/abc.gif?1"))
+
+    def test_needs_parsing(self):
+        self.assertFalse(default_router.is_direct("https://i.imgur.com/abc"))
+        self.assertFalse(default_router.is_direct("https://i.imgur.com/abc.gifv"))
+        self.assertFalse(default_router.is_direct("https://imgur.com/abc.jpg"))
+        self.assertFalse(default_router.is_direct("https://example.com/abc.jpg"))
+
+
+class TestFindUrls(unittest.IsolatedAsyncioTestCase):
+
+    async def test_runs_only_routed_parsers(self):
+        a = _parser("a", {"https://x/1.jpg"})
+        b = _parser("b", {"https://y/1.jpg"})
+        fallback = _parser("fallback")
+        test_router = ParserRouter({"a.com": [a], "b.com": [b]}, fallback=[fallback])
+        clients = MagicMock()
+
+        result = await test_router.find_urls("https://www.a.com/post", clients)
+
+        self.assertEqual(result, {"https://x/1.jpg"})
+        a.assert_awaited_once_with("https://www.a.com/post", clients)
+        b.assert_not_awaited()
+        fallback.assert_not_awaited()
+
+    async def test_direct_link_makes_no_request(self):
+        a = _parser("a")
+        test_router = ParserRouter(
+            {"a.com": [a]}, fallback=[a], direct={"i.a.com": [".jpg"]}
+        )
+
+        result = await test_router.find_urls("https://i.a.com/x.jpg", MagicMock())
+
+        self.assertEqual(result, {"https://i.a.com/x.jpg"})
+        a.assert_not_awaited()
+
+    async def test_records_hit_rates(self):
+        hit = _parser("hit", {"https://x/1.jpg"})
+        miss = _parser("miss")
+        test_router = ParserRouter({"a.com": [hit, miss]}, direct={"i.a.com": [".jpg"]})
+
+        await test_router.find_urls("https://a.com/1", MagicMock())
+        await test_router.find_urls("https://a.com/2", MagicMock())
+        await test_router.find_urls("https://i.a.com/3.jpg", MagicMock())
+
+        self.assertEqual(
+            test_router.stats(),
+            {
+                "hit": {"calls": 2, "hits": 2, "hit_rate": 1.0},
+                "miss": {"calls": 2, "hits": 0, "hit_rate": 0.0},
+                DIRECT: {"calls": 1, "hits": 1, "hit_rate": 1.0},
+            },
+        )
+
+    async def test_no_route_and_no_fallback_finds_nothing(self):
+        self.assertEqual(
+            await ParserRouter({}).find_urls("https://a.com", MagicMock()), set()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -43,7 +43,13 @@ class TestFindUrls(unittest.IsolatedAsyncioTestCase):
             mock_find.return_value = {"https://img/1", "https://img/2"}
             result = await wrapper.find_urls(mock_clients)
 
-        mock_find.assert_awaited_once_with("https://example.com/post", mock_clients)
+        # the submission's listing data goes along, so parsers needn't refetch it
+        mock_find.assert_awaited_once_with(
+            "https://example.com/post",
+            mock_clients,
+            payload=vars(wrapper._submission),
+            cache=None,
+        )
         self.assertEqual(wrapper.urls, {"https://img/1", "https://img/2"})
         self.assertEqual(result, {"https://img/1", "https://img/2"})
         self.assertTrue(wrapper.has_urls())
@@ -22,6 +22,12 @@ class TestSortOptionMembers(unittest.TestCase):
         }
         self.assertEqual(names, expected)
 
+    def test_ordered_listings_know_their_order(self):
+        self.assertEqual(SortOption.NEW.descending, "created_utc")
+        self.assertEqual(SortOption.TOP_WEEK.descending, "score")
+        for option in (SortOption.HOT, SortOption.CONTROVERSIAL, SortOption.GILDED):
+            self.assertIsNone(option.descending)
+
     def test_lookup_by_name(self):
         self.assertIs(SortOption["HOT"], SortOption.HOT)
 
@@ -3,10 +3,18 @@ from collections import Counter
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from src.core import AsyncClientBundle
-from src.reddit import SortOption, StreamBuilder, SubmissionWrapper
+from src.reddit import SortOption, StreamBuilder, SubmissionWrapper, Watermarks
+from src.reddit.submission_source import FLOOR_PATIENCE
 from tests import SubmissionMockFactory, acollect, async_iter
 
 
+def _sortby(listing, descending=None):
+    """A stand-in SortOption, listing a subreddit with ``listing``"""
+    sortby = MagicMock(side_effect=listing)
+    sortby.descending = descending
+    return sortby
+
+
 class TestConstructor(unittest.IsolatedAsyncioTestCase):
 
     async def test_empty_builder_yields_nothing(self):
@@ -27,7 +35,9 @@ class TestAddSubreddit(unittest.IsolatedAsyncioTestCase):
         async with AsyncClientBundle() as clients:
             with patch.object(clients, "set_reddit", return_value=mock_reddit):
                 # inject a fake sort option so we don't touch asyncpraw internals
-                builder = StreamBuilder(sortby=lambda sub, **kw: async_iter([]))
+                builder = StreamBuilder(
+                    sortby=_sortby(lambda sub, **kw: async_iter([]))
+                )
                 builder.add_subreddit(name)
                 result = await acollect(await builder.build(clients))
         return mock_reddit, result
@@ -52,7 +62,7 @@ class TestAddSubreddit(unittest.IsolatedAsyncioTestCase):
         async with AsyncClientBundle() as clients:
             with patch.object(clients, "set_reddit", return_value=mock_reddit):
                 builder = StreamBuilder(
-                    sortby=lambda sub, **kw: async_iter([sub_a, sub_b]),
+                    sortby=_sortby(lambda sub, **kw: async_iter([sub_a, sub_b])),
                     predicate=lambda w: not w.nsfw,  # drop NSFW posts
                 )
                 builder.add_subreddit("wallpapers")
@@ -107,7 +117,7 @@ class TestMultiSource(unittest.IsolatedAsyncioTestCase):
         async with AsyncClientBundle() as clients:
             with patch.object(clients, "set_reddit", return_value=mock_reddit):
                 builder = StreamBuilder(
-                    sortby=lambda sub, **kw: async_iter([sub_a, sub_b])
+                    sortby=_sortby(lambda sub, **kw: async_iter([sub_a, sub_b]))
                 )
                 builder.set_redditor("user", "pw")
                 builder.add_subreddit("wallpapers")
@@ -120,6 +130,246 @@ class TestMultiSource(unittest.IsolatedAsyncioTestCase):
         )
 
 
+class TestAddSubmissions(unittest.IsolatedAsyncioTestCase):
+
+    async def test_fetches_each_and_skips_relisted_and_missing(self):
+        resumed, relisted, other = (SubmissionMockFactory() for _ in range(3))
+        resumed.id = relisted.id = "abc"
+        other.id = "xyz"
+
+        async def submission(submission_id):
+            if submission_id == "gone":
+                raise RuntimeError("404")
+            return resumed
+
+        mock_reddit = MagicMock()
+        mock_reddit.submission = AsyncMock(side_effect=submission)
+        mock_reddit.subreddit.return_value = MagicMock()
+
+        async with AsyncClientBundle() as clients:
+            with patch.object(clients, "set_reddit", return_value=mock_reddit):
+                builder = StreamBuilder(
+                    sortby=_sortby(lambda sub, **kw: async_iter([relisted, other]))
+                )
+                builder.add_subreddit("wallpapers")
+                builder.add_submissions(["abc", "gone"])
+                result = await acollect(await builder.build(clients))
+
+        # "abc" comes once, fetched by id; the listing's copy is dropped
+        self.assertEqual(Counter(w.id for w in result), Counter(["abc", "xyz"]))
+        self.assertEqual(mock_reddit.submission.await_count, 2)
+
+
+class TestDedupe(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def _submission(submission_id, crosspost_of=None, score=1):
+        submission = SubmissionMockFactory()
+        submission.id = submission_id
+        submission.score = score
+        if crosspost_of is not None:
+            submission.crosspost_parent = f"t3_{crosspost_of}"
+        return submission
+
+    async def _build(self, predicate=lambda x: True, **listings):
+        """Lists each subreddit's submissions, returning the ids that came out"""
+        mock_reddit = MagicMock()
+        mock_reddit.subreddit.side_effect = lambda name: name
+
+        async with AsyncClientBundle() as clients:
+            with patch.object(clients, "set_reddit", return_value=mock_reddit):
+                builder = StreamBuilder(
+                    sortby=_sortby(lambda name, **kw: async_iter(listings[name])),
+                    predicate=predicate,
+                )
+                for name in listings:
+                    builder.add_subreddit(name)
+                return [w.id for w in await acollect(await builder.build(clients))]
+
+    async def test_post_listed_by_several_sources_comes_once(self):
+        ids = await self._build(
+            pics=[self._submission("a"), self._submission("b")],
+            art=[self._submission("b"), self._submission("c")],
+        )
+        self.assertEqual(Counter(ids), Counter(["a", "b", "c"]))
+
+    async def test_crossposts_of_one_post_come_once(self):
+        ids = await self._build(
+            pics=[self._submission("x1", crosspost_of="p")],
+            art=[self._submission("x2", crosspost_of="p")],
+        )
+        self.assertEqual(len(ids), 1)
+
+    async def test_crosspost_and_its_original_come_once(self):
+        ids = await self._build(
+            pics=[self._submission("p"), self._submission("x", crosspost_of="p")]
+        )
+        self.assertEqual(ids, ["p"])
+
+    async def test_crosspost_turned_away_leaves_its_original(self):
+        ids = await self._build(
+            predicate=lambda w: w.score >= 100,
+            pics=[
+                self._submission("x", crosspost_of="p", score=5),
+                self._submission("p", score=5000),
+            ],
+        )
+        self.assertEqual(ids, ["p"])
+
+
+class TestFloors(unittest.IsolatedAsyncioTestCase):
+
+    async def _build(self, scores, descending="score", floors=None):
+        """
+        Lists submissions with ``scores`` (in that order), returning the scores
+        that came out and how many submissions were pulled from the listing
+        """
+        pulled = 0
+
+        async def listing():
+            nonlocal pulled
+            for score in scores:
+                pulled += 1
+                submission = SubmissionMockFactory()
+                submission.id = str(pulled)
+                submission.score = score
+                yield submission
+
+        sortby = _sortby(lambda sub, **kw: listing(), descending)
+        mock_reddit = MagicMock()
+
+        async with AsyncClientBundle() as clients:
+            with patch.object(clients, "set_reddit", return_value=mock_reddit):
+                builder = StreamBuilder(sortby=sortby, floors=floors)
+                builder.add_subreddit("pics")
+                out = [w.score for w in await acollect(await builder.build(clients))]
+        return out, pulled
+
+    async def test_stops_paging_below_the_floor(self):
+        scores = [50, 40, 30] + [5] * FLOOR_PATIENCE + [1] * 100
+        out, pulled = await self._build(scores, floors={"score": 10})
+        self.assertEqual(out, [50, 40, 30])
+        self.assertEqual(pulled, 3 + FLOOR_PATIENCE)
+
+    async def test_straggler_above_the_floor_still_comes(self):
+        scores = [50, 5, 20] + [5] * FLOOR_PATIENCE + [30]
+        out, _ = await self._build(scores, floors={"score": 10})
+        self.assertEqual(out, [50, 20])
+
+    async def test_unordered_listing_is_paged_through(self):
+        scores = [50] + [5] * FLOOR_PATIENCE + [30]
+        out, pulled = await self._build(scores, descending=None, floors={"score": 10})
+        self.assertEqual(pulled, len(scores))
+        self.assertIn(30, out)
+
+    async def test_no_floor_for_the_order(self):
+        scores = [50] + [5] * FLOOR_PATIENCE + [30]
+        _, pulled = await self._build(scores, floors={"created_utc": 0})
+        self.assertEqual(pulled, len(scores))
+
+
+class TestWatermarks(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def _listing(*items):
+        """(id, created_utc) pairs as submissions, newest first"""
+        submissions = []
+        for submission_id, created in items:
+            submission = SubmissionMockFactory()
+            submission.id = submission_id
+            submission.fullname = f"t3_{submission_id}"
+            submission.created_utc = created
+            submissions.append(submission)
+        return submissions
+
+    async def _build(
+        self, watermarks, new=(), saved=None, sortby=SortOption.NEW, floors=None
+    ):
+        """Lists r/pics (and saved, if given), returning the ids that came out"""
+        subreddit = MagicMock()
+        subreddit.new.side_effect = subreddit.hot.side_effect = lambda **kw: async_iter(
+            new
+        )
+        mock_reddit = MagicMock()
+        mock_reddit.subreddit.return_value = subreddit
+        me = MagicMock()
+        me.saved.side_effect = lambda **kw: async_iter(saved or [])
+        mock_reddit.user.me = AsyncMock(return_value=me)
+
+        async with AsyncClientBundle() as clients:
+            with patch.object(clients, "set_reddit", return_value=mock_reddit):
+                builder = StreamBuilder(watermarks=watermarks, floors=floors)
+                if saved is not None:
+                    builder.set_redditor("user", "pw")
+                builder.add_subreddit("pics", sortby)
+                return [w.id for w in await acollect(await builder.build(clients))]
+
+    async def test_first_run_lists_everything_and_marks_the_newest(self):
+        watermarks = Watermarks()
+        ids = await self._build(watermarks, self._listing(("c", 3), ("b", 2)))
+        self.assertEqual(ids, ["c", "b"])
+        self.assertEqual(watermarks.advanced(()), {"r/pics:new": ("t3_c", 3)})
+
+    async def test_stops_at_the_watermark(self):
+        watermarks = Watermarks({"r/pics:new": ("t3_b", 2)})
+        new = self._listing(("d", 4), ("c", 3), ("b", 2), ("a", 1))
+        ids = await self._build(watermarks, new)
+        self.assertEqual(ids, ["d", "c"])
+        self.assertEqual(watermarks.advanced(()), {"r/pics:new": ("t3_d", 4)})
+
+    async def test_stops_past_a_deleted_watermark(self):
+        watermarks = Watermarks({"r/pics:new": ("t3_gone", 2.5)})
+        new = self._listing(("c", 3), ("b", 2), ("a", 1))
+        self.assertEqual(await self._build(watermarks, new), ["c"])
+
+    async def test_nothing_new_keeps_the_watermark(self):
+        watermarks = Watermarks({"r/pics:new": ("t3_b", 2)})
+        self.assertEqual(await self._build(watermarks), [])
+        self.assertEqual(watermarks.advanced(()), {"r/pics:new": ("t3_b", 2)})
+
+    async def test_mark_stays_behind_the_oldest_failure(self):
+        watermarks = Watermarks({"r/pics:new": ("t3_a", 1)})
+        new = self._listing(("e", 5), ("d", 4), ("c", 3), ("b", 2), ("a", 1))
+        await self._build(watermarks, new)
+        # d and c are listed again next run, e isn't
+        self.assertEqual(watermarks.advanced({"c", "d"}), {"r/pics:new": ("t3_b", 2)})
+        # nothing listed after the failure: the old mark stays
+        self.assertEqual(watermarks.advanced({"b"}), {"r/pics:new": ("t3_a", 1)})
+
+    async def test_failure_holds_back_only_its_own_listing(self):
+        watermarks = Watermarks()
+        saved = self._listing(("s2", 9), ("s1", 8))
+        new = self._listing(("n2", 2), ("n1", 1))
+        await self._build(watermarks, new, saved=saved)
+        self.assertEqual(
+            watermarks.advanced({"s2"}),
+            {"saved": ("t3_s1", 8), "r/pics:new": ("t3_n2", 2)},
+        )
+
+    async def test_no_watermarks_under_a_score_floor(self):
+        # a NEW post turned away for its score may pass later, once it has more
+        watermarks = Watermarks({"r/pics:new": ("t3_b", 2)})
+        new = self._listing(("c", 3), ("b", 2), ("a", 1))
+        ids = await self._build(watermarks, new, floors={"score": 0})
+        self.assertEqual(ids, ["c", "b", "a"])
+        self.assertEqual(watermarks.advanced(()), {"r/pics:new": ("t3_b", 2)})
+
+    async def test_saved_stops_only_at_the_watermark(self):
+        # saved in a different order than created
+        saved = self._listing(("old", 1), ("b", 5), ("a", 9))
+        watermarks = Watermarks({"saved": ("t3_a", 9)})
+        ids = await self._build(watermarks, saved=saved)
+        self.assertEqual(Counter(ids), Counter(["old", "b"]))
+        self.assertEqual(watermarks.advanced(())["saved"], ("t3_old", 1))
+
+    async def test_unordered_listing_has_none(self):
+        watermarks = Watermarks({"r/pics:hot": ("t3_b", 2)})
+        new = self._listing(("c", 3), ("b", 2))
+        ids = await self._build(watermarks, new, sortby=SortOption.HOT)
+        self.assertEqual(ids, ["c", "b"])
+        self.assertEqual(watermarks.advanced(()), {"r/pics:hot": ("t3_b", 2)})
+
+
 class TestDefaultSortby(unittest.IsolatedAsyncioTestCase):
 
     async def test_changes_sortby(self):
@@ -142,7 +392,7 @@ class TestLimit(unittest.IsolatedAsyncioTestCase):
 
         async with AsyncClientBundle() as clients:
             with patch.object(clients, "set_reddit", return_value=mock_reddit):
-                builder = StreamBuilder(sortby=fake_sort, limit=5)
+                builder = StreamBuilder(sortby=_sortby(fake_sort), limit=5)
                 builder.add_subreddit("wallpapers")
                 await acollect(await builder.build(clients))
 
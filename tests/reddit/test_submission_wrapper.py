@@ -1,53 +1,131 @@
+import asyncio
+import os
+import tempfile
 import unittest
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import httpx
 
-from src.reddit.submission_wrapper import _get_with_retry
-from tests import SubmissionWrapperFactory
+from src.core import (
+    ByteBudget,
+    CircuitOpenError,
+    HostLimiter,
+    Prefetched,
+    RateLimitedTransport,
+    Retry,
+    RetryBudget,
+    SingleFlight,
+    StallError,
+    UniqueDirectoryFileManager,
+)
+from src.reddit.submission_wrapper import (
+    CHUNK_SIZE,
+    RETRY_ATTEMPTS,
+    RETRY_BACKOFF,
+    SEGMENTS,
+    TIMEOUTS,
+    _get,
+    _TransientError,
+    _Unavailable,
+)
+from tests import StreamingClientMock, StreamResponseMock, SubmissionWrapperFactory
 
 # Note: log() and find_urls() are covered in tests/reddit/test_reddit.py
 
 
-class TestGetWithRetry(unittest.IsolatedAsyncioTestCase):
+async def _identity(response):
+    return response
+
+
+class _BrokenResponse(StreamResponseMock):
+    """A response whose body fails with an unexpected (non-network) error"""
+
+    async def aiter_bytes(self, chunk_size=None):
+        raise ValueError("broken")
+        yield
+
+
+def _client(*outcomes):
+    """A streaming client returning (or raising) each outcome in turn"""
+    outcomes = iter(outcomes)
+
+    def respond(url, **kwargs):
+        outcome = next(outcomes)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    return StreamingClientMock(respond)
+
+
+class TestGet(unittest.IsolatedAsyncioTestCase):
 
     async def test_returns_response_on_success(self):
-        resp = MagicMock(status_code=200)
-        client = AsyncMock()
-        client.get = AsyncMock(return_value=resp)
-        result = await _get_with_retry(client, "u", backoff=0)
-        self.assertIs(result, resp)
-        self.assertEqual(client.get.await_count, 1)
-
-    async def test_does_not_retry_hard_error(self):
-        resp = MagicMock(status_code=404)  # 404 is a hard error, not retryable
-        client = AsyncMock()
-        client.get = AsyncMock(return_value=resp)
-        result = await _get_with_retry(client, "u", attempts=3, backoff=0)
-        self.assertIs(result, resp)
-        self.assertEqual(client.get.await_count, 1)
-
-    async def test_retries_transport_error_then_succeeds(self):
-        ok = MagicMock(status_code=200)
-        client = AsyncMock()
-        client.get = AsyncMock(side_effect=[httpx.ConnectError("x"), ok])
-        result = await _get_with_retry(client, "u", attempts=3, backoff=0)
-        self.assertIs(result, ok)
-        self.assertEqual(client.get.await_count, 2)
-
-    async def test_retries_retryable_status_then_succeeds(self):
-        ok = MagicMock(status_code=200)
-        client = AsyncMock()
-        client.get = AsyncMock(side_effect=[MagicMock(status_code=503), ok])
-        result = await _get_with_retry(client, "u", attempts=3, backoff=0)
-        self.assertIs(result, ok)
-
-    async def test_returns_none_when_transport_errors_exhaust_attempts(self):
-        client = AsyncMock()
-        client.get = AsyncMock(side_effect=httpx.ConnectError("x"))
-        result = await _get_with_retry(client, "u", attempts=2, backoff=0)
-        self.assertIsNone(result)
-        self.assertEqual(client.get.await_count, 2)
+        resp = StreamResponseMock(status_code=200)
+        client = _client(resp)
+        self.assertIs(await _get(client, "u", _identity), resp)
+        self.assertEqual(client.stream.call_count, 1)
+
+    async def test_passes_result_of_handle_through(self):
+        client = _client(StreamResponseMock(status_code=200, content=b"body"))
+
+        async def handle(response):
+            return await response.aread()
+
+        self.assertEqual(await _get(client, "u", handle), b"body")
+
+    async def test_hard_error_is_handled_not_retried(self):
+        resp = StreamResponseMock(status_code=404)  # a hard error, not retryable
+        self.assertIs(await _get(_client(resp), "u", _identity), resp)
+
+    async def test_retryable_status_is_transient(self):
+        client = _client(StreamResponseMock(status_code=503))
+        with self.assertRaises(_TransientError):
+            await _get(client, "u", _identity)
+
+    async def test_transport_error_is_transient(self):
+        with self.assertRaises(_TransientError):
+            await _get(_client(httpx.ConnectError("x")), "u", _identity)
+
+    async def test_transport_error_while_reading_body_is_transient(self):
+        async def handle(response):
+            raise httpx.ReadError("dropped mid-body")
+
+        with self.assertRaises(_TransientError):
+            await _get(_client(StreamResponseMock()), "u", handle)
+
+    async def test_stalled_body_is_transient(self):
+        async def handle(response):
+            raise StallError("trickling")
+
+        with self.assertRaises(_TransientError):
+            await _get(_client(StreamResponseMock()), "u", handle)
+
+    async def test_hedger_sends_the_request(self):
+        resp = StreamResponseMock(status_code=200)
+        client = _client()
+        hedger = MagicMock()
+        hedger.stream.return_value.__aenter__ = AsyncMock(return_value=resp)
+        hedger.stream.return_value.__aexit__ = AsyncMock(return_value=None)
+        self.assertIs(await _get(client, "u", _identity, hedger=hedger), resp)
+        hedger.stream.assert_called_once_with(
+            client, "u", timeout=TIMEOUTS, headers=None
+        )
+        client.stream.assert_not_called()
+
+    async def test_open_circuit_is_unavailable(self):
+        client = _client(CircuitOpenError("down"))
+        with self.assertRaises(_Unavailable):
+            await _get(client, "u", _identity)
+
+    async def test_never_sleeps(self):
+        # backoff is the pipeline's job, so no worker sits idle in here
+        with (
+            patch("asyncio.sleep") as sleep,
+            self.assertRaises(_TransientError),
+        ):
+            await _get(_client(httpx.ConnectError("x")), "u", _identity)
+        sleep.assert_not_called()
 
 
 class TestUnsave(unittest.IsolatedAsyncioTestCase):
@@ -66,35 +144,67 @@ class TestUnsave(unittest.IsolatedAsyncioTestCase):
 
 class TestDownload(unittest.IsolatedAsyncioTestCase):
 
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.file_manager = UniqueDirectoryFileManager(self._tmp.name)
+
+    async def asyncTearDown(self):
+        self._tmp.cleanup()
+
+    @staticmethod
+    def _read(path):
+        with open(path, "rb") as f:
+            return f.read()
+
     async def test_download_empty(self):
-        # Assert that an empty list of urls returns an empty dictionary
+        # Assert that an empty list of urls returns an empty list
         wrapper = SubmissionWrapperFactory()
         self.assertEqual(wrapper.urls, set())
-        mock_client = AsyncMock()
-        self.assertEqual(await wrapper.download(mock_client), [])
+        client = StreamingClientMock(lambda url, **kw: StreamResponseMock())
+        self.assertEqual(await wrapper.download(client, self.file_manager), [])
+        client.stream.assert_not_called()
 
     async def test_download_skips_failed_urls(self):
-        # a url that exhausts retries (None) is dropped; others still download
-        good = MagicMock(status_code=200, content=b"data")
-        good.headers = {"Content-type": "image/jpg"}
+        # without retries, a url that fails at the transport level or isn't a
+        #  200 is dropped; the others still download
+        responses = {
+            "good": StreamResponseMock(
+                headers={"Content-type": "image/jpg"}, content=b"data"
+            ),
+            "missing": StreamResponseMock(status_code=404),
+        }
 
-        def fake(client, url, **kwargs):
-            return good if url == "good" else None
+        def respond(url, **kwargs):
+            if url == "bad":
+                raise httpx.ConnectError("x")
+            return responses[url]
 
         wrapper = SubmissionWrapperFactory()
-        wrapper.urls = ["good", "bad"]
-        with patch(
-            "src.reddit.submission_wrapper._get_with_retry",
-            new_callable=AsyncMock,
-            side_effect=fake,
-        ):
-            result = await wrapper.download(AsyncMock())
+        wrapper.urls = ["good", "missing", "bad"]
+        result = await wrapper.download(StreamingClientMock(respond), self.file_manager)
 
-        self.assertEqual(result, [(b"data", ".jpg")])
+        self.assertEqual([extension for _, extension in result], [".jpg"])
+        self.assertEqual(self._read(result[0][0]), b"data")
 
-    async def test_download_nonempty(self):
-        mock_client = AsyncMock()
+    async def test_download_streams_in_chunks(self):
+        content = bytes(range(256)) * 1000  # several CHUNK_SIZE chunks
+        response = StreamResponseMock(
+            headers={"Content-type": "image/gif"}, content=content
+        )
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["big"]
+        with patch.object(
+            response, "aiter_bytes", wraps=response.aiter_bytes
+        ) as aiter_bytes:
+            [(path, extension)] = await wrapper.download(
+                StreamingClientMock(lambda url, **kw: response), self.file_manager
+            )
+
+        aiter_bytes.assert_called_once_with(CHUNK_SIZE)
+        self.assertEqual(extension, ".gif")
+        self.assertEqual(self._read(path), content)
 
+    async def test_download_nonempty(self):
         urls_extensions = {
             "url1": "jpg",
             "url2": "png",
@@ -102,37 +212,237 @@ class TestDownload(unittest.IsolatedAsyncioTestCase):
             "url4": "webm",
         }
 
-        class MockResponse:
-            def __init__(self, content_mock, file_ext="jpg"):
-                self.status_code = 200
-                self.content = content_mock
-                self.headers = {"Content-type": f"image/{file_ext}"}
-
-        async def mock_response_contents(mock_url, **kwargs):
-            return MockResponse(
-                mock_url + " mock content", file_ext=urls_extensions[mock_url]
+        def respond(url, **kwargs):
+            return StreamResponseMock(
+                headers={"Content-type": f"image/{urls_extensions[url]}"},
+                content=f"{url} mock content".encode(),
             )
 
-        mock_client.get.side_effect = mock_response_contents
-
+        client = StreamingClientMock(respond)
         wrapper = SubmissionWrapperFactory()
         wrapper.subreddit = "mock subreddit"
         wrapper.title = "mock title"
         wrapper.urls = list(urls_extensions.keys())
 
-        contents_extensions = await wrapper.download(mock_client)
-
-        expected = [
-            ("url1 mock content", ".jpg"),
-            ("url2 mock content", ".png"),
-            ("url3 mock content", ".gif"),
-            ("url4 mock content", ".webm"),
-        ]
+        staged = await wrapper.download(client, self.file_manager)
 
         for url in urls_extensions:
-            mock_client.get.assert_any_call(url, timeout=10)
+            client.stream.assert_any_call("GET", url, timeout=TIMEOUTS, headers=None)
+
+        self.assertEqual(
+            [(self._read(path), extension) for path, extension in staged],
+            [
+                (b"url1 mock content", ".jpg"),
+                (b"url2 mock content", ".png"),
+                (b"url3 mock content", ".gif"),
+                (b"url4 mock content", ".webm"),
+            ],
+        )
+
+    async def test_content_length_is_reserved_before_reading(self):
+        self.file_manager.budget = ByteBudget(1000)
+        response = StreamResponseMock(
+            headers={"Content-type": "image/png", "Content-Length": "300"},
+            content=b"x" * 300,
+        )
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["u"]
+        with patch.object(
+            self.file_manager, "reserve", wraps=self.file_manager.reserve
+        ) as reserve:
+            await wrapper.download(
+                StreamingClientMock(lambda url, **kw: response), self.file_manager
+            )
+        reserve.assert_awaited_once_with(300)
+        self.assertEqual(self.file_manager.budget.available, 1000)
 
-        self.assertListEqual(contents_extensions, expected)
+    async def test_album_failure_discards_staged_members(self):
+        def respond(url, **kwargs):
+            if url == "broken":
+                return _BrokenResponse(headers={"Content-type": "image/png"})
+            return StreamResponseMock(headers={"Content-type": "image/png"})
+
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["ok", "broken"]
+        with self.assertRaises(ValueError):
+            await wrapper.download(StreamingClientMock(respond), self.file_manager)
+        self.assertEqual(os.listdir(self.file_manager.staging), [])
+
+    async def test_download_uses_prefetched_body(self):
+        # a body received while resolving urls must not be fetched again
+        prefetched = StreamResponseMock(
+            headers={"Content-type": "image/png"}, content=b"early"
+        )
+        clients = MagicMock()
+        clients.prefetched = {"https://i.redd.it/a.png": Prefetched(prefetched)}
+
+        wrapper = SubmissionWrapperFactory()
+        with patch(
+            "src.reddit.submission_wrapper.parse_find_urls",
+            new_callable=AsyncMock,
+            return_value={"https://i.redd.it/a.png"},
+        ):
+            await wrapper.find_urls(clients)
+        self.assertEqual(clients.prefetched, {})  # claimed by the wrapper
+
+        client = StreamingClientMock(lambda url, **kw: StreamResponseMock())
+        [(path, extension)] = await wrapper.download(client, self.file_manager)
+        self.assertEqual((self._read(path), extension), (b"early", ".png"))
+        client.stream.assert_not_called()
+
+    def _prefetched(self, size):
+        """A wrapper holding a prefetched body of ``size`` bytes, and its bytes"""
+        self.budget = self.file_manager.budget = ByteBudget(1000)
+        self.assertTrue(self.budget.try_acquire(size))
+        response = StreamResponseMock(
+            headers={"Content-type": "image/png", "Content-Length": str(size)},
+            content=b"x" * size,
+        )
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = {"https://i.redd.it/a.png"}
+        wrapper._prefetched = {
+            "https://i.redd.it/a.png": Prefetched(response, self.budget, size)
+        }
+        return wrapper
+
+    async def test_prefetched_body_is_staged_with_the_bytes_it_holds(self):
+        # reserving its size again would wait on the bytes it holds itself
+        wrapper = self._prefetched(600)
+        client = StreamingClientMock(lambda url, **kw: StreamResponseMock())
+        [(path, _)] = await asyncio.wait_for(
+            wrapper.download(client, self.file_manager), 1
+        )
+        self.assertEqual(self._read(path), b"x" * 600)
+        self.assertEqual(self.budget.available, 1000)
+        self.assertEqual(self.budget.parked, 0)
+
+    async def test_prefetched_body_not_downloaded_is_let_go(self):
+        wrapper = self._prefetched(600)
+        wrapper.drop_prefetched()
+        self.assertEqual(self.budget.available, 1000)
+        self.assertEqual(self.budget.parked, 0)
+
+
+class TestDownloadRetry(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.file_manager = UniqueDirectoryFileManager(self._tmp.name)
+
+    async def asyncTearDown(self):
+        self._tmp.cleanup()
+
+    @staticmethod
+    def _flaky(failures):
+        """A client where each url in ``failures`` gets that many 503s first"""
+        failures = dict(failures)
+
+        def respond(url, **kwargs):
+            if failures.get(url, 0) > 0:
+                failures[url] -= 1
+                return StreamResponseMock(status_code=503)
+            return StreamResponseMock(
+                headers={"Content-type": "image/png"}, content=url.encode()
+            )
+
+        return StreamingClientMock(respond)
+
+    async def test_transient_failure_raises_retry_with_backoff(self):
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["a"]
+        client = self._flaky({"a": 2})
+        budget = RetryBudget()
+        with self.assertRaises(Retry) as first:
+            await wrapper.download(client, self.file_manager, budget)
+        with self.assertRaises(Retry) as second:
+            await wrapper.download(client, self.file_manager, budget)
+        self.assertEqual(first.exception.delay, RETRY_BACKOFF)
+        self.assertEqual(second.exception.delay, RETRY_BACKOFF * 2)
+        [(path, _)] = await wrapper.download(client, self.file_manager, budget)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"a")
+
+    async def test_stalled_body_is_retried_and_not_kept(self):
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["a"]
+        client = self._flaky({})
+        # any body at all counts as too slow
+        with (
+            patch("src.reddit.submission_wrapper.MIN_THROUGHPUT", float("inf")),
+            patch("src.reddit.submission_wrapper.THROUGHPUT_WINDOW", 0),
+            self.assertRaises(Retry),
+        ):
+            await wrapper.download(client, self.file_manager, RetryBudget())
+        # it stalled before anything was staged
+        self.assertFalse(os.path.exists(self.file_manager.staging))
+        [(path, _)] = await wrapper.download(client, self.file_manager, RetryBudget())
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"a")
+
+    async def test_only_failed_urls_are_fetched_again(self):
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["a", "b"]
+        client = self._flaky({"b": 1})
+        with self.assertRaises(Retry):
+            await wrapper.download(client, self.file_manager, RetryBudget())
+        client.stream.reset_mock()
+        staged = await wrapper.download(client, self.file_manager, RetryBudget())
+        client.stream.assert_called_once_with(
+            "GET", "b", timeout=TIMEOUTS, headers=None
+        )
+        self.assertEqual(len(staged), 2)
+
+    async def test_gives_up_after_last_attempt(self):
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["a", "b"]
+        client = self._flaky({"b": RETRY_ATTEMPTS})
+        budget = RetryBudget()
+        for _ in range(RETRY_ATTEMPTS - 1):
+            with self.assertRaises(Retry):
+                await wrapper.download(client, self.file_manager, budget)
+        # out of tries: that url is dropped, but only for now
+        staged = await wrapper.download(client, self.file_manager, budget)
+        self.assertEqual(len(staged), 1)
+        self.assertEqual(wrapper.downloaded, {"a"})
+        self.assertEqual(wrapper.unfinished, {"b"})
+
+    async def test_no_retry_once_budget_is_spent(self):
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["a", "b"]
+        budget = RetryBudget(ratio=0, initial=1)
+        # two urls failing need two retries; the budget only has one
+        staged = await wrapper.download(
+            self._flaky({"a": 1, "b": 1}), self.file_manager, budget
+        )
+        self.assertEqual(staged, [])
+        self.assertEqual(wrapper.unfinished, {"a", "b"})
+
+    async def test_failing_host_is_given_up_for_now(self):
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["a"]
+        client = _client(CircuitOpenError("down"))
+        staged = await wrapper.download(client, self.file_manager, RetryBudget())
+        self.assertEqual(staged, [])
+        self.assertEqual(wrapper.unfinished, {"a"})
+
+    async def test_error_after_retry_discards_earlier_members(self):
+        def respond(url, **kwargs):
+            if url == "broken":
+                return _BrokenResponse(headers={"Content-type": "image/png"})
+            return StreamResponseMock(headers={"Content-type": "image/png"})
+
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = ["ok", "flaky"]
+        with self.assertRaises(Retry):
+            await wrapper.download(
+                self._flaky({"flaky": 1}), self.file_manager, RetryBudget()
+            )
+        wrapper.urls = ["ok", "broken"]
+        with self.assertRaises(ValueError):
+            await wrapper.download(
+                StreamingClientMock(respond), self.file_manager, RetryBudget()
+            )
+        self.assertEqual(os.listdir(self.file_manager.staging), [])
 
 
 class TestStr(unittest.TestCase):
@@ -158,3 +468,433 @@ class TestHasUrls(unittest.TestCase):
         wrapped = SubmissionWrapperFactory()
         wrapped.urls = set("example_url")
         self.assertTrue(wrapped.has_urls())
+
+
+class _DroppedResponse(StreamResponseMock):
+    """A response whose connection drops after the first chunk of its body"""
+
+    async def aiter_bytes(self, chunk_size=None):
+        yield self.content
+        raise httpx.ReadError("dropped mid-body")
+
+
+class _Body(httpx.AsyncByteStream):
+    """A body a transport streams, rather than one it has already read"""
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    async def __aiter__(self):
+        for start in range(0, len(self.content), 4096):
+            yield self.content[start : start + 4096]
+
+
+class TestResume(unittest.IsolatedAsyncioTestCase):
+
+    url = "https://i.redd.it/a.jpg"
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.file_manager = UniqueDirectoryFileManager(self._tmp.name)
+        self.wrapper = SubmissionWrapperFactory()
+        self.wrapper.urls = {self.url}
+        self.requests = []
+
+    async def asyncTearDown(self):
+        self._tmp.cleanup()
+
+    def _client(self, *responses):
+        """Answers with each response in turn, noting each request's headers"""
+        responses = iter(responses)
+
+        def respond(url, headers=None, **kwargs):
+            self.requests.append(headers)
+            return next(responses)
+
+        return StreamingClientMock(respond)
+
+    async def _interrupted(self, client):
+        # the first attempt stages part of the body, and is retried later
+        with self.assertRaises(Retry):
+            await self.wrapper.download(client, self.file_manager, RetryBudget())
+
+    def _dropped(self):
+        return _DroppedResponse(
+            headers={"Content-type": "image/jpeg", "ETag": '"v1"'}, content=b"part"
+        )
+
+    async def test_interrupted_body_resumes_with_range(self):
+        rest = StreamResponseMock(
+            status_code=206,
+            headers={"Content-type": "image/jpeg", "Content-Range": "bytes 4-6/7"},
+            content=b"ial",
+        )
+        client = self._client(self._dropped(), rest)
+        await self._interrupted(client)
+        [(path, _)] = await self.wrapper.download(
+            client, self.file_manager, RetryBudget()
+        )
+        self.assertEqual(self.requests[1], {"Range": "bytes=4-", "If-Range": '"v1"'})
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"partial")
+
+    async def test_resumed_body_keeps_its_sniffed_extension(self):
+        # the rest arrives without a Content-Type, and the first bytes were
+        #  sniffed as something other than what the first response claimed
+        png = b"\x89PNG\r\n\x1a\n"
+        dropped = _DroppedResponse(
+            headers={"Content-type": "image/jpeg", "ETag": '"v1"'}, content=png
+        )
+        rest = StreamResponseMock(
+            status_code=206,
+            headers={"Content-Range": "bytes 8-10/11"},
+            content=b"end",
+        )
+        client = self._client(dropped, rest)
+        await self._interrupted(client)
+        [(path, extension)] = await self.wrapper.download(
+            client, self.file_manager, RetryBudget()
+        )
+        self.assertEqual(extension, ".png")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), png + b"end")
+
+    async def test_changed_body_is_fetched_whole(self):
+        # If-Range didn't match, so the server sent all of the new version
+        fresh = StreamResponseMock(
+            headers={"Content-type": "image/jpeg", "ETag": '"v2"'}, content=b"fresh"
+        )
+        client = self._client(self._dropped(), fresh)
+        await self._interrupted(client)
+        [(path, _)] = await self.wrapper.download(
+            client, self.file_manager, RetryBudget()
+        )
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"fresh")
+
+    async def test_unsatisfiable_range_starts_over(self):
+        refused = StreamResponseMock(status_code=416)
+        whole = StreamResponseMock(
+            headers={"Content-type": "image/jpeg"}, content=b"whole"
+        )
+        client = self._client(self._dropped(), refused, whole)
+        await self._interrupted(client)
+        [(path, _)] = await self.wrapper.download(
+            client, self.file_manager, RetryBudget()
+        )
+        self.assertIsNone(self.requests[2])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"whole")
+
+    async def test_weak_etag_falls_back_to_last_modified(self):
+        dropped = _DroppedResponse(
+            headers={
+                "Content-type": "image/jpeg",
+                "ETag": 'W/"v1"',
+                "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+            },
+            content=b"part",
+        )
+        await self._interrupted(self._client(dropped))
+        self.assertEqual(
+            await self.file_manager.partial(self.url),
+            (4, "Wed, 21 Oct 2015 07:28:00 GMT"),
+        )
+
+
+class TestSegmented(unittest.IsolatedAsyncioTestCase):
+
+    url = "https://i.imgur.com/big.mp4"
+    body = bytes(range(100)) * 10
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.file_manager = UniqueDirectoryFileManager(self._tmp.name)
+        self.wrapper = SubmissionWrapperFactory()
+        self.wrapper.urls = {self.url}
+        self.ranges = []
+        patcher = patch("src.reddit.submission_wrapper.SEGMENT_THRESHOLD", 500)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        self._tmp.cleanup()
+
+    def _client(self, body=None, ranged=None, **headers):
+        """
+        Serves ``body`` whole, and any Range of it as a 206; ``ranged`` may
+        override the response to the n-th Range request
+        """
+        body = self.body if body is None else body
+        ranged = dict(ranged or {})
+
+        def respond(url, headers=None, **kwargs):
+            if headers is None:
+                return StreamResponseMock(
+                    headers={
+                        "Content-type": "video/mp4",
+                        "Content-Length": str(len(body)),
+                        "Accept-Ranges": "bytes",
+                        "ETag": '"v1"',
+                        **response_headers,
+                    },
+                    content=body,
+                )
+            spec = headers["Range"].removeprefix("bytes=")
+            start, end = (int(n) for n in spec.split("-"))
+            self.ranges.append((start, end))
+            if (override := ranged.pop(len(self.ranges), None)) is not None:
+                return override(start, end)
+            return StreamResponseMock(
+                status_code=206,
+                headers={"Content-Range": f"bytes {start}-{end}/{len(body)}"},
+                content=body[start : end + 1],
+            )
+
+        response_headers = headers
+        return StreamingClientMock(respond)
+
+    async def _download(self, client):
+        [(path, extension)] = await self.wrapper.download(
+            client, self.file_manager, RetryBudget()
+        )
+        with open(path, "rb") as f:
+            return f.read(), extension
+
+    async def test_large_body_is_fetched_in_segments(self):
+        content, _ = await self._download(self._client())
+        self.assertEqual(content, self.body)
+        self.assertEqual(
+            sorted(self.ranges), [(0, 249), (250, 499), (500, 749), (750, 999)]
+        )
+
+    async def test_original_response_is_closed_before_the_ranges(self):
+        # through a real limiter, one connection per host: if the first
+        #  response kept its slot, the ranges would wait for it forever
+        body = bytes(range(256)) * (CHUNK_SIZE // 64)
+
+        def handler(request):
+            headers = {"Content-type": "video/mp4", "Accept-Ranges": "bytes"}
+            if (spec := request.headers.get("Range")) is None:
+                headers["Content-Length"] = str(len(body))
+                return httpx.Response(200, headers=headers, stream=_Body(body))
+            start, end = (int(n) for n in spec.removeprefix("bytes=").split("-"))
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            return httpx.Response(
+                206, headers=headers, stream=_Body(body[start : end + 1])
+            )
+
+        transport = RateLimitedTransport(
+            HostLimiter(connections=1, max_connections=1),
+            httpx.MockTransport(handler),
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            content, _ = await asyncio.wait_for(self._download(client), timeout=5)
+        self.assertEqual(content, body)
+
+    async def test_small_body_is_fetched_whole(self):
+        content, _ = await self._download(self._client(body=b"small"))
+        self.assertEqual(content, b"small")
+        self.assertEqual(self.ranges, [])
+
+    async def test_not_segmented_without_range_support(self):
+        content, _ = await self._download(self._client(**{"Accept-Ranges": "none"}))
+        self.assertEqual(content, self.body)
+        self.assertEqual(self.ranges, [])
+
+    async def test_failed_segment_is_left_to_the_pipeline(self):
+        def dropped(start, end):
+            return _DroppedResponse(
+                status_code=206,
+                headers={"Content-Range": f"bytes {start}-{end}/1000"},
+                content=self.body[start : start + 100],
+            )
+
+        client = self._client(ranged={1: dropped})
+        # no sleeping in place: the job is handed back to be retried later
+        with patch("asyncio.sleep") as sleep, self.assertRaises(Retry):
+            await self.wrapper.download(client, self.file_manager, RetryBudget())
+        sleep.assert_not_called()
+        # the segments that came in are kept: only the failed one is fetched again
+        self.ranges.clear()
+        content, _ = await self._download(client)
+        self.assertEqual(content, self.body)
+        self.assertEqual(self.ranges, [(0, 249)])
+        self.assertIsNone(await self.file_manager.preallocated(self.url))
+
+    async def test_segments_without_validator_start_over(self):
+        def dropped(start, end):
+            return _DroppedResponse(
+                status_code=206,
+                headers={"Content-Range": f"bytes {start}-{end}/1000"},
+                content=self.body[start : start + 100],
+            )
+
+        client = self._client(ranged={1: dropped}, ETag="")
+        with self.assertRaises(Retry):
+            await self.wrapper.download(client, self.file_manager, RetryBudget())
+        self.assertEqual(os.listdir(self.file_manager.staging), [])
+        self.ranges.clear()
+        content, _ = await self._download(client)
+        self.assertEqual(content, self.body)
+        self.assertEqual(len(self.ranges), SEGMENTS)
+
+    async def test_short_segment_fails_the_download_transiently(self):
+        def short(start, end):
+            return StreamResponseMock(
+                status_code=206,
+                headers={"Content-Range": f"bytes {start}-{end}/1000"},
+                content=self.body[start : start + 10],
+            )
+
+        client = self._client(ranged={1: short})
+        with self.assertRaises(Retry):
+            await self.wrapper.download(client, self.file_manager, RetryBudget())
+
+    async def test_changed_body_fails_the_download_transiently(self):
+        def whole(start, end):
+            return StreamResponseMock(content=b"a different version")
+
+        client = self._client(ranged={1: whole})
+        with self.assertRaises(Retry):
+            await self.wrapper.download(client, self.file_manager, RetryBudget())
+        self.assertEqual(os.listdir(self.file_manager.staging), [])
+
+
+class TestScreening(unittest.IsolatedAsyncioTestCase):
+
+    png = b"\x89PNG\r\n\x1a\n" + bytes(100)
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.file_manager = UniqueDirectoryFileManager(self._tmp.name)
+        self.wrapper = SubmissionWrapperFactory()
+        self.wrapper.urls = {"https://i.redd.it/a.png"}
+        self.chunks_read = 0
+
+    async def asyncTearDown(self):
+        self._tmp.cleanup()
+
+    def _client(self, content, **headers):
+        """Serves ``content`` in 10-byte chunks, counting how many were read"""
+        response = StreamResponseMock(headers=headers, content=content)
+
+        async def aiter_bytes(chunk_size=None):
+            for start in range(0, len(content), 10):
+                self.chunks_read += 1
+                yield content[start : start + 10]
+
+        response.aiter_bytes = aiter_bytes
+        return StreamingClientMock(lambda url, **kwargs: response)
+
+    async def _download(self, client, max_bytes=None):
+        return await self.wrapper.download(
+            client, self.file_manager, RetryBudget(), max_bytes=max_bytes
+        )
+
+    def _staged(self):
+        staging = self.file_manager.staging
+        return os.listdir(staging) if os.path.exists(staging) else []
+
+    async def test_extension_comes_from_the_body(self):
+        client = self._client(self.png, **{"Content-type": "image/jpeg"})
+        [(_, extension)] = await self._download(client)
+        self.assertEqual(extension, ".png")
+
+    async def test_error_page_is_abandoned_after_its_first_chunk(self):
+        page = b"<html><body>Not found</body></html>" * 10
+        client = self._client(page, **{"Content-type": "text/html", "ETag": '"v1"'})
+        self.assertEqual(await self._download(client), [])
+        self.assertEqual(self.chunks_read, 1)
+        self.assertEqual(self._staged(), [])
+        # dropped for good, not retried
+        self.assertEqual(client.stream.call_count, 1)
+
+    async def test_declared_size_over_the_cap_is_never_read(self):
+        client = self._client(
+            self.png,
+            **{"Content-type": "image/png", "Content-Length": str(len(self.png))},
+        )
+        self.assertEqual(await self._download(client, max_bytes=50), [])
+        self.assertEqual(self.chunks_read, 0)
+
+    async def test_undeclared_size_is_abandoned_once_over_the_cap(self):
+        client = self._client(self.png, **{"Content-type": "image/png", "ETag": '"v1"'})
+        self.assertEqual(await self._download(client, max_bytes=50), [])
+        self.assertEqual(self.chunks_read, 6)
+        # not kept for resuming either
+        self.assertIsNone(await self.file_manager.partial("https://i.redd.it/a.png"))
+        self.assertEqual(self._staged(), [])
+
+    async def test_body_within_the_cap_is_kept(self):
+        client = self._client(self.png, **{"Content-type": "image/png"})
+        [(path, _)] = await self._download(client, max_bytes=len(self.png))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.png)
+
+
+class TestCoalescing(unittest.IsolatedAsyncioTestCase):
+
+    url = "https://i.redd.it/a.png"
+
+    async def asyncSetUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.file_manager = UniqueDirectoryFileManager(self._tmp.name)
+        self.flights = SingleFlight()
+
+    async def asyncTearDown(self):
+        self._tmp.cleanup()
+
+    def _wrapper(self):
+        wrapper = SubmissionWrapperFactory()
+        wrapper.urls = {self.url}
+        return wrapper
+
+    def _client(self, *responses):
+        """Answers each GET with the next response, once every GET has started"""
+        responses = iter(responses)
+        answered = asyncio.Event()
+
+        class Response(StreamResponseMock):
+            async def aiter_bytes(self, chunk_size=None):
+                await answered.wait()
+                async for chunk in super().aiter_bytes(chunk_size):
+                    yield chunk
+
+        def respond(url, **kwargs):
+            asyncio.get_running_loop().call_soon(answered.set)
+            status_code, content = next(responses)
+            return Response(
+                status_code, headers={"Content-type": "image/png"}, content=content
+            )
+
+        return StreamingClientMock(respond)
+
+    async def _download_both(self, client, retries=None):
+        return await asyncio.gather(
+            *(
+                self._wrapper().download(
+                    client, self.file_manager, retries, flights=self.flights
+                )
+                for _ in range(2)
+            ),
+            return_exceptions=True,
+        )
+
+    async def test_same_url_is_fetched_once_for_both(self):
+        client = self._client((200, b"\x89PNG\r\n\x1a\n"))
+        first, second = await self._download_both(client)
+        self.assertEqual(client.stream.call_count, 1)
+        self.assertEqual(self.flights.coalesced, 1)
+        # each gets a file of its own to move into place
+        self.assertNotEqual(first[0][0], second[0][0])
+        await self.file_manager.save_files("A", first)
+        await self.file_manager.save_files("B", second)
+        self.assertEqual(os.listdir(self.file_manager.staging), [])
+
+    async def test_shared_failure_is_retried_by_each(self):
+        client = self._client((503, b""))
+        results = await self._download_both(client, RetryBudget())
+        self.assertEqual(client.stream.call_count, 1)
+        for result in results:
+            self.assertIsInstance(result, Retry)
@@ -1,8 +1,11 @@
 import random
 import uuid
-from collections.abc import AsyncIterable, AsyncIterator
+from collections.abc import AsyncIterable, AsyncIterator, Callable
+from contextlib import asynccontextmanager
 from datetime import datetime
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+import httpx
 
 from src.reddit import SubmissionWrapper
 
@@ -58,3 +61,35 @@ def SubmissionWrapperFactory(
         submission = SubmissionMockFactory(*args, **kwargs)
 
     return SubmissionWrapper(submission=submission, client=client, dry=dry)
+
+
+class StreamResponseMock:
+    """A minimal stand-in for a streamed httpx.Response (test helper)"""
+
+    def __init__(self, status_code=200, headers=None, url="", content=b""):
+        self.status_code = status_code
+        self.headers = httpx.Headers(headers or {})
+        self.url = url
+        self.content = content
+        self.aread = AsyncMock(return_value=content)
+        self.aclose = AsyncMock()
+
+    async def aiter_bytes(self, chunk_size=None):
+        step = chunk_size or len(self.content) or 1
+        for start in range(0, len(self.content), step):
+            yield self.content[start : start + step]
+
+
+def StreamingClientMock(respond: Callable[..., StreamResponseMock]) -> MagicMock:
+    """
+    A client whose ``stream(method, url, **kwargs)`` yields ``respond(url, ...)``
+    as an async context manager; ``respond`` may also raise (test helper)
+    """
+
+    @asynccontextmanager
+    async def stream(method, url, **kwargs):
+        yield respond(url, **kwargs)
+
+    client = MagicMock()
+    client.stream = MagicMock(side_effect=stream)
+    return client